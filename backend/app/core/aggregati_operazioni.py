@@ -0,0 +1,72 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+import logging
+
+
+class AggregatiOperazioni:
+    """
+    Statistiche sulle operazioni mantenute in modo incrementale.
+    Vengono ricostruite dal database all'avvio e aggiornate in O(1) a ogni nuova operazione,
+    così i report non devono scorrere l'intero storico a ogni richiesta.
+    """
+    def __init__(self):
+        self.numero_totale_operazioni = 0
+        self.profitto_perdita_realizzato_usd = 0.0
+        self.operazioni_vincenti = 0
+        self.operazioni_perdenti = 0
+        self.operazioni_per_tipo = {}
+        self.controvalore_per_coppia = {}
+        self.controvalore_per_piattaforma = {}
+
+    @classmethod
+    def da_righe_raggruppate(cls, righe: list) -> "AggregatiOperazioni":
+        """
+        Costruisce gli aggregati dalle righe di recupera_aggregati_operazioni_db,
+        raggruppate per tipo, coppia e piattaforma.
+        """
+        aggregati = cls()
+        for riga in righe:
+            numero = riga['numero_operazioni']
+            controvalore = riga['controvalore_usd'] or 0.0
+            aggregati.numero_totale_operazioni += numero
+            aggregati.operazioni_per_tipo[riga['tipo']] = aggregati.operazioni_per_tipo.get(riga['tipo'], 0) + numero
+            aggregati.controvalore_per_coppia[riga['coppia']] = aggregati.controvalore_per_coppia.get(riga['coppia'], 0) + controvalore
+            aggregati.controvalore_per_piattaforma[riga['piattaforma']] = aggregati.controvalore_per_piattaforma.get(riga['piattaforma'], 0) + controvalore
+            if 'vendita' in riga['tipo']:
+                aggregati.profitto_perdita_realizzato_usd += riga['profitto_perdita_usd'] or 0.0
+                aggregati.operazioni_vincenti += riga['vincenti']
+                aggregati.operazioni_perdenti += riga['perdenti']
+        logging.info(f"Aggregati delle operazioni ricostruiti dal database: {aggregati.numero_totale_operazioni} operazioni.")
+        return aggregati
+
+    def registra(self, operazione):
+        """Aggiorna gli aggregati con una nuova operazione."""
+        self.numero_totale_operazioni += 1
+        self.operazioni_per_tipo[operazione.tipo] = self.operazioni_per_tipo.get(operazione.tipo, 0) + 1
+        self.controvalore_per_coppia[operazione.coppia] = self.controvalore_per_coppia.get(operazione.coppia, 0) + operazione.controvalore_usd
+        self.controvalore_per_piattaforma[operazione.piattaforma] = self.controvalore_per_piattaforma.get(operazione.piattaforma, 0) + operazione.controvalore_usd
+        if 'vendita' in operazione.tipo:
+            self.profitto_perdita_realizzato_usd += operazione.profitto_perdita_operazione
+            if operazione.profitto_perdita_operazione > 0:
+                self.operazioni_vincenti += 1
+            elif operazione.profitto_perdita_operazione < 0:
+                self.operazioni_perdenti += 1
+
+    def report_performance(self, budget_usd_iniziale: float) -> dict:
+        percentuale_profitto = (self.profitto_perdita_realizzato_usd / budget_usd_iniziale) * 100 if budget_usd_iniziale > 0 else 0
+        return {
+            "profitto_perdita_totale_usd": self.profitto_perdita_realizzato_usd,
+            "percentuale_profitto": percentuale_profitto,
+            "operazioni_vincenti": self.operazioni_vincenti,
+            "operazioni_perdenti": self.operazioni_perdenti,
+            "numero_totale_operazioni": self.numero_totale_operazioni
+        }
+
+    def analisi_operazioni(self) -> dict:
+        # Copie dei dizionari: il chiamante riceve un'istantanea, non lo stato interno
+        return {
+            "operazioni_per_tipo": dict(self.operazioni_per_tipo),
+            "controvalore_per_coppia": dict(self.controvalore_per_coppia),
+            "controvalore_per_piattaforma": dict(self.controvalore_per_piattaforma),
+        }
@@ -1,4 +1,8 @@
 # Questo file contiene le variabili di stato globali per l'applicazione.
 
-# Lista per tenere traccia delle connessioni ccxt aperte
-open_connections = []
+import weakref
+
+# Insieme delle connessioni ccxt create da inizializza_piattaforma.
+# I riferimenti sono deboli: un client chiuso e non più usato viene liberato dal garbage collector
+# invece di restare in memoria per tutta la vita del processo.
+open_connections = weakref.WeakSet()
@@ -0,0 +1,200 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from .path_manager import DATA_PATH
+
+# Cartella radice dell'archivio colonnare: una sottocartella per ogni serie (exchange/simbolo/timeframe)
+PERCORSO_ARCHIVIO_OHLCV = DATA_PATH / "ohlcv"
+
+# Colonne di ogni serie con il relativo tipo NumPy (little endian, indipendente dalla piattaforma)
+COLONNE_OHLCV = (
+    ("timestamp", "<i8"),  # epoch in secondi, come nella tabella candele
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+)
+CAPACITA_INIZIALE = 1024
+FILE_INDICE = "indice.json"
+
+# Valori ammessi per archivio_ohlcv.motore in config.json
+MOTORI_ARCHIVIO = ("sqlite", "colonnare", "entrambi")
+MOTORE_PREDEFINITO = "entrambi"
+
+
+def motore_archivio_ohlcv(config: dict) -> str:
+    """Restituisce il motore di archiviazione OHLCV configurato ('sqlite', 'colonnare' o 'entrambi')."""
+    motore = (config.get('archivio_ohlcv') or {}).get('motore', MOTORE_PREDEFINITO)
+    if motore not in MOTORI_ARCHIVIO:
+        logging.warning(f"Motore archivio OHLCV '{motore}' non valido. Uso '{MOTORE_PREDEFINITO}'.")
+        return MOTORE_PREDEFINITO
+    return motore
+
+
+class SerieColonnare:
+    """
+    Una serie OHLCV salvata come un file per colonna, mappato in memoria con NumPy.
+    I file hanno una capacità preallocata; il file indice.json registra il numero di righe valide
+    ed è l'ultimo a essere aggiornato, quindi un'interruzione a metà scrittura non espone righe parziali.
+    Quando la capacità si esaurisce i dati vengono copiati in una nuova generazione di file:
+    le viste restituite in precedenza restano valide perché i vecchi file non vengono troncati.
+    """
+    def __init__(self, cartella: Path):
+        self.cartella = cartella
+        self.cartella.mkdir(parents=True, exist_ok=True)
+        self.righe = 0
+        self.capacita = 0
+        self.generazione = 0
+        self._mappe = {}
+        percorso_indice = self.cartella / FILE_INDICE
+        if percorso_indice.exists():
+            with open(percorso_indice, 'r', encoding='utf-8') as f:
+                indice = json.load(f)
+            self.righe, self.capacita, self.generazione = indice['righe'], indice['capacita'], indice['generazione']
+            self._apri_mappe()
+        else:
+            self._nuova_generazione(CAPACITA_INIZIALE)
+        self._rimuovi_generazioni_obsolete()
+
+    def _file_colonna(self, colonna: str, generazione: int) -> Path:
+        return self.cartella / f"{colonna}.{generazione}.bin"
+
+    def _apri_mappe(self):
+        self._mappe = {
+            colonna: np.memmap(self._file_colonna(colonna, self.generazione), dtype=tipo, mode='r+', shape=(self.capacita,))
+            for colonna, tipo in COLONNE_OHLCV
+        }
+
+    def _nuova_generazione(self, capacita: int):
+        generazione = self.generazione + 1
+        for colonna, tipo in COLONNE_OHLCV:
+            nuova = np.memmap(self._file_colonna(colonna, generazione), dtype=tipo, mode='w+', shape=(capacita,))
+            if self.righe:
+                nuova[:self.righe] = self._mappe[colonna][:self.righe]
+            nuova.flush()
+            del nuova
+        generazione_precedente = self.generazione
+        self.generazione, self.capacita = generazione, capacita
+        self._apri_mappe()
+        self._salva_indice()
+        if generazione_precedente:
+            self._rimuovi_generazioni_obsolete()
+
+    def _rimuovi_generazioni_obsolete(self):
+        for percorso in self.cartella.glob("*.bin"):
+            if not percorso.name.endswith(f".{self.generazione}.bin"):
+                try:
+                    percorso.unlink()
+                except OSError:
+                    # Su Windows il file resta bloccato finché una vista lo mappa: verrà rimosso alla prossima apertura
+                    pass
+
+    def _salva_indice(self):
+        percorso_tmp = self.cartella / (FILE_INDICE + ".tmp")
+        with open(percorso_tmp, 'w', encoding='utf-8') as f:
+            json.dump({"righe": self.righe, "capacita": self.capacita, "generazione": self.generazione}, f)
+        os.replace(percorso_tmp, self.cartella / FILE_INDICE)
+
+    def ultimo_timestamp(self) -> Optional[int]:
+        return int(self._mappe['timestamp'][self.righe - 1]) if self.righe else None
+
+    def aggiungi(self, candele: list) -> int:
+        """
+        Aggiunge in coda le candele [timestamp, open, high, low, close, volume] più recenti dell'ultima salvata.
+        Una candela con lo stesso timestamp dell'ultima la sovrascrive (candela ancora aperta);
+        quelle più vecchie vengono ignorate perché l'archivio è append-only.
+        Restituisce il numero di righe nuove.
+        """
+        ultimo = self.ultimo_timestamp()
+        da_scrivere = []
+        for candela in sorted(candele, key=lambda c: c[0]):
+            if ultimo is None or candela[0] > ultimo:
+                da_scrivere.append(candela)
+                ultimo = candela[0]
+            elif candela[0] == ultimo:
+                if da_scrivere:
+                    da_scrivere[-1] = candela
+                else:
+                    for indice, (colonna, _) in enumerate(COLONNE_OHLCV):
+                        self._mappe[colonna][self.righe - 1] = candela[indice]
+        if self.righe + len(da_scrivere) > self.capacita:
+            nuova_capacita = self.capacita
+            while self.righe + len(da_scrivere) > nuova_capacita:
+                nuova_capacita *= 2
+            self._nuova_generazione(nuova_capacita)
+        if da_scrivere:
+            blocco = np.asarray(da_scrivere, dtype=np.float64)
+            fine = self.righe + len(da_scrivere)
+            for indice, (colonna, _) in enumerate(COLONNE_OHLCV):
+                self._mappe[colonna][self.righe:fine] = blocco[:, indice]
+        for mappa in self._mappe.values():
+            mappa.flush()
+        if da_scrivere:
+            self.righe += len(da_scrivere)
+            self._salva_indice()
+        return len(da_scrivere)
+
+    def leggi(self, limit: Optional[int] = None) -> dict:
+        """
+        Restituisce le ultime `limit` righe come array NumPy copiati dai file mappati: una singola copia
+        contigua per colonna. Non si restituiscono viste perché aggiungi() riscrive sul posto l'ultima
+        candela (ancora aperta) e i dati cambierebbero sotto chi sta ancora leggendo gli array.
+        """
+        inizio = 0 if limit is None else max(self.righe - limit, 0)
+        return {colonna: np.array(self._mappe[colonna][inizio:self.righe]) for colonna, _ in COLONNE_OHLCV}
+
+
+class ArchivioColonnareOHLCV:
+    """Raccolta delle serie colonnari, aperte al primo accesso e condivise tra i thread."""
+    def __init__(self, percorso_base: Path = PERCORSO_ARCHIVIO_OHLCV):
+        self.percorso_base = Path(percorso_base)
+        self._serie = {}
+        self._lock = threading.Lock()
+
+    def _cartella_serie(self, exchange: str, symbol: str, timeframe: str) -> Path:
+        # I simboli contengono '/' (e ':' per i derivati): vanno resi sicuri come nomi di cartella
+        pulisci = lambda valore: re.sub(r'[^A-Za-z0-9._-]', '_', valore)
+        return self.percorso_base / pulisci(exchange) / pulisci(symbol) / pulisci(timeframe)
+
+    def _apri_serie(self, exchange: str, symbol: str, timeframe: str, crea: bool) -> Optional[SerieColonnare]:
+        chiave = (exchange, symbol, timeframe)
+        serie = self._serie.get(chiave)
+        if serie is None:
+            cartella = self._cartella_serie(exchange, symbol, timeframe)
+            if not crea and not (cartella / FILE_INDICE).exists():
+                return None
+            serie = SerieColonnare(cartella)
+            self._serie[chiave] = serie
+        return serie
+
+    def aggiungi_candele(self, exchange: str, symbol: str, timeframe: str, candele: list) -> int:
+        """Aggiunge le candele [timestamp in secondi, open, high, low, close, volume] alla serie."""
+        if not candele:
+            return 0
+        with self._lock:
+            return self._apri_serie(exchange, symbol, timeframe, crea=True).aggiungi(candele)
+
+    def leggi_serie(self, exchange: str, symbol: str, timeframe: str, limit: Optional[int] = None) -> dict:
+        """Restituisce un dizionario colonna -> array NumPy con le ultime `limit` candele (vuoto se la serie non esiste)."""
+        with self._lock:
+            serie = self._apri_serie(exchange, symbol, timeframe, crea=False)
+            return serie.leggi(limit) if serie is not None else {}
+
+    def ultimo_timestamp(self, exchange: str, symbol: str, timeframe: str) -> Optional[int]:
+        with self._lock:
+            serie = self._apri_serie(exchange, symbol, timeframe, crea=False)
+            return serie.ultimo_timestamp() if serie is not None else None
+
+
+archivio_ohlcv = ArchivioColonnareOHLCV()
@@ -6,91 +6,26 @@ import pandas as pd
 import random
 import asyncio
 import logging
-from ..servizi.gestore_piattaforme import inizializza_piattaforma
+import time
+from datetime import datetime, timezone
+from ..servizi.instance_manager import get_platform_instance
+from ..servizi.scheduler_richieste import esegui_con_priorita, PRIORITA_SCANSIONE
 from .gestore_configurazione import carica_configurazione
-from .prezzi_cache import get_prezzo_cache
-from .database import get_blacklisted_pairs_set
+from .prezzi_cache import get_prezzo_cache, CACHE_VALIDITY_SECONDS
+from .segnali_cache import segnale_condiviso
+from . import database_async as db_async
+from .indicatori_incrementali import indicatori_incrementali
+from .esecutore_analisi import esegui_analisi
+# Le funzioni di calcolo pure vivono in indicatori_tecnici (eseguibili in un processo separato):
+# restano importabili da qui per compatibilità
+from .indicatori_tecnici import (
+    calcola_sma, calcola_rsi, calcola_macd, calcola_bollinger_bands, calcola_adx, calcola_momentum_pannello,
+    calcola_sma_array, calcola_rsi_array, calcola_macd_array, calcola_bollinger_bands_array, calcola_adx_array,
+    riconosci_pattern_grafico, prevedi_movimento_futuro, calcola_indicatori_timeframe, analizza_pannello_asset,
+    CANDELE_FINESTRA_INDICATORI, firma_parametri_indicatori,
+)
 
 
-# --- Funzioni di Analisi Tecnica ---
-
-def calcola_sma(dati: pd.DataFrame, periodo: int = 20) -> pd.Series:
-    """
-    Calcola la Media Mobile Semplice (SMA).
-    """
-    return dati['close'].rolling(window=periodo).mean()
-
-def calcola_rsi(dati: pd.DataFrame, periodo: int = 14) -> pd.Series:
-    """
-    Calcola l'Indice di Forza Relativa (RSI).
-    """
-    delta = dati['close'].diff()
-    guadagno = (delta.where(delta > 0, 0)).rolling(window=periodo).mean()
-    perdita = (-delta.where(delta < 0, 0)).rolling(window=periodo).mean()
-    
-    rs = guadagno / perdita
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
-
-def calcola_macd(dati: pd.DataFrame, periodo_veloce: int = 12, periodo_lento: int = 26, periodo_segnale: int = 9):
-    """
-    Calcola il Moving Average Convergence Divergence (MACD).
-    """
-    ema_veloce = dati['close'].ewm(span=periodo_veloce, adjust=False).mean()
-    ema_lenta = dati['close'].ewm(span=periodo_lento, adjust=False).mean()
-    macd_line = ema_veloce - ema_lenta
-    signal_line = macd_line.ewm(span=periodo_segnale, adjust=False).mean()
-    histogram = macd_line - signal_line
-    return macd_line, signal_line, histogram
-
-def calcola_bollinger_bands(dati: pd.DataFrame, periodo: int = 20, deviazioni_std: int = 2):
-    """
-    Calcola le Bande di Bollinger.
-    """
-    sma = dati['close'].rolling(window=periodo).mean()
-    std = dati['close'].rolling(window=periodo).std()
-    upper_band = sma + (std * deviazioni_std)
-    lower_band = sma - (std * deviazioni_std)
-    return upper_band, sma, lower_band
-
-def calcola_adx(dati: pd.DataFrame, periodo: int = 14):
-    """
-    Calcola l'Average Directional Index (ADX).
-    """
-    # True Range (TR)
-    tr1 = dati['high'] - dati['low']
-    tr2 = abs(dati['high'] - dati['close'].shift(1))
-    tr3 = abs(dati['low'] - dati['close'].shift(1))
-    tr = pd.DataFrame({'tr1': tr1, 'tr2': tr2, 'tr3': tr3}).max(axis=1)
-
-    # Directional Movement (DM)
-    plus_dm = dati['high'].diff()
-    minus_dm = dati['low'].diff() * -1
-
-    plus_dm[plus_dm < 0] = 0
-    minus_dm[minus_dm < 0] = 0
-
-    # Correzione per quando il low corrente è maggiore del low precedente
-    # e l'high corrente è minore dell'high precedente
-    idx = (plus_dm > minus_dm)
-    plus_dm[~idx] = 0
-    minus_dm[idx] = 0
-
-    # Average True Range (ATR)
-    atr = tr.ewm(span=periodo, adjust=False).mean()
-
-    # Smoothed Directional Movement
-    plus_di = (plus_dm.ewm(span=periodo, adjust=False).mean() / atr) * 100
-    minus_di = (minus_dm.ewm(span=periodo, adjust=False).mean() / atr) * 100
-
-    # DX
-    dx = (abs(plus_di - minus_di) / (plus_di + minus_di)) * 100
-
-    # ADX
-    adx = dx.ewm(span=periodo, adjust=False).mean()
-
-    return adx, plus_di, minus_di
-
 # --- Funzione di Simulazione Decisione RL ---
 def simula_decisione_rl() -> dict:
     """
@@ -110,65 +45,6 @@ def simula_decisione_rl() -> dict:
         "motivazione_rl": motivazioni[decisione_scelta]
     }
 
-# --- Funzione di Riconoscimento Pattern Grafici Semplificata ---
-def riconosci_pattern_grafico(df: pd.DataFrame) -> dict:
-    """
-    Riconosce pattern grafici semplici basati sulle ultime candele.
-    Questa è una simulazione/placeholder per un'analisi più complessa.
-    """
-    if len(df) < 2: # Necessita di almeno 2 candele per alcuni pattern
-        return {"pattern": "NESSUN_PATTERN", "motivazione_pattern": "Dati insufficienti per il riconoscimento pattern."}
-
-    ultima_candela = df.iloc[-1]
-    penultima_candela = df.iloc[-2]
-
-    # Doji: Open e Close sono molto vicini
-    if abs(ultima_candela['open'] - ultima_candela['close']) < (ultima_candela['high'] - ultima_candela['low']) * 0.1:
-        return {"pattern": "DOJI", "motivazione_pattern": "Pattern Doji: indica indecisione del mercato."}
-
-    # Hammer / Hanging Man (corpo piccolo, ombra inferiore lunga)
-    body_size = abs(ultima_candela['open'] - ultima_candela['close'])
-    lower_wick = min(ultima_candela['open'], ultima_candela['close']) - ultima_candela['low']
-    upper_wick = ultima_candela['high'] - max(ultima_candela['open'], ultima_candela['close'])
-
-    if body_size < (ultima_candela['high'] - ultima_candela['low']) * 0.3 and lower_wick > 2 * body_size and upper_wick < body_size:
-        if ultima_candela['close'] > ultima_candela['open']: # Bullish Hammer
-            return {"pattern": "HAMMER_RIALZISTA", "motivazione_pattern": "Pattern Hammer Rialzista: potenziale inversione rialzista."}
-        else: # Bearish Hanging Man
-            return {"pattern": "HANGING_MAN_RIBASSISTA", "motivazione_pattern": "Pattern Hanging Man Ribassista: potenziale inversione ribassista."}
-
-    # Bullish Engulfing: Corpo verde che ingloba completamente il corpo rosso precedente
-    if (ultima_candela['close'] > ultima_candela['open'] and penultima_candela['close'] < penultima_candela['open'] and
-        ultima_candela['close'] > penultima_candela['open'] and ultima_candela['open'] < penultima_candela['close']):
-        return {"pattern": "ENGULFING_RIALZISTA", "motivazione_pattern": "Pattern Engulfing Rialzista: forte segnale di inversione rialzista."}
-
-    # Bearish Engulfing: Corpo rosso che ingloba completamente il corpo verde precedente
-    if (ultima_candela['close'] < ultima_candela['open'] and penultima_candela['close'] > penultima_candela['open'] and
-        ultima_candela['close'] < penultima_candela['open'] and ultima_candela['open'] > penultima_candela['close']):
-        return {"pattern": "ENGULFING_RIBASSISTA", "motivazione_pattern": "Pattern Engulfing Ribassista: forte segnale di inversione ribassista."}
-
-    return {"pattern": "NESSUN_PATTERN", "motivazione_pattern": "Nessun pattern grafico riconoscibile."}
-
-# --- Funzione di Previsione Serie Temporali Semplificata ---
-def prevedi_movimento_futuro(df: pd.DataFrame) -> dict:
-    """
-    Prevede il movimento futuro del prezzo basandosi su una logica semplificata.
-    Questa è una simulazione/placeholder per un modello ML più complesso (es. LSTM/ARIMA).
-    """
-    if len(df) < 5: # Necessita di almeno 5 candele per una tendenza minima
-        return {"previsione": "INCERTO", "motivazione_previsione": "Dati insufficienti per la previsione."}
-
-    # Calcola la media degli ultimi 3 prezzi di chiusura e la confronta con la media dei 3 precedenti
-    ultimi_3_prezzi = df['close'].iloc[-3:].mean()
-    precedenti_3_prezzi = df['close'].iloc[-6:-3].mean()
-
-    if ultimi_3_prezzi > precedenti_3_prezzi * 1.005: # Aumento significativo (0.5%)
-        return {"previsione": "UP", "motivazione_previsione": "Prezzo in aumento nelle ultime candele."}
-    elif ultimi_3_prezzi < precedenti_3_prezzi * 0.995: # Diminuzione significativa (0.5%)
-        return {"previsione": "DOWN", "motivazione_previsione": "Prezzo in diminuzione nelle ultime candele."}
-    else:
-        return {"previsione": "SIDEWAYS", "motivazione_previsione": "Prezzo relativamente stabile nelle ultime candele."}
-
 # --- Funzione di Simulazione Sentiment ---
 def simula_sentiment(coppia: str) -> dict:
     """
@@ -217,121 +93,247 @@ async def analizza_mercato_e_genera_segnale(piattaforma: ccxt.Exchange, coppia:
             else:
                 logging.warning("Configurazione Multi-Timeframe non valida (timeframes e pesi non corrispondono). Eseguo analisi su singolo timeframe.")
 
-        tasks = [analizza_singolo_timeframe(piattaforma, coppia, tf) for tf in timeframes_da_analizzare]
-        risultati_timeframe = await asyncio.gather(*tasks)
-
-        # --- Logica di gestione fallimenti e riponderazione ---
-        risultati_validi = []
-        pesi_validi = []
-        dettagli_analisi_combinati = {}
-
-        for i, risultato in enumerate(risultati_timeframe):
-            if risultato and risultato['punteggio_acquisto'] is not None:
-                risultati_validi.append(risultato)
-                pesi_validi.append(pesi_config[i])
-                dettagli_analisi_combinati[timeframes_da_analizzare[i]] = risultato['dettagli_analisi']
+        if not (config.get('cache_segnali') or {}).get('attiva', True):
+            return await _calcola_segnale_di_mercato(piattaforma, coppia, timeframes_da_analizzare, pesi_config, config)
+        # Ciclo di trading, dashboard ed endpoint condividono gli indicatori delle candele chiuse fino alla chiusura
+        # della prossima candela; il segnale viene ricomposto a ogni richiesta con il prezzo attuale
+        return await segnale_condiviso(
+            piattaforma, coppia, timeframes_da_analizzare, pesi_config, config['parametri_indicatori'],
+            lambda: _calcola_indicatori_candele_chiuse(piattaforma, coppia, timeframes_da_analizzare, config),
+            lambda base: _componi_segnale_al_prezzo_attuale(base, piattaforma, coppia, timeframes_da_analizzare, pesi_config, config)
+        )
 
-        if not risultati_validi:
-            return {"segnale": "ATTESA", "motivazione": "Nessun dato valido ricevuto dai timeframe analizzati.", "dati_reali": False}
-
-        punteggio_acquisto_pesato = 0.0
-        punteggio_vendita_pesato = 0.0
-        somma_pesi_validi = sum(pesi_validi)
-
-        for i, risultato in enumerate(risultati_validi):
-            punteggio_acquisto_pesato += risultato['punteggio_acquisto'] * pesi_validi[i]
-            punteggio_vendita_pesato += risultato['punteggio_vendita'] * pesi_validi[i]
-
-        if somma_pesi_validi > 0:
-            punteggio_acquisto_pesato /= somma_pesi_validi
-            punteggio_vendita_pesato /= somma_pesi_validi
-        # --- Fine Logica di Riponderazione ---
-
-        risultato_principale = risultati_validi[0]
-        ultimo_prezzo = risultato_principale['ultimo_prezzo']
-
-        segnale = "MANTIENI"
-        if punteggio_acquisto_pesato > punteggio_vendita_pesato + 0.5: # Soglia di robustezza
-            segnale = "COMPRA"
-        elif punteggio_vendita_pesato > punteggio_acquisto_pesato + 0.5:
-            segnale = "VENDI"
+    except Exception as e:
+        logging.error(f"ERRORE CRITICO in analizza_mercato_e_genera_segnale: {e}", exc_info=True)
+        raise e
 
-        motivazione = f"Punteggio Pesato Normalizzato - Acquisto: {punteggio_acquisto_pesato:.2f} vs Vendita: {punteggio_vendita_pesato:.2f} (su pesi totali {somma_pesi_validi:.2f})"
+async def _calcola_segnale_di_mercato(piattaforma, coppia: str, timeframes_da_analizzare: list, pesi_config: list, config: dict) -> dict:
+    """
+    Segnale senza cache: indicatori delle candele chiuse di ogni timeframe, combinati al prezzo attuale.
+    È lo stesso calcolo del percorso in cache, così attivarla o disattivarla non cambia il segnale.
+    """
+    base = await _calcola_indicatori_candele_chiuse(piattaforma, coppia, timeframes_da_analizzare, config)
+    return await _componi_segnale_al_prezzo_attuale(base, piattaforma, coppia, timeframes_da_analizzare, pesi_config, config)
 
-        stop_loss_price = None
-        if segnale == "COMPRA":
-            stop_loss_percentuale = config.get('parametri_ia', {}).get('stop_loss_percentuale')
-            if stop_loss_percentuale is not None:
-                stop_loss_price = ultimo_prezzo * (1 - stop_loss_percentuale / 100)
+async def _calcola_indicatori_candele_chiuse(piattaforma, coppia: str, timeframes_da_analizzare: list, config: dict) -> dict:
+    """
+    Parte del segnale che non cambia fino alla prossima chiusura (condivisa dalla cache): gli indicatori delle candele chiuse di ogni timeframe,
+    l'inizio dell'ultima candela chiusa usata e la chiusura della prima candela ancora in corso ('scadenza').
+    """
+    tasks = [indicatori_candele_chiuse(piattaforma, coppia, tf, config) for tf in timeframes_da_analizzare]
+    risultati_timeframe = list(await asyncio.gather(*tasks, return_exceptions=True))
+    parziale = False
+    for i, risultato in enumerate(risultati_timeframe):
+        if isinstance(risultato, ccxt.ExchangeError):
+            # Rilancia l'eccezione specifica dell'exchange per essere gestita dal chiamante (es. per la blacklist)
+            raise risultato
+        if isinstance(risultato, Exception):
+            # Errore transitorio (es. rete o timeout): il segnale viene calcolato senza questo timeframe ma non va in cache
+            logging.info(f"Timeframe {timeframes_da_analizzare[i]} su {coppia} non disponibile. Salto. Dettagli: {risultato}")
+            risultati_timeframe[i] = None
+            parziale = True
+    validi = [risultato for risultato in risultati_timeframe if risultato]
+    return {
+        'dettagli_analisi': [risultato['dettagli_analisi'] if risultato else None for risultato in risultati_timeframe],
+        'candele_chiuse': tuple(risultato['ultima_chiusa'] if risultato else None for risultato in risultati_timeframe),
+        'scadenza': min(risultato['scadenza'] for risultato in validi) if validi and not parziale else None,
+        'ultimo_prezzo': validi[0]['ultimo_prezzo'] if validi else None,
+    }
 
-        logging.debug(f"Dettagli analisi combinati: {dettagli_analisi_combinati}")
-        return {
-            "coppia": coppia,
-            "segnale": segnale,
-            "ultimo_prezzo": float(ultimo_prezzo),
-            "stop_loss_price": float(stop_loss_price) if stop_loss_price is not None else None,
-            "punteggio_acquisto": punteggio_acquisto_pesato,
-            "punteggio_vendita": punteggio_vendita_pesato,
-            "dettagli_analisi": dettagli_analisi_combinati,
-            "motivazione": motivazione,
-            "dati_reali": True
-        }
+async def _componi_segnale_al_prezzo_attuale(base: dict, piattaforma, coppia: str, timeframes_da_analizzare: list, pesi_config: list, config: dict) -> dict:
+    """Valuta gli indicatori delle candele chiuse al prezzo attuale e combina i punteggi dei timeframe nel segnale."""
+    ultimo_prezzo = None
+    if any(base['dettagli_analisi']):
+        try:
+            ultimo_prezzo = await _prezzo_attuale(piattaforma, coppia)
+        except Exception as e:
+            logging.warning(f"Prezzo attuale di {coppia} non disponibile ({e}): uso l'ultima chiusura scaricata.")
+        if ultimo_prezzo is None:
+            ultimo_prezzo = base['ultimo_prezzo']
+
+    risultati_timeframe = []
+    for dettagli_analisi in base['dettagli_analisi']:
+        if dettagli_analisi is None:
+            risultati_timeframe.append(None)
+            continue
+        punteggio_acquisto, punteggio_vendita = _punteggi_timeframe(dettagli_analisi, ultimo_prezzo)
+        risultati_timeframe.append({
+            "ultimo_prezzo": ultimo_prezzo,
+            "punteggio_acquisto": punteggio_acquisto,
+            "punteggio_vendita": punteggio_vendita,
+            "dettagli_analisi": dettagli_analisi,
+        })
+    return _combina_segnale(coppia, timeframes_da_analizzare, pesi_config, risultati_timeframe, ultimo_prezzo, config)
+
+async def _prezzo_attuale(piattaforma, coppia: str):
+    """Prezzo della coppia dalla cache prezzi se recente, altrimenti dal ticker dell'exchange."""
+    simbolo, quote_currency = coppia.split('/')[0], coppia.split('/')[1].split(':')[0]
+    prezzo = get_prezzo_cache(simbolo, quote_currency, piattaforma.id, eta_massima=CACHE_VALIDITY_SECONDS)
+    if prezzo is None:
+        ticker = await piattaforma.fetch_ticker(coppia)
+        prezzo = ticker.get('last')
+    return float(prezzo) if prezzo is not None else None
+
+def _combina_segnale(coppia: str, timeframes_da_analizzare: list, pesi_config: list, risultati_timeframe: list, ultimo_prezzo, config: dict) -> dict:
+    """Combina i punteggi dei timeframe validi, pesati, in un segnale di trading al prezzo indicato."""
+    # --- Logica di gestione fallimenti e riponderazione ---
+    risultati_validi = []
+    pesi_validi = []
+    dettagli_analisi_combinati = {}
+
+    for i, risultato in enumerate(risultati_timeframe):
+        if risultato and risultato['punteggio_acquisto'] is not None:
+            risultati_validi.append(risultato)
+            pesi_validi.append(pesi_config[i])
+            dettagli_analisi_combinati[timeframes_da_analizzare[i]] = risultato['dettagli_analisi']
+
+    if not risultati_validi:
+        return {"segnale": "ATTESA", "motivazione": "Nessun dato valido ricevuto dai timeframe analizzati.", "dati_reali": False}
+
+    punteggio_acquisto_pesato = 0.0
+    punteggio_vendita_pesato = 0.0
+    somma_pesi_validi = sum(pesi_validi)
+
+    for i, risultato in enumerate(risultati_validi):
+        punteggio_acquisto_pesato += risultato['punteggio_acquisto'] * pesi_validi[i]
+        punteggio_vendita_pesato += risultato['punteggio_vendita'] * pesi_validi[i]
+
+    if somma_pesi_validi > 0:
+        punteggio_acquisto_pesato /= somma_pesi_validi
+        punteggio_vendita_pesato /= somma_pesi_validi
+    # --- Fine Logica di Riponderazione ---
+
+    segnale = "MANTIENI"
+    if punteggio_acquisto_pesato > punteggio_vendita_pesato + 0.5: # Soglia di robustezza
+        segnale = "COMPRA"
+    elif punteggio_vendita_pesato > punteggio_acquisto_pesato + 0.5:
+        segnale = "VENDI"
+
+    motivazione = f"Punteggio Pesato Normalizzato - Acquisto: {punteggio_acquisto_pesato:.2f} vs Vendita: {punteggio_vendita_pesato:.2f} (su pesi totali {somma_pesi_validi:.2f})"
+
+    stop_loss_price = None
+    if segnale == "COMPRA":
+        stop_loss_percentuale = config.get('parametri_ia', {}).get('stop_loss_percentuale')
+        if stop_loss_percentuale is not None:
+            stop_loss_price = ultimo_prezzo * (1 - stop_loss_percentuale / 100)
+
+    logging.debug(f"Dettagli analisi combinati: {dettagli_analisi_combinati}")
+    return {
+        "coppia": coppia,
+        "segnale": segnale,
+        "ultimo_prezzo": float(ultimo_prezzo),
+        "stop_loss_price": float(stop_loss_price) if stop_loss_price is not None else None,
+        "punteggio_acquisto": punteggio_acquisto_pesato,
+        "punteggio_vendita": punteggio_vendita_pesato,
+        "dettagli_analisi": dettagli_analisi_combinati,
+        "motivazione": motivazione,
+        "dati_reali": True
+    }
 
-    except Exception as e:
-        logging.error(f"ERRORE CRITICO in analizza_mercato_e_genera_segnale: {e}", exc_info=True)
-        raise e
+def _fine_candela(piattaforma, timeframe: str, inizio: float) -> float:
+    """Fine (epoch in secondi) della candela che inizia a `inizio`: le candele mensili durano quanto il loro mese."""
+    if timeframe.endswith('M'):
+        data = datetime.fromtimestamp(inizio, tz=timezone.utc)
+        mesi = data.month - 1 + int(timeframe[:-1])
+        return data.replace(year=data.year + mesi // 12, month=mesi % 12 + 1).timestamp()
+    return inizio + piattaforma.parse_timeframe(timeframe)
+
+def _dettagli_da_indicatori(valori: dict):
+    """Estrae gli indicatori usati per i punteggi; None se qualcuno non è calcolabile."""
+    dettagli_analisi = {
+        "rsi_14": valori["rsi"],
+        "sma_20": valori["sma"],
+        "macd_line": valori["macd_line"],
+        "signal_line": valori["signal_line"],
+    }
+    if any(pd.isna(v) for v in dettagli_analisi.values()):
+        return None
+    return {k: float(v) for k, v in dettagli_analisi.items()}
+
+def _punteggi_timeframe(dettagli_analisi: dict, ultimo_prezzo: float) -> tuple:
+    """Punteggi di acquisto e vendita di un timeframe: solo il confronto con la SMA dipende dal prezzo."""
+    punteggio_acquisto = 0
+    punteggio_vendita = 0
+    if dettagli_analisi["sma_20"] and ultimo_prezzo > dettagli_analisi["sma_20"]: punteggio_acquisto += 1
+    if dettagli_analisi["sma_20"] and ultimo_prezzo < dettagli_analisi["sma_20"]: punteggio_vendita += 1
+    if dettagli_analisi["rsi_14"] and dettagli_analisi["rsi_14"] < 30: punteggio_acquisto += 1
+    if dettagli_analisi["rsi_14"] and dettagli_analisi["rsi_14"] > 70: punteggio_vendita += 1
+    if dettagli_analisi["macd_line"] and dettagli_analisi["signal_line"] and dettagli_analisi["macd_line"] > dettagli_analisi["signal_line"]: punteggio_acquisto += 1
+    if dettagli_analisi["macd_line"] and dettagli_analisi["signal_line"] and dettagli_analisi["macd_line"] < dettagli_analisi["signal_line"]: punteggio_vendita += 1
+    return punteggio_acquisto, punteggio_vendita
+
+async def leggi_indicatori_ultima_candela_chiusa(piattaforma, coppia, timeframe, params: dict):
+    """
+    Restituisce le ultime due righe precalcolate (candela in corso e ultima chiusa) se quella della candela chiusa
+    è definitiva, cioè ricalcolata dopo la sua chiusura; altrimenti None.
+    """
+    righe = await db_async.recupera_indicatori_recenti_db(piattaforma.id, coppia.upper(), timeframe, firma_parametri_indicatori(params), 2)
+    if len(righe) < 2:
+        return None
+    in_corso, chiusa = righe
+    if _fine_candela(piattaforma, timeframe, in_corso['timestamp']) <= time.time():
+        return None
+    if chiusa['calcolato_il'] < in_corso['timestamp'] * 1000:
+        return None
+    return in_corso, chiusa
 
-async def analizza_singolo_timeframe(piattaforma, coppia, timeframe):
-    """Funzione helper per analizzare un singolo timeframe e restituire i punteggi."""
+async def indicatori_candele_chiuse(piattaforma, coppia, timeframe, config: dict):
+    """
+    Calcola gli indicatori di un timeframe sulle sole candele chiuse: restano validi fino alla chiusura della candela in corso.
+    Restituisce dettagli_analisi, inizio dell'ultima candela chiusa ('ultima_chiusa'), fine della candela in corso
+    ('scadenza') e ultimo prezzo scaricato, oppure None se i dati non bastano. Gli altri errori vengono propagati.
+    """
     try:
-        config = carica_configurazione()
         params = config['parametri_indicatori']
-        dati_ohlcv = await piattaforma.fetch_ohlcv(coppia, timeframe, limit=100)
-
-        if not dati_ohlcv or len(dati_ohlcv) < params['sma_periodo']: # Controllo base
+        if (config.get('indicatori_precalcolati') or {}).get('attivo', True):
+            # La riga della candela chiusa, ricalcolata dopo la chiusura, non invecchia fino alla prossima candela
+            righe = await leggi_indicatori_ultima_candela_chiusa(piattaforma, coppia, timeframe, params)
+            if righe is not None:
+                in_corso, chiusa = righe
+                dettagli_analisi = _dettagli_da_indicatori(chiusa)
+                if dettagli_analisi is None:
+                    return None
+                return {
+                    "dettagli_analisi": dettagli_analisi,
+                    "ultima_chiusa": chiusa['timestamp'],
+                    "scadenza": _fine_candela(piattaforma, timeframe, in_corso['timestamp']),
+                    "ultimo_prezzo": float(in_corso['close']),
+                }
+
+        # Una candela in più: l'ultima scaricata è di solito quella ancora aperta e viene esclusa dal calcolo
+        dati_ohlcv = await piattaforma.fetch_ohlcv(coppia, timeframe, limit=CANDELE_FINESTRA_INDICATORI + 1)
+        if not dati_ohlcv:
             return None
-
-        df = pd.DataFrame(dati_ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        
-        # Calcolo indicatori
-        sma = calcola_sma(df, params['sma_periodo'])
-        rsi = calcola_rsi(df, params['rsi_periodo'])
-        macd_line, signal_line, _ = calcola_macd(df, params['macd_periodo_veloce'], params['macd_periodo_lento'], params['macd_periodo_segnale'])
-
-        ultimo_prezzo = df['close'].iloc[-1]
-        dettagli_analisi = {
-            "rsi_14": rsi.iloc[-1],
-            "sma_20": sma.iloc[-1],
-            "macd_line": macd_line.iloc[-1],
-            "signal_line": signal_line.iloc[-1],
-        }
-
-        if any(pd.isna(v) for v in dettagli_analisi.values()):
+        ultima = dati_ohlcv[-1]
+        fine_ultima = _fine_candela(piattaforma, timeframe, ultima[0] / 1000)
+        if fine_ultima > time.time():
+            candele_chiuse, scadenza = dati_ohlcv[:-1], fine_ultima
+        else:
+            # L'exchange non ha ancora restituito la candela in corso: scade quando si chiude quella che segue l'ultima
+            candele_chiuse, scadenza = dati_ohlcv, _fine_candela(piattaforma, timeframe, fine_ultima)
+        candele_chiuse = candele_chiuse[-CANDELE_FINESTRA_INDICATORI:]
+        if len(candele_chiuse) < params['sma_periodo']:
             return None
 
-        punteggio_acquisto = 0
-        punteggio_vendita = 0
-        if dettagli_analisi["sma_20"] and ultimo_prezzo > dettagli_analisi["sma_20"]: punteggio_acquisto += 1
-        if dettagli_analisi["sma_20"] and ultimo_prezzo < dettagli_analisi["sma_20"]: punteggio_vendita += 1
-        if dettagli_analisi["rsi_14"] and dettagli_analisi["rsi_14"] < 30: punteggio_acquisto += 1
-        if dettagli_analisi["rsi_14"] and dettagli_analisi["rsi_14"] > 70: punteggio_vendita += 1
-        if dettagli_analisi["macd_line"] and dettagli_analisi["signal_line"] and dettagli_analisi["macd_line"] > dettagli_analisi["signal_line"]: punteggio_acquisto += 1
-        if dettagli_analisi["macd_line"] and dettagli_analisi["signal_line"] and dettagli_analisi["macd_line"] < dettagli_analisi["signal_line"]: punteggio_vendita += 1
-
+        if params.get('calcolo_incrementale', False):
+            # Solo le candele chiuse nuove aggiornano lo stato della serie.
+            # Le EMA proseguono dallo storico già visto invece di ripartire dalla prima delle 100 candele.
+            valori = indicatori_incrementali(piattaforma.id, coppia, timeframe, params, candele_chiuse)
+        else:
+            # Ricalcolo dell'intera serie con i kernel NumPy: per 100 candele costa meno del passaggio a un altro processo
+            valori = calcola_indicatori_timeframe(candele_chiuse, params)
+        dettagli_analisi = _dettagli_da_indicatori(valori)
+        if dettagli_analisi is None:
+            return None
         return {
-            "ultimo_prezzo": ultimo_prezzo,
-            "punteggio_acquisto": punteggio_acquisto,
-            "punteggio_vendita": punteggio_vendita,
-            "dettagli_analisi": {k: (float(v) if pd.notna(v) else None) for k, v in dettagli_analisi.items()}
+            "dettagli_analisi": dettagli_analisi,
+            "ultima_chiusa": candele_chiuse[-1][0] // 1000,
+            "scadenza": scadenza,
+            "ultimo_prezzo": float(ultima[4]),
         }
     except ccxt.ExchangeError as e:
-        # Rilancia l'eccezione specifica dell'exchange per essere gestita dal chiamante (es. per la blacklist)
         logging.warning(f"Errore Exchange per {coppia} ({timeframe}): {e}. L'eccezione verrà propagata.")
         raise e
-    except Exception as e:
-        # Gestisce altri errori (es. calcoli, dati insufficienti) senza bloccare tutto
-        logging.info(f"Dati per timeframe {timeframe} su {coppia} non disponibili o insufficienti. Salto. Dettagli: {e}")
-        return None
 
 # --- Logica di Ottimizzazione del Portafoglio (Simulata) ---
 
@@ -372,7 +374,7 @@ def ottimizza_portafoglio_simulato() -> dict:
         if asset.upper() in STABLECOINS: # Usa .upper() per consistenza
             prezzo = 1.0
         else:
-            prezzo_cached = get_prezzo_cache(asset, quote_currency) # Passa quote_currency
+            prezzo_cached = get_prezzo_cache(asset, quote_currency, first_active_platform_name) # Passa quote_currency
             if prezzo_cached is not None:
                 prezzo = prezzo_cached
             else:
@@ -424,16 +426,16 @@ def ottimizza_portafoglio_simulato() -> dict:
 
 # --- Nuova Logica per Strategie di Mercato ---
 
+@esegui_con_priorita(PRIORITA_SCANSIONE)
 async def suggerisci_strategie_di_mercato(nome_piattaforma: str, top_n: int = 150, output_n: int = 5):
     """
     Analizza l'intero mercato per identificare gli asset con il più forte momentum positivo,
     escludendo le coppie presenti nella blacklist.
     """
     logging.info(f"Avvio analisi strategie di mercato per {nome_piattaforma}...")
-    piattaforma = None
     try:
-        piattaforma = inizializza_piattaforma(nome_piattaforma)
-        blacklist = get_blacklisted_pairs_set()
+        piattaforma = get_platform_instance(nome_piattaforma)
+        blacklist = await db_async.get_blacklisted_pairs_set()
         logging.info(f"Strategie di mercato: blacklist caricata con {len(blacklist)} coppie.")
 
         if not piattaforma.markets:
@@ -463,10 +465,12 @@ async def suggerisci_strategie_di_mercato(nome_piattaforma: str, top_n: int = 15
         simboli_filtrati = [s for s in top_symbols if s not in blacklist]
         logging.info(f"Rimossi {len(top_symbols) - len(simboli_filtrati)} simboli dalla blacklist. Si procede con {len(simboli_filtrati)} simboli.")
 
-        tasks = [analizza_singolo_asset(piattaforma, symbol) for symbol in simboli_filtrati]
-        risultati_analisi = await asyncio.gather(*tasks)
+        tasks = [scarica_candele_giornaliere(piattaforma, symbol) for symbol in simboli_filtrati]
+        candele_per_simbolo = await asyncio.gather(*tasks)
 
-        risultati_validi = [res for res in risultati_analisi if res]
+        # Un'unica analisi vettoriale sull'intero universo invece di un DataFrame per simbolo
+        serie_valide = {simbolo: candele for simbolo, candele in zip(simboli_filtrati, candele_per_simbolo) if candele}
+        risultati_validi = await esegui_analisi(analizza_pannello_asset, serie_valide)
 
         # Filtro di sicurezza per asset con crescita eccessiva
         limite_crescita_7d = 1.0  # Corrisponde a +100%
@@ -495,50 +499,34 @@ async def suggerisci_strategie_di_mercato(nome_piattaforma: str, top_n: int = 15
     except Exception as e:
         logging.error(f"Errore grave in suggerisci_strategie_di_mercato: {e}", exc_info=True)
         return []
-    finally:
-        if piattaforma:
-            await piattaforma.close()
 
 
-async def analizza_singolo_asset(piattaforma, simbolo: str):
+# Candele giornaliere scaricate per simbolo e minimo necessario per performance a 30gg e RSI
+CANDELE_ANALISI_ASSET = 90
+MIN_CANDELE_ANALISI_ASSET = 31
+
+async def scarica_candele_giornaliere(piattaforma, simbolo: str):
     """
-    Funzione helper per analizzare un singolo asset e calcolare il suo punteggio.
+    Scarica le candele giornaliere di un asset per l'analisi di momentum.
+    Restituisce None se non sono disponibili o sono insufficienti.
     """
     try:
         # Usa '1d' per dati giornalieri, che sono più stabili per l'analisi di momentum
-        ohlcv = await piattaforma.fetch_ohlcv(simbolo, '1d', limit=90)
-        if len(ohlcv) < 31: # Richiede almeno 31 giorni per calcolare performance a 30gg e RSI
+        ohlcv = await piattaforma.fetch_ohlcv(simbolo, '1d', limit=CANDELE_ANALISI_ASSET)
+        if len(ohlcv) < MIN_CANDELE_ANALISI_ASSET: # Richiede almeno 31 giorni per calcolare performance a 30gg e RSI
             logging.warning(f"Dati insufficienti per {simbolo} ({len(ohlcv)} candele). Salto.")
             return None
-
-        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        
-        # Calcolo performance
-        prezzo_attuale = df['close'].iloc[-1]
-        prezzo_7d_fa = df['close'].iloc[-8] # -1 è oggi, -8 è 7 giorni fa
-        prezzo_30d_fa = df['close'].iloc[-31]
-        
-        perf_7d = (prezzo_attuale - prezzo_7d_fa) / prezzo_7d_fa
-        perf_30d = (prezzo_attuale - prezzo_30d_fa) / prezzo_30d_fa
-
-        # Calcolo RSI
-        rsi = calcola_rsi(df, periodo=14).iloc[-1]
-        if pd.isna(rsi):
-            return None
-
-        # Calcolo Punteggio Momentum
-        # Ponderazione: 60% performance 7gg, 20% performance 30gg, 20% RSI
-        # Normalizziamo l'RSI in un range 0-1 per il punteggio
-        punteggio_momentum = (perf_7d * 0.6) + (perf_30d * 0.2) + ((rsi / 100) * 0.2)
-
-        return {
-            'simbolo': simbolo,
-            'ultimo_prezzo': prezzo_attuale,
-            'punteggio_momentum': punteggio_momentum,
-            'performance_7d': perf_7d,
-            'performance_30d': perf_30d,
-            'rsi_14d': rsi
-        }
+        return ohlcv
     except Exception as e:
         logging.debug(f"Impossibile analizzare il simbolo {simbolo}: {e}")
         return None
+
+async def analizza_singolo_asset(piattaforma, simbolo: str):
+    """
+    Funzione helper per analizzare un singolo asset e calcolare il suo punteggio.
+    """
+    candele = await scarica_candele_giornaliere(piattaforma, simbolo)
+    if not candele:
+        return None
+    analisi = await esegui_analisi(analizza_pannello_asset, {simbolo: candele})
+    return analisi[0] if analisi else None
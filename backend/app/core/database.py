@@ -2,7 +2,14 @@ import sqlite3
 import os
 import logging
 import sys
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Optional
+from .scrittore_db import ScrittoreDifferito, ScritturaInCoda
+from .migrazioni import applica_migrazioni
 
 
 
@@ -19,8 +26,157 @@ def get_base_path():
 # Il percorso del file DB sarà nella cartella 'data' relativa al percorso base
 DB_FILE = os.path.join(get_base_path(), 'data', 'tradeai.db')
 
+# Numero di connessioni di sola lettura mantenute aperte dal pool
+NUM_CONNESSIONI_LETTURA = 4
+
+# PRAGMA applicati a ogni connessione persistente.
+# WAL permette letture concorrenti mentre il writer scrive; synchronous=NORMAL
+# in WAL esegue l'fsync solo ai checkpoint, non a ogni commit.
+PRAGMA_CONNESSIONE = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -20000",      # ~20 MB di page cache per connessione
+    "PRAGMA mmap_size = 268435456",    # 256 MB di I/O memory-mapped
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+class PoolConnessioniSQLite:
+    """
+    Gestisce connessioni SQLite di lunga durata: una sola connessione di scrittura,
+    serializzata da un lock, e un piccolo pool di connessioni di sola lettura.
+    Le connessioni vengono aperte alla prima richiesta e riutilizzate fino a chiudi().
+    """
+    def __init__(self, percorso_db: str, num_lettori: int = NUM_CONNESSIONI_LETTURA):
+        self.percorso_db = percorso_db
+        self.num_lettori = num_lettori
+        self._lock_scrittura = threading.RLock()
+        self._lock_lettori = threading.Lock()
+        self._connessione_scrittura = None
+        self._lettori_liberi = queue.LifoQueue()
+        self._lettori_aperti = []
+
+    def _apri_connessione(self, sola_lettura: bool = False) -> sqlite3.Connection:
+        # Assicura che la directory del database esista
+        db_dir = os.path.dirname(self.percorso_db)
+        if not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+            logging.info(f"Directory del database creata in: {db_dir}")
+
+        conn = sqlite3.connect(self.percorso_db, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMA_CONNESSIONE:
+            conn.execute(pragma)
+        if sola_lettura:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def scrittura(self):
+        """
+        Fornisce la connessione di scrittura in modo esclusivo.
+        Esegue il commit all'uscita dal blocco, o il rollback in caso di eccezione.
+        """
+        with self._lock_scrittura:
+            if self._connessione_scrittura is None:
+                self._connessione_scrittura = self._apri_connessione()
+                logging.info(f"Connessione di scrittura persistente aperta su {self.percorso_db} (WAL).")
+            conn = self._connessione_scrittura
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @contextmanager
+    def lettura(self):
+        """Presta una connessione di sola lettura dal pool e la restituisce all'uscita."""
+        conn = self._preleva_lettore()
+        try:
+            yield conn
+        finally:
+            self._lettori_liberi.put(conn)
+
+    def _preleva_lettore(self) -> sqlite3.Connection:
+        try:
+            return self._lettori_liberi.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock_lettori:
+            if len(self._lettori_aperti) < self.num_lettori:
+                conn = self._apri_connessione(sola_lettura=True)
+                self._lettori_aperti.append(conn)
+                return conn
+        # Pool esaurito: attende che un'altra richiesta restituisca la propria connessione
+        return self._lettori_liberi.get()
+
+    def chiudi(self):
+        """Chiude tutte le connessioni aperte. Da chiamare allo shutdown."""
+        with self._lock_scrittura:
+            if self._connessione_scrittura is not None:
+                try:
+                    self._connessione_scrittura.execute("PRAGMA optimize")
+                    self._connessione_scrittura.close()
+                except sqlite3.Error as e:
+                    logging.warning(f"Errore durante la chiusura della connessione di scrittura: {e}")
+                self._connessione_scrittura = None
+        with self._lock_lettori:
+            for conn in self._lettori_aperti:
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    logging.warning(f"Errore durante la chiusura di una connessione di lettura: {e}")
+            self._lettori_aperti.clear()
+            self._lettori_liberi = queue.LifoQueue()
+        logging.info("Connessioni persistenti al database chiuse.")
+
+
+pool_db = PoolConnessioniSQLite(DB_FILE)
+# Writer in background per eventi, notifiche e operazioni
+scrittore_differito = ScrittoreDifferito(pool_db)
+
+
+def flush_scritture_db(timeout: float = None) -> bool:
+    """Attende che tutte le scritture differite accodate finora siano confermate su disco."""
+    return scrittore_differito.flush(timeout=timeout)
+
+def chiudi_connessioni_db():
+    """Svuota la coda delle scritture differite e chiude le connessioni persistenti del pool."""
+    scrittore_differito.ferma()
+    pool_db.chiudi()
+
+# --- Conversione dei timestamp ---
+# operazioni, eventi e notifiche salvano il timestamp come intero in epoch millisecondi;
+# l'API continua a esporre stringhe ISO in ora locale.
+
+def ora_epoch_ms() -> int:
+    """Restituisce l'istante corrente in epoch millisecondi."""
+    return int(time.time() * 1000)
+
+def datetime_a_epoch_ms(valore: datetime) -> int:
+    """Converte un datetime (naive in ora locale o con timezone) in epoch millisecondi."""
+    return int(valore.timestamp() * 1000)
+
+def epoch_ms_a_iso(valore: Optional[int]) -> Optional[str]:
+    """Converte un timestamp in epoch millisecondi in una stringa ISO in ora locale."""
+    if valore is None:
+        return None
+    return datetime.fromtimestamp(valore / 1000).isoformat()
+
+def _riga_serializzata(row) -> dict:
+    """Converte una riga del database in dizionario con il timestamp in formato ISO."""
+    riga = dict(row)
+    if isinstance(riga.get('timestamp'), int):
+        riga['timestamp'] = epoch_ms_a_iso(riga['timestamp'])
+    return riga
+
 def get_db_connection():
-    """Crea e restituisce una connessione al database SQLite."""
+    """
+    Crea e restituisce una nuova connessione al database SQLite.
+    Da usare solo per script e strumenti esterni: il backend usa le connessioni persistenti di pool_db.
+    """
     conn = None
     try:
         # Assicura che la directory del database esista
@@ -36,144 +192,81 @@ def get_db_connection():
     return conn
 
 def create_tables():
-    """Crea le tabelle del database se non esistono già."""
-    conn = get_db_connection()
-    if conn is None:
-        logging.error("Impossibile creare le tabelle: connessione al database non riuscita.")
-        return
-
+    """
+    Crea le tabelle del database e applica le migrazioni di schema non ancora eseguite.
+    Viene chiamata all'avvio, quindi anche i file tradeai.db esistenti ricevono le nuove migrazioni.
+    Se una migrazione fallisce l'errore viene propagato: il resto del codice presuppone lo schema aggiornato
+    e l'avvio deve interrompersi invece di proseguire su uno schema intermedio.
+    """
     try:
-        cursor = conn.cursor()
-
-        # Tabella per i dati delle candele (OHLCV)
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS candlesticks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            exchange TEXT NOT NULL,
-            symbol TEXT NOT NULL,
-            timeframe TEXT NOT NULL,
-            timestamp INTEGER NOT NULL,
-            open REAL NOT NULL,
-            high REAL NOT NULL,
-            low REAL NOT NULL,
-            close REAL NOT NULL,
-            volume REAL NOT NULL,
-            UNIQUE(exchange, symbol, timeframe, timestamp)
-        );
-        """)
-        logging.info("Tabella 'candlesticks' creata o già esistente.")
-
-        # Tabella per lo storico del portafoglio
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS portfolio_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp INTEGER NOT NULL UNIQUE,
-            total_balance_usd REAL NOT NULL,
-            asset_balances TEXT NOT NULL -- JSON con i saldi degli asset
-        );
-        """)
-        logging.info("Tabella 'portfolio_history' creata o già esistente.")
-
-        # Tabella per le operazioni di trading
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS operazioni (
-            id_operazione TEXT PRIMARY KEY,
-            timestamp TEXT NOT NULL,
-            piattaforma TEXT NOT NULL,
-            coppia TEXT NOT NULL,
-            tipo TEXT NOT NULL,
-            quantita REAL NOT NULL,
-            prezzo REAL NOT NULL,
-            controvalore_usd REAL NOT NULL,
-            commissioni_usd REAL NOT NULL,
-            profitto_perdita_operazione REAL NOT NULL,
-            motivo_vendita TEXT,
-            percentuale_profitto_perdita REAL -- Nuova colonna
-        );
-        """)
-        logging.info("Tabella 'operazioni' creata o già esistente.")
-
-        # Tabella per le coppie in blacklist
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS blacklist_coppie (
-            coppia TEXT PRIMARY KEY,
-            motivo_errore TEXT,
-            data_inserimento TEXT NOT NULL
-        );
-        """)
-        logging.info("Tabella 'blacklist_coppie' creata o già esistente.")
-
-        # Tabella per gli eventi di sistema/bot
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS eventi (
-            id_evento INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            tipo_evento TEXT NOT NULL, -- Es. 'ANNULLA_ORDINE', 'SEGNALE_MANTIENI', 'ERRORE_API'
-            piattaforma TEXT,
-            coppia TEXT,
-            dettagli TEXT -- Un campo JSON o testuale per info aggiuntive
-        );
-        """)
-        logging.info("Tabella 'eventi' creata o già esistente.")
-
-        # Tabella per le notifiche
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS notifiche (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            titolo TEXT NOT NULL,
-            messaggio TEXT NOT NULL,
-            letta INTEGER NOT NULL DEFAULT 0 -- 0 per non letta, 1 per letta
-        );
-        """)
-        logging.info("Tabella 'notifiche' creata o già esistente.")
-
-        conn.commit()
+        with pool_db.scrittura() as conn:
+            applica_migrazioni(conn)
     except sqlite3.Error as e:
-        logging.error(f"Errore durante la creazione delle tabelle: {e}")
-    finally:
-        if conn:
-            conn.close()
+        logging.critical(f"Errore durante la creazione delle tabelle: {e}. Avvio interrotto.")
+        raise
 
 
 def salva_evento_db(tipo_evento: str, piattaforma: str = None, coppia: str = None, dettagli: str = None):
-    """Salva un evento generico nel database."""
-    conn = get_db_connection()
-    if not conn:
-        logging.error(f"Impossibile salvare l'evento '{tipo_evento}': connessione DB fallita.")
-        return
-
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
+    """Accoda il salvataggio di un evento generico nel database."""
+    scrittore_differito.accoda(ScritturaInCoda(
+        sql="""
             INSERT INTO eventi (timestamp, tipo_evento, piattaforma, coppia, dettagli)
             VALUES (?, ?, ?, ?, ?)
-        """, (datetime.now().isoformat(), tipo_evento, piattaforma, coppia, dettagli))
-        conn.commit()
-        logging.debug(f"Evento '{tipo_evento}' per {coppia or 'N/A'} salvato nel database.")
-    except sqlite3.Error as e:
-        logging.error(f"Errore durante il salvataggio dell'evento '{tipo_evento}' nel DB: {e}")
-    finally:
-        if conn:
-            conn.close()
+        """,
+        parametri=(ora_epoch_ms(), tipo_evento, piattaforma, coppia, dettagli),
+        descrizione=f"evento {tipo_evento}"
+    ))
+    logging.debug(f"Evento '{tipo_evento}' per {coppia or 'N/A'} accodato per il salvataggio nel database.")
+
+# --- Cache delle letture sulle operazioni ---
+# Le operazioni vengono scritte solo da salva_operazione_db: i risultati delle analisi restano
+# validi fino al commit della successiva operazione, che incrementa la generazione.
+_lock_cache_operazioni = threading.Lock()
+_generazione_operazioni = 0
+_cache_operazioni = {}
+MAX_VOCI_CACHE_OPERAZIONI = 256
+
+def _invalida_cache_operazioni():
+    global _generazione_operazioni
+    with _lock_cache_operazioni:
+        _generazione_operazioni += 1
+        _cache_operazioni.clear()
+
+def _con_cache_operazioni(chiave, calcola):
+    """Restituisce il risultato in cache per la chiave o lo calcola e lo memorizza."""
+    with _lock_cache_operazioni:
+        generazione = _generazione_operazioni
+        if chiave in _cache_operazioni:
+            return _cache_operazioni[chiave]
+    valore = calcola()
+    with _lock_cache_operazioni:
+        # Se nel frattempo è stata salvata un'operazione il valore potrebbe essere già superato
+        if generazione == _generazione_operazioni:
+            if len(_cache_operazioni) >= MAX_VOCI_CACHE_OPERAZIONI:
+                _cache_operazioni.clear()
+            _cache_operazioni[chiave] = valore
+    return valore
 
 def salva_operazione_db(operazione, motivo_vendita: str = None):
-    """Salva una singola operazione nel database."""
-    conn = get_db_connection()
-    if not conn:
-        logging.error(f"Impossibile salvare l'operazione {operazione.id_operazione}: connessione DB fallita.")
-        return
+    """
+    Accoda il salvataggio di una singola operazione nel database.
+    Le operazioni sono urgenti e durevoli: il writer le conferma subito con fsync,
+    senza che il chiamante debba attendere il disco.
+    """
+    def _conferma():
+        _invalida_cache_operazioni()
+        logging.info(f"Operazione {operazione.id_operazione} ({operazione.tipo} {operazione.coppia}) salvata nel database.")
 
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
+    scrittore_differito.accoda(ScritturaInCoda(
+        sql="""
             INSERT INTO operazioni (
                 id_operazione, timestamp, piattaforma, coppia, tipo, quantita, 
                 prezzo, controvalore_usd, commissioni_usd, profitto_perdita_operazione, motivo_vendita, percentuale_profitto_perdita
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        """,
+        parametri=(
             operazione.id_operazione,
-            operazione.timestamp.isoformat(),
+            datetime_a_epoch_ms(operazione.timestamp),
             operazione.piattaforma,
             operazione.coppia,
             operazione.tipo,
@@ -184,154 +277,400 @@ def salva_operazione_db(operazione, motivo_vendita: str = None):
             operazione.profitto_perdita_operazione,
             motivo_vendita,
             operazione.percentuale_profitto_perdita
-        ))
-        conn.commit()
-        logging.info(f"Operazione {operazione.id_operazione} ({operazione.tipo} {operazione.coppia}) salvata nel database.")
+        ),
+        descrizione=f"operazione {operazione.id_operazione}",
+        urgente=True,
+        durevole=True,
+        dopo_commit=_conferma
+    ))
+
+def _seleziona_pagina(conn, tabella: str, colonna_id: str, condizioni: list, parametri: list, limit: int,
+                      before_id=None, after_ts: Optional[datetime] = None) -> list:
+    """
+    Esegue una lettura paginata per chiave (keyset) ordinata dalla riga più recente.
+    before_id restituisce le righe che seguono, nell'ordinamento, quella con l'id indicato;
+    after_ts limita il risultato alle righe più recenti dell'istante indicato.
+    La posizione del cursore viene letta con una ricerca per chiave primaria e la pagina con
+    una ricerca sull'indice del timestamp: il costo dipende dalla pagina, non dall'offset.
+    """
+    condizioni, parametri = list(condizioni), list(parametri)
+    if before_id is not None:
+        condizioni.append(f"(timestamp, rowid) < (SELECT timestamp, rowid FROM {tabella} WHERE {colonna_id} = ?)")
+        parametri.append(before_id)
+    if after_ts is not None:
+        condizioni.append("timestamp > ?")
+        parametri.append(datetime_a_epoch_ms(after_ts))
+    query = f"SELECT * FROM {tabella}"
+    if condizioni:
+        query += " WHERE " + " AND ".join(condizioni)
+    query += " ORDER BY timestamp DESC, rowid DESC LIMIT ?"
+    rows = conn.execute(query, (*parametri, limit)).fetchall()
+    # Converte le righe del database (che sono simili a tuple) in dizionari completi
+    return [_riga_serializzata(row) for row in rows]
+
+def recupera_operazioni_db(limit: int = 100, dal: Optional[datetime] = None, al: Optional[datetime] = None,
+                           before_id: Optional[str] = None, after_ts: Optional[datetime] = None,
+                           solo_reali: bool = False, motivo_vendita: Optional[str] = None) -> list:
+    """
+    Recupera le ultime operazioni dal database.
+    Con dal/al restringe il risultato all'intervallo di tempo indicato (estremi inclusi);
+    before_id (id_operazione dell'ultima riga ricevuta) e after_ts permettono la paginazione.
+    solo_reali e motivo_vendita filtrano direttamente nella query.
+    """
+    condizioni, parametri = [], []
+    if solo_reali:
+        condizioni.append("tipo LIKE '%\\_reale%' ESCAPE '\\'")
+    if motivo_vendita is not None:
+        condizioni.append("motivo_vendita = ?")
+        parametri.append(motivo_vendita)
+    if dal is not None:
+        condizioni.append("timestamp >= ?")
+        parametri.append(datetime_a_epoch_ms(dal))
+    if al is not None:
+        condizioni.append("timestamp <= ?")
+        parametri.append(datetime_a_epoch_ms(al))
+    def _calcola():
+        with pool_db.lettura() as conn:
+            return _seleziona_pagina(conn, "operazioni", "id_operazione", condizioni, parametri, limit, before_id, after_ts)
+
+    chiave = ("operazioni", limit, dal, al, before_id, after_ts, solo_reali, motivo_vendita)
+    try:
+        # Copia delle righe: i chiamanti possono modificarle senza alterare la cache
+        return [dict(op) for op in _con_cache_operazioni(chiave, _calcola)]
     except sqlite3.Error as e:
-        logging.error(f"Errore durante il salvataggio dell'operazione {operazione.id_operazione} nel DB: {e}")
-    finally:
-        if conn:
-            conn.close()
-
-def recupera_operazioni_db(limit: int = 100) -> list:
-    """Recupera le ultime operazioni dal database."""
-    conn = get_db_connection()
-    if not conn:
-        logging.error("Impossibile recuperare le operazioni: connessione DB fallita.")
+        logging.error(f"Errore durante il recupero delle operazioni dal DB: {e}")
         return []
 
+def analisi_profitto_storico_db() -> dict:
+    """
+    Calcola in SQL la percentuale di profitto/perdita minima, media e massima delle operazioni
+    di vendita, rispetto al costo della posizione (controvalore meno profitto).
+    Il risultato resta in cache fino al salvataggio della successiva operazione.
+    """
+    def _calcola():
+        with pool_db.lettura() as conn:
+            riga = conn.execute("""
+                SELECT MIN(percentuale), AVG(percentuale), MAX(percentuale)
+                FROM (
+                    SELECT profitto_perdita_operazione * 100.0 / (controvalore_usd - profitto_perdita_operazione) AS percentuale
+                    FROM operazioni
+                    WHERE tipo LIKE 'vendita%' AND controvalore_usd - profitto_perdita_operazione > 0
+                )
+            """).fetchone()
+        if riga[0] is None:
+            return {"min": 0.0, "avg": 0.0, "max": 0.0}
+        return {"min": riga[0], "avg": riga[1], "max": riga[2]}
+    try:
+        return dict(_con_cache_operazioni(("analisi_profitto_storico",), _calcola))
+    except sqlite3.Error as e:
+        logging.error(f"Errore durante il calcolo dell'analisi profitto storico dal DB: {e}")
+        raise
+
+
+def recupera_aggregati_operazioni_db() -> list:
+    """
+    Recupera conteggi e somme delle operazioni raggruppati per tipo, coppia e piattaforma.
+    Serve a ricostruire all'avvio gli aggregati mantenuti in memoria da GestorePortafoglio.
+    """
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM operazioni ORDER BY timestamp DESC LIMIT ?", (limit,))
-        rows = cursor.fetchall()
-        # Converte le righe del database (che sono simili a tuple) in dizionari completi
+        with pool_db.lettura() as conn:
+            rows = conn.execute("""
+                SELECT tipo, coppia, piattaforma,
+                       COUNT(*) AS numero_operazioni,
+                       SUM(controvalore_usd) AS controvalore_usd,
+                       SUM(profitto_perdita_operazione) AS profitto_perdita_usd,
+                       SUM(profitto_perdita_operazione > 0) AS vincenti,
+                       SUM(profitto_perdita_operazione < 0) AS perdenti
+                FROM operazioni
+                GROUP BY tipo, coppia, piattaforma
+            """).fetchall()
         return [dict(row) for row in rows]
     except sqlite3.Error as e:
-        logging.error(f"Errore durante il recupero delle operazioni dal DB: {e}")
-        return []
-    finally:
-        if conn:
-            conn.close()
-
-def recupera_eventi_db(limit: int = 100) -> list:
-    """Recupera gli ultimi eventi dal database."""
-    conn = get_db_connection()
-    if not conn:
-        logging.error("Impossibile recuperare gli eventi: connessione DB fallita.")
+        logging.error(f"Errore durante il recupero degli aggregati delle operazioni dal DB: {e}")
         return []
 
+def recupera_eventi_db(limit: int = 100, before_id: Optional[int] = None, after_ts: Optional[datetime] = None) -> list:
+    """Recupera gli ultimi eventi dal database, con paginazione opzionale tramite before_id/after_ts."""
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM eventi ORDER BY timestamp DESC LIMIT ?", (limit,))
-        rows = cursor.fetchall()
-        return [dict(row) for row in rows]
+        with pool_db.lettura() as conn:
+            return _seleziona_pagina(conn, "eventi", "id_evento", [], [], limit, before_id, after_ts)
     except sqlite3.Error as e:
         logging.error(f"Errore durante il recupero degli eventi dal DB: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
 
+# Cache in memoria degli id delle serie di candele: (exchange, symbol, timeframe) -> id_serie.
+# Gli id non cambiano mai una volta assegnati, quindi la cache non va invalidata.
+_cache_id_serie = {}
+
+def _id_serie_candele(conn, exchange: str, symbol: str, timeframe: str, crea: bool = False) -> Optional[int]:
+    """Restituisce l'id della serie di candele, creandola se richiesto e non ancora presente."""
+    chiave = (exchange, symbol, timeframe)
+    id_serie = _cache_id_serie.get(chiave)
+    if id_serie is not None:
+        return id_serie
+    if crea:
+        conn.execute("INSERT OR IGNORE INTO serie_candele (exchange, symbol, timeframe) VALUES (?, ?, ?)", chiave)
+    riga = conn.execute(
+        "SELECT id_serie FROM serie_candele WHERE exchange = ? AND symbol = ? AND timeframe = ?", chiave
+    ).fetchone()
+    if riga is None:
+        return None
+    _cache_id_serie[chiave] = riga[0]
+    return riga[0]
+
 def recupera_dati_ohlcv_da_db(exchange: str, symbol: str, timeframe: str, limit: int):
     """
     Recupera i dati OHLCV dal database locale.
     """
-    conn = get_db_connection()
-    if not conn:
-        logging.error("Impossibile recuperare i dati OHLCV: connessione al database non riuscita.")
-        return []
-
     try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT timestamp, open, high, low, close, volume 
-            FROM candlesticks 
-            WHERE exchange = ? AND symbol = ? AND timeframe = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        """, (exchange, symbol, timeframe, limit))
-        
-        rows = cursor.fetchall()
+        with pool_db.lettura() as conn:
+            id_serie = _id_serie_candele(conn, exchange, symbol, timeframe)
+            if id_serie is None:
+                return []
+            rows = conn.execute("""
+                SELECT timestamp, open, high, low, close, volume 
+                FROM candele 
+                WHERE id_serie = ?
+                ORDER BY timestamp DESC
+                LIMIT ?
+            """, (id_serie, limit)).fetchall()
         return rows[::-1]
     except sqlite3.Error as e:
         logging.error(f"Errore durante il recupero dei dati OHLCV dal DB: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
+
+def ultimo_timestamp_candele_db(exchange: str, symbol: str, timeframe: str) -> Optional[int]:
+    """Restituisce il timestamp (in secondi) dell'ultima candela salvata per la serie, o None se la serie è vuota."""
+    try:
+        with pool_db.lettura() as conn:
+            id_serie = _id_serie_candele(conn, exchange, symbol, timeframe)
+            if id_serie is None:
+                return None
+            return conn.execute("SELECT MAX(timestamp) FROM candele WHERE id_serie = ?", (id_serie,)).fetchone()[0]
+    except sqlite3.Error as e:
+        logging.error(f"Errore durante il recupero dell'ultima candela dal DB: {e}")
+        return None
+
+def salva_candele_db(candele: list, sovrascrivi: bool = False) -> int:
+    """
+    Inserisce un blocco di candele OHLCV in un'unica transazione.
+    Ogni elemento è una tupla (exchange, symbol, timeframe, timestamp, open, high, low, close, volume).
+    Con sovrascrivi=True le candele già presenti vengono aggiornate (es. l'ultima candela ancora aperta),
+    altrimenti vengono ignorate.
+    Restituisce il numero di righe inserite o aggiornate.
+    """
+    if sovrascrivi:
+        sql = """
+            INSERT INTO candele (id_serie, timestamp, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id_serie, timestamp) DO UPDATE SET
+            open = excluded.open, high = excluded.high, low = excluded.low,
+            close = excluded.close, volume = excluded.volume
+        """
+    else:
+        # L'uso di INSERT OR IGNORE previene l'inserimento di duplicati
+        # basandosi sulla chiave primaria (id_serie, timestamp) della tabella.
+        sql = """
+            INSERT OR IGNORE INTO candele (id_serie, timestamp, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+    try:
+        with pool_db.scrittura() as conn:
+            righe = [
+                (_id_serie_candele(conn, exchange, symbol, timeframe, crea=True), *valori)
+                for exchange, symbol, timeframe, *valori in candele
+            ]
+            cursor = conn.executemany(sql, righe)
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        # La transazione è stata annullata: gli id di serie appena creati potrebbero non esistere
+        _cache_id_serie.clear()
+        logging.error(f"Errore durante il salvataggio dei dati OHLCV nel DB: {e}")
+        return 0
+
+def primo_timestamp_candele_db(exchange: str, symbol: str, timeframe: str) -> Optional[int]:
+    """Restituisce il timestamp (in secondi) della candela più vecchia salvata per la serie, o None."""
+    try:
+        with pool_db.lettura() as conn:
+            id_serie = _id_serie_candele(conn, exchange, symbol, timeframe)
+            if id_serie is None:
+                return None
+            return conn.execute("SELECT MIN(timestamp) FROM candele WHERE id_serie = ?", (id_serie,)).fetchone()[0]
+    except sqlite3.Error as e:
+        logging.error(f"Errore durante il recupero della prima candela dal DB: {e}")
+        return None
+
+def recupera_checkpoint_backfill_db(exchange: str, symbol: str, timeframe: str) -> Optional[dict]:
+    """Restituisce il checkpoint del backfill per la serie, o None se non è mai stato avviato."""
+    try:
+        with pool_db.lettura() as conn:
+            id_serie = _id_serie_candele(conn, exchange, symbol, timeframe)
+            if id_serie is None:
+                return None
+            riga = conn.execute("SELECT * FROM backfill_checkpoint WHERE id_serie = ?", (id_serie,)).fetchone()
+        return dict(riga) if riga else None
+    except sqlite3.Error as e:
+        logging.error(f"Errore durante il recupero del checkpoint di backfill dal DB: {e}")
+        return None
+
+def recupera_stato_backfill_db() -> list:
+    """Restituisce i checkpoint di tutte le serie con backfill avviato."""
+    try:
+        with pool_db.lettura() as conn:
+            rows = conn.execute("""
+                SELECT s.exchange, s.symbol, s.timeframe, b.obiettivo_timestamp, b.piu_vecchio_timestamp,
+                       b.candele_salvate, b.stato, b.ultimo_errore, b.aggiornato_il
+                FROM backfill_checkpoint b
+                JOIN serie_candele s ON s.id_serie = b.id_serie
+                ORDER BY s.exchange, s.symbol, s.timeframe
+            """).fetchall()
+        return [{**dict(row), 'aggiornato_il': epoch_ms_a_iso(row['aggiornato_il'])} for row in rows]
+    except sqlite3.Error as e:
+        logging.error(f"Errore durante il recupero dello stato del backfill dal DB: {e}")
+        return []
+
+def salva_blocco_backfill_db(exchange: str, symbol: str, timeframe: str, candele: list, obiettivo_timestamp: int,
+                             piu_vecchio_timestamp: Optional[int], stato: str, ultimo_errore: str = None) -> int:
+    """
+    Salva un blocco di candele storiche e il checkpoint del backfill nella stessa transazione,
+    così il checkpoint non indica mai candele che non sono state scritte.
+    Ogni candela è una lista [timestamp in secondi, open, high, low, close, volume].
+    Restituisce il numero di candele nuove inserite.
+    """
+    try:
+        with pool_db.scrittura() as conn:
+            id_serie = _id_serie_candele(conn, exchange, symbol, timeframe, crea=True)
+            cursor = conn.executemany("""
+                INSERT OR IGNORE INTO candele (id_serie, timestamp, open, high, low, close, volume)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(id_serie, *candela) for candela in candele])
+            inserite = max(cursor.rowcount, 0)
+            conn.execute("""
+                INSERT INTO backfill_checkpoint (id_serie, obiettivo_timestamp, piu_vecchio_timestamp, candele_salvate, stato, ultimo_errore, aggiornato_il)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id_serie) DO UPDATE SET
+                obiettivo_timestamp = excluded.obiettivo_timestamp,
+                piu_vecchio_timestamp = excluded.piu_vecchio_timestamp,
+                candele_salvate = candele_salvate + excluded.candele_salvate,
+                stato = excluded.stato,
+                ultimo_errore = excluded.ultimo_errore,
+                aggiornato_il = excluded.aggiornato_il
+            """, (id_serie, obiettivo_timestamp, piu_vecchio_timestamp, inserite, stato, ultimo_errore, ora_epoch_ms()))
+        return inserite
+    except sqlite3.Error as e:
+        _cache_id_serie.clear()
+        logging.error(f"Errore durante il salvataggio di un blocco di backfill nel DB: {e}")
+        raise
+
+def ultimo_timestamp_indicatori_db(exchange: str, symbol: str, timeframe: str, firma_parametri: str) -> Optional[int]:
+    """Restituisce il timestamp (in secondi) dell'ultima candela con indicatori calcolati con questi parametri, o None."""
+    try:
+        with pool_db.lettura() as conn:
+            id_serie = _id_serie_candele(conn, exchange, symbol, timeframe)
+            if id_serie is None:
+                return None
+            riga = conn.execute("""
+                SELECT timestamp, firma_parametri FROM indicatori_candele
+                WHERE id_serie = ? ORDER BY timestamp DESC LIMIT 1
+            """, (id_serie,)).fetchone()
+        return riga['timestamp'] if riga and riga['firma_parametri'] == firma_parametri else None
+    except sqlite3.Error as e:
+        logging.error(f"Errore durante il recupero dell'ultimo indicatore precalcolato dal DB: {e}")
+        return None
+
+def recupera_indicatori_recenti_db(exchange: str, symbol: str, timeframe: str, firma_parametri: str, limit: int) -> list:
+    """
+    Restituisce gli indicatori precalcolati delle ultime `limit` candele della serie, dalla più recente,
+    interrompendosi alla prima riga calcolata con altri parametri.
+    """
+    try:
+        with pool_db.lettura() as conn:
+            id_serie = _id_serie_candele(conn, exchange, symbol, timeframe)
+            if id_serie is None:
+                return []
+            righe = conn.execute("""
+                SELECT timestamp, firma_parametri, close, sma, rsi, macd_line, signal_line, calcolato_il
+                FROM indicatori_candele
+                WHERE id_serie = ? ORDER BY timestamp DESC LIMIT ?
+            """, (id_serie, limit)).fetchall()
+        risultato = []
+        for riga in righe:
+            if riga['firma_parametri'] != firma_parametri:
+                break
+            risultato.append(dict(riga))
+        return risultato
+    except sqlite3.Error as e:
+        logging.error(f"Errore durante il recupero degli indicatori precalcolati dal DB: {e}")
+        return []
+
+def salva_indicatori_candele_db(exchange: str, symbol: str, timeframe: str, firma_parametri: str, righe: list) -> int:
+    """
+    Salva gli indicatori precalcolati di una serie. Ogni riga è una tupla
+    (timestamp in secondi, close, sma, rsi, macd_line, signal_line); quelle già presenti vengono sovrascritte.
+    Le righe calcolate con parametri diversi vengono eliminate nella stessa transazione.
+    Restituisce il numero di righe salvate.
+    """
+    if not righe:
+        return 0
+    try:
+        calcolato_il = ora_epoch_ms()
+        with pool_db.scrittura() as conn:
+            id_serie = _id_serie_candele(conn, exchange, symbol, timeframe, crea=True)
+            conn.execute("DELETE FROM indicatori_candele WHERE id_serie = ? AND firma_parametri != ?", (id_serie, firma_parametri))
+            cursor = conn.executemany("""
+                INSERT INTO indicatori_candele (id_serie, timestamp, firma_parametri, close, sma, rsi, macd_line, signal_line, calcolato_il)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id_serie, timestamp) DO UPDATE SET
+                firma_parametri = excluded.firma_parametri, close = excluded.close, sma = excluded.sma, rsi = excluded.rsi,
+                macd_line = excluded.macd_line, signal_line = excluded.signal_line, calcolato_il = excluded.calcolato_il
+            """, [(id_serie, timestamp, firma_parametri, *valori, calcolato_il) for timestamp, *valori in righe])
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        _cache_id_serie.clear()
+        logging.error(f"Errore durante il salvataggio degli indicatori precalcolati nel DB: {e}")
+        return 0
 
 def add_to_blacklist(coppia: str, motivo: str):
     """Aggiunge o aggiorna una coppia nella tabella di blacklist."""
-    conn = get_db_connection()
-    if not conn:
-        logging.error(f"Impossibile aggiungere {coppia} alla blacklist: connessione DB fallita.")
-        return
-
     try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO blacklist_coppie (coppia, motivo_errore, data_inserimento)
-            VALUES (?, ?, ?)
-            ON CONFLICT(coppia) DO UPDATE SET
-            motivo_errore = excluded.motivo_errore,
-            data_inserimento = excluded.data_inserimento;
-        """, (coppia, motivo, datetime.now().isoformat()))
-        conn.commit()
+        with pool_db.scrittura() as conn:
+            conn.execute("""
+                INSERT INTO blacklist_coppie (coppia, motivo_errore, data_inserimento)
+                VALUES (?, ?, ?)
+                ON CONFLICT(coppia) DO UPDATE SET
+                motivo_errore = excluded.motivo_errore,
+                data_inserimento = excluded.data_inserimento;
+            """, (coppia, motivo, datetime.now().isoformat()))
         logging.info(f"Coppia {coppia} aggiunta/aggiornata nella blacklist.")
     except sqlite3.Error as e:
         logging.error(f"Errore durante l'aggiunta di {coppia} alla blacklist: {e}")
-    finally:
-        if conn:
-            conn.close()
 
 def get_blacklisted_pairs_set() -> set:
     """Recupera tutte le coppie dalla blacklist e le restituisce come un set per un controllo rapido."""
-    conn = get_db_connection()
-    if not conn:
-        logging.error("Impossibile recuperare la blacklist: connessione DB fallita.")
-        return set()
-
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT coppia FROM blacklist_coppie")
-        rows = cursor.fetchall()
+        with pool_db.lettura() as conn:
+            rows = conn.execute("SELECT coppia FROM blacklist_coppie").fetchall()
         return {row[0] for row in rows}
     except sqlite3.Error as e:
         logging.error(f"Errore durante il recupero della blacklist dal DB: {e}")
         return set()
-    finally:
-        if conn:
-            conn.close()
 
 def get_blacklist_details() -> list:
     """Recupera i dettagli di tutte le coppie dalla blacklist per l'API."""
-    conn = get_db_connection()
-    if not conn:
-        logging.error("Impossibile recuperare i dettagli della blacklist: connessione DB fallita.")
-        return []
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT coppia, motivo_errore, data_inserimento FROM blacklist_coppie ORDER BY data_inserimento DESC")
-        rows = cursor.fetchall()
+        with pool_db.lettura() as conn:
+            rows = conn.execute("SELECT coppia, motivo_errore, data_inserimento FROM blacklist_coppie ORDER BY data_inserimento DESC").fetchall()
         return [dict(row) for row in rows]
     except sqlite3.Error as e:
         logging.error(f"Errore durante il recupero dei dettagli della blacklist: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
 def remove_from_blacklist(coppia: str) -> bool:
     """Rimuove una coppia dalla tabella di blacklist."""
-    conn = get_db_connection()
-    if not conn:
-        logging.error(f"Impossibile rimuovere {coppia} dalla blacklist: connessione DB fallita.")
-        return False
     try:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM blacklist_coppie WHERE coppia = ?", (coppia,))
-        conn.commit()
+        with pool_db.scrittura() as conn:
+            cursor = conn.execute("DELETE FROM blacklist_coppie WHERE coppia = ?", (coppia,))
         if cursor.rowcount > 0:
             logging.info(f"Coppia {coppia} rimossa dalla blacklist.")
             return True
@@ -341,71 +680,38 @@ def remove_from_blacklist(coppia: str) -> bool:
     except sqlite3.Error as e:
         logging.error(f"Errore durante la rimozione di {coppia} dalla blacklist: {e}")
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def crea_notifica(titolo: str, messaggio: str):
-    """Crea una nuova notifica nel database."""
-    conn = get_db_connection()
-    if not conn:
-        logging.error(f"Impossibile creare la notifica: connessione DB fallita.")
-        return
-
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
+    """Accoda la creazione di una nuova notifica nel database."""
+    scrittore_differito.accoda(ScritturaInCoda(
+        sql="""
             INSERT INTO notifiche (timestamp, titolo, messaggio)
             VALUES (?, ?, ?)
-        """, (datetime.now().isoformat(), titolo, messaggio))
-        conn.commit()
-        logging.info(f"Notifica creata: {titolo}")
-    except sqlite3.Error as e:
-        logging.error(f"Errore durante la creazione della notifica: {e}")
-    finally:
-        if conn:
-            conn.close()
-
-def recupera_notifiche(solo_non_lette: bool = False, limit: int = 20) -> list:
-    """Recupera le notifiche dal database."""
-    conn = get_db_connection()
-    if not conn:
-        logging.error("Impossibile recuperare le notifiche: connessione DB fallita.")
-        return []
-
+        """,
+        parametri=(ora_epoch_ms(), titolo, messaggio),
+        descrizione=f"notifica '{titolo}'"
+    ))
+    logging.info(f"Notifica creata: {titolo}")
+
+def recupera_notifiche(solo_non_lette: bool = False, limit: int = 20,
+                       before_id: Optional[int] = None, after_ts: Optional[datetime] = None) -> list:
+    """Recupera le notifiche dal database, con paginazione opzionale tramite before_id/after_ts."""
     try:
-        cursor = conn.cursor()
-        query = "SELECT * FROM notifiche"
-        if solo_non_lette:
-            query += " WHERE letta = 0"
-        query += " ORDER BY timestamp DESC LIMIT ?"
-        cursor.execute(query, (limit,))
-        rows = cursor.fetchall()
-        return [dict(row) for row in rows]
+        condizioni = ["letta = 0"] if solo_non_lette else []
+        with pool_db.lettura() as conn:
+            return _seleziona_pagina(conn, "notifiche", "id", condizioni, [], limit, before_id, after_ts)
     except sqlite3.Error as e:
         logging.error(f"Errore durante il recupero delle notifiche dal DB: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
 def segna_notifiche_come_lette():
     """Segna tutte le notifiche come lette."""
-    conn = get_db_connection()
-    if not conn:
-        logging.error(f"Impossibile segnare le notifiche come lette: connessione DB fallita.")
-        return
-
     try:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE notifiche SET letta = 1 WHERE letta = 0")
-        conn.commit()
+        with pool_db.scrittura() as conn:
+            cursor = conn.execute("UPDATE notifiche SET letta = 1 WHERE letta = 0")
         logging.info(f"{cursor.rowcount} notifiche segnate come lette.")
     except sqlite3.Error as e:
         logging.error(f"Errore durante l'aggiornamento delle notifiche: {e}")
-    finally:
-        if conn:
-            conn.close()
 
 logging.info("Inizializzazione del database...")
 create_tables()
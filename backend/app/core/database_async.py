@@ -0,0 +1,83 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from . import database
+from .archivio_colonnare import archivio_ohlcv
+
+# Pool di thread dedicato alle query SQLite: un thread per ogni connessione di lettura
+# più uno per le scritture, così una query lenta non occupa l'executor di default di asyncio.
+_esecutore_db = ThreadPoolExecutor(
+    max_workers=database.NUM_CONNESSIONI_LETTURA + 1,
+    thread_name_prefix="db"
+)
+
+
+async def _in_thread(funzione, *args, **kwargs):
+    """Esegue una funzione sincrona del database nel pool di thread dedicato."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_esecutore_db, functools.partial(funzione, *args, **kwargs))
+
+def _asincrona(funzione):
+    """Crea l'equivalente awaitable di un helper sincrono di core/database.py."""
+    @functools.wraps(funzione)
+    async def wrapper(*args, **kwargs):
+        return await _in_thread(funzione, *args, **kwargs)
+    return wrapper
+
+
+# --- Letture e scritture immediate: eseguite nel pool di thread ---
+recupera_operazioni_db = _asincrona(database.recupera_operazioni_db)
+recupera_aggregati_operazioni_db = _asincrona(database.recupera_aggregati_operazioni_db)
+analisi_profitto_storico_db = _asincrona(database.analisi_profitto_storico_db)
+recupera_eventi_db = _asincrona(database.recupera_eventi_db)
+recupera_dati_ohlcv_da_db = _asincrona(database.recupera_dati_ohlcv_da_db)
+salva_candele_db = _asincrona(database.salva_candele_db)
+ultimo_timestamp_candele_db = _asincrona(database.ultimo_timestamp_candele_db)
+primo_timestamp_candele_db = _asincrona(database.primo_timestamp_candele_db)
+recupera_checkpoint_backfill_db = _asincrona(database.recupera_checkpoint_backfill_db)
+recupera_stato_backfill_db = _asincrona(database.recupera_stato_backfill_db)
+salva_blocco_backfill_db = _asincrona(database.salva_blocco_backfill_db)
+ultimo_timestamp_indicatori_db = _asincrona(database.ultimo_timestamp_indicatori_db)
+recupera_indicatori_recenti_db = _asincrona(database.recupera_indicatori_recenti_db)
+salva_indicatori_candele_db = _asincrona(database.salva_indicatori_candele_db)
+add_to_blacklist = _asincrona(database.add_to_blacklist)
+get_blacklisted_pairs_set = _asincrona(database.get_blacklisted_pairs_set)
+get_blacklist_details = _asincrona(database.get_blacklist_details)
+remove_from_blacklist = _asincrona(database.remove_from_blacklist)
+recupera_notifiche = _asincrona(database.recupera_notifiche)
+segna_notifiche_come_lette = _asincrona(database.segna_notifiche_come_lette)
+create_tables = _asincrona(database.create_tables)
+
+# --- Archivio colonnare OHLCV (file mappati in memoria) ---
+aggiungi_candele_colonnari = _asincrona(archivio_ohlcv.aggiungi_candele)
+leggi_serie_colonnare = _asincrona(archivio_ohlcv.leggi_serie)
+ultimo_timestamp_colonnare = _asincrona(archivio_ohlcv.ultimo_timestamp)
+
+
+# --- Scritture differite: accodano soltanto, quindi non serve un thread ---
+async def salva_evento_db(tipo_evento: str, piattaforma: str = None, coppia: str = None, dettagli: str = None):
+    """Accoda il salvataggio di un evento generico nel database."""
+    database.salva_evento_db(tipo_evento, piattaforma=piattaforma, coppia=coppia, dettagli=dettagli)
+
+async def salva_operazione_db(operazione, motivo_vendita: str = None):
+    """Accoda il salvataggio durevole di una singola operazione nel database."""
+    database.salva_operazione_db(operazione, motivo_vendita=motivo_vendita)
+
+async def crea_notifica(titolo: str, messaggio: str):
+    """Accoda la creazione di una nuova notifica nel database."""
+    database.crea_notifica(titolo, messaggio)
+
+async def flush_scritture_db():
+    """Attende senza bloccare l'event loop che le scritture differite accodate siano confermate."""
+    return await asyncio.wrap_future(database.scrittore_differito.richiedi_flush())
+
+
+async def chiudi_database():
+    """Svuota le scritture differite, chiude le connessioni e arresta il pool di thread."""
+    await _in_thread(database.chiudi_connessioni_db)
+    _esecutore_db.shutdown(wait=True)
+    logging.info("Pool di thread del database arrestato.")
@@ -0,0 +1,140 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+import asyncio
+import logging
+import multiprocessing
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+# Valori ammessi per esecuzione_analisi.modalita in config.json:
+# 'processi' (pool di processi), 'thread' (pool di thread, utile se i calcoli rilasciano il GIL)
+# o 'nessuna' (calcolo direttamente nel ciclo asyncio, come in passato)
+MODALITA_ESECUZIONE = ("processi", "thread", "nessuna")
+MODALITA_PREDEFINITA = "processi"
+WORKERS_PREDEFINITI = 2
+
+# Monitoraggio del ciclo asyncio: ogni quanto misurare e oltre quale ritardo un blocco viene contato
+INTERVALLO_MISURA_RITARDO_SECONDI = 0.25
+SOGLIA_BLOCCO_MS = 100
+CAMPIONI_RITARDO = 2400  # ~10 minuti di misure
+
+_esecutore = None
+_modalita = None
+_statistiche_analisi = {'eseguite': 0, 'errori': 0, 'tempo_totale_ms': 0.0, 'tempo_massimo_ms': 0.0}
+
+_campioni_ritardo = deque(maxlen=CAMPIONI_RITARDO)
+_statistiche_ritardo = {'misure': 0, 'blocchi_oltre_soglia': 0, 'ritardo_massimo_ms': 0.0, 'tempo_bloccato_totale_ms': 0.0}
+_task_monitoraggio: Optional[asyncio.Task] = None
+
+
+def _configurazione_esecutore() -> tuple:
+    from .gestore_configurazione import carica_configurazione
+    conf = carica_configurazione().get('esecuzione_analisi') or {}
+    modalita = conf.get('modalita', MODALITA_PREDEFINITA)
+    if modalita not in MODALITA_ESECUZIONE:
+        logging.warning(f"Modalità di esecuzione delle analisi '{modalita}' non valida. Uso '{MODALITA_PREDEFINITA}'.")
+        modalita = MODALITA_PREDEFINITA
+    if modalita == "processi" and getattr(sys, 'frozen', False):
+        # Nell'eseguibile PyInstaller un processo avviato con 'spawn' riesegue l'applicazione
+        # se l'entry point non chiama multiprocessing.freeze_support(): si usano i thread
+        logging.warning("Applicazione eseguita come eseguibile: le analisi useranno un pool di thread invece dei processi.")
+        modalita = "thread"
+    return modalita, max(int(conf.get('workers', WORKERS_PREDEFINITI)), 1)
+
+def _ottieni_esecutore():
+    global _esecutore, _modalita
+    if _modalita is None:
+        _modalita, workers = _configurazione_esecutore()
+        if _modalita == "processi":
+            # 'spawn' anche su Linux: un fork del processo con i thread del database e dell'asyncio attivi non è sicuro
+            _esecutore = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        elif _modalita == "thread":
+            _esecutore = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analisi")
+        logging.info(f"Esecutore delle analisi avviato: modalità '{_modalita}'" + (f", {workers} worker." if _esecutore else "."))
+    return _esecutore
+
+async def esegui_analisi(funzione, *args):
+    """
+    Esegue una funzione di calcolo pura (vedi indicatori_tecnici) fuori dal ciclo asyncio e ne attende il risultato.
+    In modalità 'processi' funzione, argomenti e risultato devono essere serializzabili con pickle.
+    """
+    esecutore = _ottieni_esecutore()
+    inizio = time.perf_counter()
+    try:
+        if esecutore is None:
+            return funzione(*args)
+        return await asyncio.get_running_loop().run_in_executor(esecutore, funzione, *args)
+    except Exception:
+        _statistiche_analisi['errori'] += 1
+        raise
+    finally:
+        durata_ms = (time.perf_counter() - inizio) * 1000
+        _statistiche_analisi['eseguite'] += 1
+        _statistiche_analisi['tempo_totale_ms'] += durata_ms
+        _statistiche_analisi['tempo_massimo_ms'] = max(_statistiche_analisi['tempo_massimo_ms'], durata_ms)
+
+def chiudi_esecutore_analisi():
+    global _esecutore, _modalita
+    if _esecutore is not None:
+        _esecutore.shutdown(wait=False, cancel_futures=True)
+    _esecutore, _modalita = None, None
+
+async def _ciclo_monitoraggio_ritardo():
+    ciclo = asyncio.get_running_loop()
+    while True:
+        atteso = ciclo.time() + INTERVALLO_MISURA_RITARDO_SECONDI
+        await asyncio.sleep(INTERVALLO_MISURA_RITARDO_SECONDI)
+        # Il ritardo del risveglio è il tempo in cui il ciclo era occupato da codice sincrono
+        ritardo_ms = max(ciclo.time() - atteso, 0.0) * 1000
+        _campioni_ritardo.append(ritardo_ms)
+        _statistiche_ritardo['misure'] += 1
+        _statistiche_ritardo['ritardo_massimo_ms'] = max(_statistiche_ritardo['ritardo_massimo_ms'], ritardo_ms)
+        if ritardo_ms >= SOGLIA_BLOCCO_MS:
+            _statistiche_ritardo['blocchi_oltre_soglia'] += 1
+            _statistiche_ritardo['tempo_bloccato_totale_ms'] += ritardo_ms
+
+def avvia_monitoraggio_event_loop():
+    """Avvia il task che misura quanto il ciclo asyncio resta bloccato da codice sincrono."""
+    global _task_monitoraggio
+    if _task_monitoraggio is None or _task_monitoraggio.done():
+        _task_monitoraggio = asyncio.create_task(_ciclo_monitoraggio_ritardo())
+
+async def ferma_monitoraggio_event_loop():
+    global _task_monitoraggio
+    if _task_monitoraggio is not None:
+        _task_monitoraggio.cancel()
+        try:
+            await _task_monitoraggio
+        except asyncio.CancelledError:
+            pass
+        _task_monitoraggio = None
+
+def get_metriche_event_loop() -> dict:
+    """Restituisce i ritardi del ciclo asyncio (ultimi campioni e totali) e i tempi dell'esecutore delle analisi."""
+    campioni = sorted(_campioni_ritardo)
+    percentile = lambda p: round(campioni[min(int(len(campioni) * p), len(campioni) - 1)], 1) if campioni else 0.0
+    eseguite = _statistiche_analisi['eseguite']
+    return {
+        'ritardo_event_loop': {
+            'misure_totali': _statistiche_ritardo['misure'],
+            'campioni': len(campioni),
+            'medio_ms': round(sum(campioni) / len(campioni), 1) if campioni else 0.0,
+            'p50_ms': percentile(0.50),
+            'p99_ms': percentile(0.99),
+            'massimo_ms': round(_statistiche_ritardo['ritardo_massimo_ms'], 1),
+            'soglia_blocco_ms': SOGLIA_BLOCCO_MS,
+            'blocchi_oltre_soglia': _statistiche_ritardo['blocchi_oltre_soglia'],
+            'tempo_bloccato_totale_ms': round(_statistiche_ritardo['tempo_bloccato_totale_ms'], 1),
+        },
+        'esecutore_analisi': {
+            'modalita': _modalita,
+            'eseguite': eseguite,
+            'errori': _statistiche_analisi['errori'],
+            'tempo_medio_ms': round(_statistiche_analisi['tempo_totale_ms'] / eseguite, 1) if eseguite else 0.0,
+            'tempo_massimo_ms': round(_statistiche_analisi['tempo_massimo_ms'], 1),
+        },
+    }
@@ -1,20 +1,102 @@
 # Autore: Pascarella Pasquale Gerardo
-# Versione: 1.0.0
+# Versione: 1.1.0
 
 import json
+import logging
+import os
+import threading
 from .path_manager import CONFIG_PATH
 
+
+class ConfigurazioneSolaLettura(dict):
+    """
+    Dizionario di configurazione non modificabile: la stessa istantanea è condivisa da tutti i chiamanti,
+    quindi nessuno deve poterla alterare. Per ottenerne una copia modificabile usare copia_modificabile().
+    """
+    def _sola_lettura(self, *args, **kwargs):
+        raise TypeError("La configurazione è in sola lettura: usare copia_modificabile() per modificarla.")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _sola_lettura
+
+    def __reduce__(self):
+        # Serializzata (es. verso i processi delle analisi) come dizionario normale
+        return (dict, (dict(self),))
+
+
+def _congela(valore):
+    if isinstance(valore, dict):
+        return ConfigurazioneSolaLettura({chiave: _congela(v) for chiave, v in valore.items()})
+    if isinstance(valore, list):
+        return tuple(_congela(v) for v in valore)
+    return valore
+
+def copia_modificabile(valore):
+    """Restituisce una copia profonda e modificabile (dict e list) della configurazione o di una sua sezione."""
+    if isinstance(valore, dict):
+        return {chiave: copia_modificabile(v) for chiave, v in valore.items()}
+    if isinstance(valore, (list, tuple)):
+        return [copia_modificabile(v) for v in valore]
+    return valore
+
+
+# Istantanea corrente e firma (mtime, dimensione) del file da cui è stata letta
+_lock_configurazione = threading.Lock()
+_configurazione = None
+_firma_file = None
+
+def _firma_config() -> tuple:
+    stato = os.stat(CONFIG_PATH)
+    return (stato.st_mtime_ns, stato.st_size)
+
 def carica_configurazione():
     """
-    Carica la configurazione usando il percorso centralizzato da path_manager.
+    Restituisce la configurazione usando il percorso centralizzato da path_manager.
+    Il file viene riletto solo se data di modifica o dimensione sono cambiate; altrimenti
+    si restituisce l'istantanea in memoria, in sola lettura. Un ciclo che la legge all'inizio
+    lavora quindi su una configurazione coerente anche se il file cambia nel frattempo.
     """
+    global _configurazione, _firma_file
     if not CONFIG_PATH.exists():
         raise FileNotFoundError(f"File di configurazione non trovato in: {CONFIG_PATH}")
-    
-    with open(CONFIG_PATH, 'r') as f:
-        config = json.load(f)
-    
-    return config
+
+    firma = _firma_config()
+    if firma == _firma_file and _configurazione is not None:
+        return _configurazione
+
+    with _lock_configurazione:
+        if firma == _firma_file and _configurazione is not None:
+            return _configurazione
+        try:
+            with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except json.JSONDecodeError as e:
+            if _configurazione is None:
+                raise
+            # File in scrittura da un editor o non valido: si continua con l'ultima configurazione valida
+            logging.error(f"config.json non valido ({e}): mantengo la configurazione caricata in precedenza.")
+            return _configurazione
+        _configurazione = _congela(config)
+        _firma_file = firma
+        logging.debug("Configurazione ricaricata da config.json.")
+        return _configurazione
+
+def salva_configurazione(config: dict):
+    """
+    Salva la configurazione in modo atomico: scrive un file temporaneo nella stessa cartella e lo
+    sostituisce a config.json, così un'interruzione non lascia mai un file scritto a metà.
+    L'istantanea in memoria viene aggiornata subito.
+    """
+    global _configurazione, _firma_file
+    percorso_tmp = CONFIG_PATH.with_name(CONFIG_PATH.name + ".tmp")
+    with _lock_configurazione:
+        with open(percorso_tmp, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(percorso_tmp, CONFIG_PATH)
+        _configurazione = _congela(copia_modificabile(config))
+        _firma_file = _firma_config()
+    logging.info("Configurazione salvata.")
 
 # Esempio di come usarlo (può essere rimosso)
 if __name__ == "__main__":
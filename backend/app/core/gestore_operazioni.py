@@ -11,10 +11,15 @@ from datetime import datetime # Aggiunto
 from ..modelli.portafoglio import Portafoglio
 from ..modelli.operazione import Operazione
 from ..modelli.posizioni import PosizioneAperta # Aggiunto
-from ..core.database import salva_operazione_db, recupera_operazioni_db, salva_evento_db, crea_notifica # Aggiunto crea_notifica
+from ..core.database import recupera_operazioni_db, recupera_aggregati_operazioni_db
+from ..core.aggregati_operazioni import AggregatiOperazioni
+from ..core import database_async as db_async
 from ..core.gestore_configurazione import carica_configurazione # Aggiunto per risolvere NameError
 from ..servizi.instance_manager import get_platform_instance # Importa il nuovo gestore di istanze
 
+# Operazioni più recenti esposte in Portafoglio.storico_operazioni
+OPERAZIONI_STORICO_PORTAFOGLIO = 100
+
 class GestorePortafoglio:
     """
     Gestisce lo stato e le operazioni di un portafoglio di trading.
@@ -23,14 +28,15 @@ class GestorePortafoglio:
     def __init__(self):
         config = carica_configurazione()
         budget_iniziale = config['impostazioni_generali']['budget_totale_usd']
-        operazioni_raw = recupera_operazioni_db()
-        storico_operazioni = [Operazione(**op) for op in operazioni_raw]
         self.portafoglio = Portafoglio(
             budget_usd_iniziale=budget_iniziale,
-            budget_usd_corrente=budget_iniziale, # Verrà sovrascritto dalla riconciliazione
-            storico_operazioni=storico_operazioni
+            budget_usd_corrente=budget_iniziale # Verrà sovrascritto dalla riconciliazione
         )
         self.storico_valore_portafoglio = []
+        # storico_operazioni viene letto dal DB solo alla prima richiesta dello stato del portafoglio
+        self._storico_operazioni_caricato = False
+        # Statistiche sull'intero storico, aggiornate a ogni operazione registrata
+        self.aggregati = AggregatiOperazioni.da_righe_raggruppate(recupera_aggregati_operazioni_db())
         logging.info("GestorePortafoglio inizializzato. In attesa di riconciliazione.")
 
     async def esegui_acquisto(self, piattaforma_id: str, coppia: str, quantita_da_comprare: float, prezzo: float, tipo_ordine: str = 'market', stop_loss_price: float = None):
@@ -69,7 +75,7 @@ class GestorePortafoglio:
                         if 'cost' in fee and isinstance(fee['cost'], (int, float)):
                             commissioni_usd += fee['cost']
                 logging.info(f"ACQUISTO REALE completato: {quantita_eseguita} {coppia} a {prezzo_medio}. Commissioni: {commissioni_usd}")
-                crea_notifica(titolo=f"Acquisto Eseguito: {coppia}", messaggio=f"Acquistati {quantita_eseguita:.6f} di {simbolo_base} al prezzo di {prezzo_medio:.2f} USD.")
+                await db_async.crea_notifica(titolo=f"Acquisto Eseguito: {coppia}", messaggio=f"Acquistati {quantita_eseguita:.6f} di {simbolo_base} al prezzo di {prezzo_medio:.2f} USD.")
 
                 trailing_sl_config = config.get('trailing_stop_loss', {})
                 if trailing_sl_config.get('attiva') and quantita_eseguita > 0:
@@ -78,7 +84,7 @@ class GestorePortafoglio:
                         try:
                             params = {'stopPrice': stop_loss_price}
                             stop_loss_order = await piattaforma_reale.create_order(coppia, 'stop_loss', 'sell', quantita_eseguita, price=None, params=params)
-                            salva_evento_db("PIAZZA_STOP_LOSS", piattaforma=piattaforma_id, coppia=coppia, dettagli=f"ID: {stop_loss_order['id']}")
+                            await db_async.salva_evento_db("PIAZZA_STOP_LOSS", piattaforma=piattaforma_id, coppia=coppia, dettagli=f"ID: {stop_loss_order['id']}")
                         except Exception as sl_error:
                             logging.warning(f"Errore durante il piazzamento dell'ordine stop loss statico: {sl_error}")
                 
@@ -99,7 +105,9 @@ class GestorePortafoglio:
         self.portafoglio.asset[simbolo_base] = self.portafoglio.asset.get(simbolo_base, 0) + quantita_eseguita
         tipo_operazione = f'acquisto_{"reale" if modalita_reale else "simulato"}_{tipo_ordine}'
         nuova_operazione = Operazione(id_operazione=str(uuid.uuid4()), piattaforma=piattaforma_id, coppia=coppia, tipo=tipo_operazione, quantita=quantita_eseguita, prezzo=prezzo_medio, controvalore_usd=(quantita_eseguita * prezzo_medio), commissioni_usd=commissioni_usd, profitto_perdita_operazione=profitto_perdita_operazione)
-        salva_operazione_db(nuova_operazione, motivo_vendita=None)
+        await db_async.salva_operazione_db(nuova_operazione, motivo_vendita=None)
+        self._registra_operazione(nuova_operazione)
+        await self._attendi_salvataggio_operazione(nuova_operazione)
 
         if simbolo_base in self.portafoglio.posizioni_aperte:
             pos = self.portafoglio.posizioni_aperte[simbolo_base]
@@ -171,7 +179,7 @@ class GestorePortafoglio:
                     profitto_perdita_operazione = (quantita_eseguita * prezzo_medio) - commissioni_usd
 
                 logging.info(f"VENDITA REALE completata: {quantita_eseguita} {coppia} a {prezzo_medio}. Commissioni: {commissioni_usd}")
-                crea_notifica(
+                await db_async.crea_notifica(
                     titolo=f"Vendita Eseguita: {coppia}",
                     messaggio=f"Venduti {quantita_eseguita:.6f} di {simbolo_base} a {prezzo_medio:.2f}. P/L: {profitto_perdita_operazione:.2f} USD"
                 )
@@ -222,49 +230,50 @@ class GestorePortafoglio:
 
         tipo_operazione = f'vendita_{"reale" if modalita_reale else "simulata"}_{tipo_ordine}'
         nuova_operazione = Operazione(id_operazione=str(uuid.uuid4()), piattaforma=piattaforma_id, coppia=coppia, tipo=tipo_operazione, quantita=quantita_eseguita, prezzo=prezzo_medio, controvalore_usd=(quantita_eseguita * prezzo_medio), commissioni_usd=commissioni_usd, profitto_perdita_operazione=profitto_perdita_operazione, percentuale_profitto_perdita=percentuale_profitto_perdita)
-        salva_operazione_db(nuova_operazione, motivo_vendita=motivo)
+        await db_async.salva_operazione_db(nuova_operazione, motivo_vendita=motivo)
+        self._registra_operazione(nuova_operazione)
+        await self._attendi_salvataggio_operazione(nuova_operazione)
         return nuova_operazione
 
+    def _registra_operazione(self, operazione: Operazione):
+        """Aggiorna gli aggregati e, se già caricato, lo storico delle operazioni recenti del portafoglio."""
+        self.aggregati.registra(operazione)
+        if self._storico_operazioni_caricato:
+            storico = self.portafoglio.storico_operazioni
+            storico.insert(0, operazione)
+            del storico[OPERAZIONI_STORICO_PORTAFOGLIO:]
+
+    async def _attendi_salvataggio_operazione(self, operazione):
+        """
+        Attende che l'operazione accodata sia confermata su disco, così lo storico e i report
+        letti dal database subito dopo la includono già.
+        """
+        try:
+            await db_async.flush_scritture_db()
+        except Exception as e:
+            logging.error(f"Salvataggio dell'operazione {operazione.id_operazione} non confermato: {e}")
+
     def ottieni_stato_portafoglio(self):
+        if not self._storico_operazioni_caricato:
+            try:
+                # I campi NULL delle righe più vecchie prendono il valore predefinito del modello
+                self.portafoglio.storico_operazioni = [
+                    Operazione(**{campo: valore for campo, valore in op.items() if valore is not None})
+                    for op in recupera_operazioni_db(OPERAZIONI_STORICO_PORTAFOGLIO)
+                ]
+                self._storico_operazioni_caricato = True
+            except Exception as e:
+                logging.error(f"Impossibile caricare lo storico delle operazioni del portafoglio: {e}")
         return self.portafoglio
 
     def ottieni_storico_valore_portafoglio(self):
         return self.storico_valore_portafoglio
     
     def calcola_report_performance(self):
-        profitto_perdita_totale = 0.0
-        operazioni_vincenti = 0
-        operazioni_perdenti = 0
-        for op in self.portafoglio.storico_operazioni:
-            if 'vendita' in op.tipo:
-                profitto_perdita_totale += op.profitto_perdita_operazione
-                if op.profitto_perdita_operazione > 0:
-                    operazioni_vincenti += 1
-                elif op.profitto_perdita_operazione < 0:
-                    operazioni_perdenti += 1
-        numero_totale_operazioni = len(self.portafoglio.storico_operazioni)
-        percentuale_profitto = (profitto_perdita_totale / self.portafoglio.budget_usd_iniziale) * 100 if self.portafoglio.budget_usd_iniziale > 0 else 0
-        return {
-            "profitto_perdita_totale_usd": profitto_perdita_totale,
-            "percentuale_profitto": percentuale_profitto,
-            "operazioni_vincenti": operazioni_vincenti,
-            "operazioni_perdenti": operazioni_perdenti,
-            "numero_totale_operazioni": numero_totale_operazioni
-        }
+        return self.aggregati.report_performance(self.portafoglio.budget_usd_iniziale)
 
     def get_analisi_operazioni(self):
-        analisi_per_tipo = {}
-        analisi_per_coppia = {}
-        analisi_per_piattaforma = {}
-        for op in self.portafoglio.storico_operazioni:
-            analisi_per_tipo[op.tipo] = analisi_per_tipo.get(op.tipo, 0) + 1
-            analisi_per_coppia[op.coppia] = analisi_per_coppia.get(op.coppia, 0) + op.controvalore_usd
-            analisi_per_piattaforma[op.piattaforma] = analisi_per_piattaforma.get(op.piattaforma, 0) + op.controvalore_usd
-        return {
-            "operazioni_per_tipo": analisi_per_tipo,
-            "controvalore_per_coppia": analisi_per_coppia,
-            "controvalore_per_piattaforma": analisi_per_piattaforma,
-        }
+        return self.aggregati.analisi_operazioni()
 
     async def reconcile_balances_with_exchange(self):
         from ..core.gestore_configurazione import carica_configurazione
@@ -310,7 +319,7 @@ class GestorePortafoglio:
 
         crypto_assets_value_usd = 0.0
         for asset, quantita in reconciled_assets.items():
-            prezzo = get_prezzo_cache(asset, quote_currency_for_cache)
+            prezzo = get_prezzo_cache(asset, quote_currency_for_cache, first_active_platform_name)
             if prezzo is not None:
                 valore_asset = quantita * prezzo
                 crypto_assets_value_usd += valore_asset
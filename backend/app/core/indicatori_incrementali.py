@@ -0,0 +1,261 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+import logging
+import math
+from collections import OrderedDict, deque
+from typing import Optional
+
+NAN = float('nan')
+
+# Dopo quanti aggiornamenti le somme mobili vengono ricalcolate da zero, per azzerare l'errore accumulato
+RISINCRONIZZA_OGNI = 1000
+# Serie (exchange, coppia, timeframe, parametri) per cui si mantiene lo stato degli indicatori
+MAX_MOTORI_INDICATORI = 512
+
+
+def _dividi(numeratore: float, denominatore: float) -> float:
+    """Divisione con la semantica di pandas/NumPy: x/0 = ±inf, 0/0 = NaN, invece di un'eccezione."""
+    if denominatore == 0:
+        if numeratore == 0 or math.isnan(numeratore):
+            return NAN
+        return math.copysign(math.inf, numeratore) * math.copysign(1.0, denominatore)
+    return numeratore / denominatore
+
+
+class FinestraMobile:
+    """
+    Media e deviazione standard su una finestra di `periodo` valori, aggiornate in O(1)
+    come rolling(periodo).mean() e rolling(periodo).std() di pandas.
+    """
+    def __init__(self, periodo: int):
+        self.periodo = periodo
+        self.valori = deque(maxlen=periodo)
+        self._riferimento = None  # Le somme sono calcolate sugli scarti da questo valore, per limitare la cancellazione numerica
+        self._somma = 0.0
+        self._somma_quadrati = 0.0
+        self._non_zero = 0
+        self._aggiornamenti = 0
+        # Valori uguali consecutivi in coda: una finestra costante ha media esatta e deviazione nulla, come in pandas
+        self._uguali = 0
+        self._uguali_precedente = 0
+
+    def _togli(self, valore: float):
+        scarto = valore - self._riferimento
+        self._somma -= scarto
+        self._somma_quadrati -= scarto * scarto
+        self._non_zero -= valore != 0
+
+    def _metti(self, valore: float):
+        scarto = valore - self._riferimento
+        self._somma += scarto
+        self._somma_quadrati += scarto * scarto
+        self._non_zero += valore != 0
+
+    def _risincronizza(self):
+        self._riferimento = self.valori[-1]
+        self._somma = self._somma_quadrati = 0.0
+        self._non_zero = 0
+        for valore in self.valori:
+            self._metti(valore)
+        self._aggiornamenti = 0
+
+    def aggiungi(self, valore: float):
+        if self._riferimento is None:
+            self._riferimento = valore
+        if len(self.valori) == self.periodo:
+            self._togli(self.valori[0])
+        self._uguali_precedente = self._uguali
+        self._uguali = self._uguali + 1 if self.valori and self.valori[-1] == valore else 1
+        self.valori.append(valore)
+        self._metti(valore)
+        self._aggiornamenti += 1
+        if self._aggiornamenti >= RISINCRONIZZA_OGNI:
+            self._risincronizza()
+
+    def rivedi(self, valore: float):
+        """Sostituisce l'ultimo valore aggiunto (candela ancora aperta)."""
+        self._togli(self.valori[-1])
+        self._uguali = self._uguali_precedente + 1 if len(self.valori) > 1 and self.valori[-2] == valore else 1
+        self.valori[-1] = valore
+        self._metti(valore)
+
+    def media(self) -> float:
+        if len(self.valori) < self.periodo:
+            return NAN
+        if not self._non_zero:
+            return 0.0
+        if self._uguali >= self.periodo:
+            return self.valori[-1]
+        return self._riferimento + self._somma / self.periodo
+
+    def deviazione_standard(self) -> float:
+        n = len(self.valori)
+        if n < self.periodo or n < 2:
+            return NAN
+        if self._uguali >= self.periodo:
+            return 0.0
+        varianza = (self._somma_quadrati - self._somma * self._somma / n) / (n - 1)
+        return math.sqrt(varianza) if varianza > 0 else 0.0
+
+
+class MediaEsponenziale:
+    """
+    Media mobile esponenziale aggiornata in O(1), identica a ewm(span=periodo, adjust=False).mean() di pandas,
+    compreso il trattamento dei NaN: quelli iniziali vengono saltati, quelli intermedi ripetono l'ultimo
+    valore e riducono il peso dello stato precedente alla prossima osservazione valida.
+    """
+    def __init__(self, periodo: int):
+        self.alfa = 2.0 / (periodo + 1.0)
+        self.valore = NAN
+        self._peso_precedente = 1.0
+        self._stato_precedente = (NAN, 1.0)
+
+    def aggiungi(self, x: float) -> float:
+        self._stato_precedente = (self.valore, self._peso_precedente)
+        osservazione = not math.isnan(x)
+        if not math.isnan(self.valore):
+            self._peso_precedente *= 1.0 - self.alfa
+            if osservazione:
+                if self.valore != x:
+                    self.valore = (self._peso_precedente * self.valore + self.alfa * x) / (self._peso_precedente + self.alfa)
+                self._peso_precedente = 1.0
+        elif osservazione:
+            self.valore = x
+        return self.valore
+
+    def rivedi(self, x: float) -> float:
+        """Ricalcola l'ultimo passo con un nuovo valore (candela ancora aperta)."""
+        self.valore, self._peso_precedente = self._stato_precedente
+        return self.aggiungi(x)
+
+
+class MotoreIndicatori:
+    """
+    Stato incrementale degli indicatori di una serie OHLCV: SMA, RSI, MACD, Bande di Bollinger e ADX.
+    Ogni nuova candela aggiorna tutti gli indicatori in O(1); una candela con lo stesso timestamp
+    dell'ultima (ancora aperta) sostituisce il passo precedente invece di aggiungerne uno.
+    I valori coincidono con quelli di calcola_sma, calcola_rsi, calcola_macd, calcola_bollinger_bands
+    e calcola_adx applicati all'intera serie ricevuta dal motore.
+    """
+    def __init__(self, params: dict):
+        self.params = params
+        self.ultimo_timestamp = None
+        self.candele = 0
+        self._ultima = None       # (high, low, close) dell'ultima candela
+        self._penultima = None    # (high, low, close) della candela precedente, per le revisioni
+        self.sma = FinestraMobile(params['sma_periodo'])
+        self.guadagni = FinestraMobile(params['rsi_periodo'])
+        self.perdite = FinestraMobile(params['rsi_periodo'])
+        self.ema_veloce = MediaEsponenziale(params['macd_periodo_veloce'])
+        self.ema_lenta = MediaEsponenziale(params['macd_periodo_lento'])
+        self.ema_segnale = MediaEsponenziale(params['macd_periodo_segnale'])
+        self.bollinger = FinestraMobile(params.get('bollinger_periodo', 20))
+        periodo_adx = params.get('adx_periodo', 14)
+        self.atr = MediaEsponenziale(periodo_adx)
+        self.dm_positivo = MediaEsponenziale(periodo_adx)
+        self.dm_negativo = MediaEsponenziale(periodo_adx)
+        self.adx = MediaEsponenziale(periodo_adx)
+        self.valori = {}
+
+    def _passo(self, candela, precedente: Optional[tuple], revisione: bool):
+        _, _, high, low, close, _ = candela[:6]
+        metodo = 'rivedi' if revisione else 'aggiungi'
+
+        # SMA e Bollinger sulle chiusure
+        getattr(self.sma, metodo)(close)
+        getattr(self.bollinger, metodo)(close)
+
+        # RSI: come delta.where(...) in calcola_rsi, il primo delta (NaN) conta come 0
+        delta = close - precedente[2] if precedente else 0.0
+        getattr(self.guadagni, metodo)(delta if delta > 0 else 0.0)
+        getattr(self.perdite, metodo)(-delta if delta < 0 else 0.0)
+
+        # MACD
+        macd_line = getattr(self.ema_veloce, metodo)(close) - getattr(self.ema_lenta, metodo)(close)
+        signal_line = getattr(self.ema_segnale, metodo)(macd_line)
+
+        # ADX: sulla prima candela TR = high - low, +DM = 0 e -DM = NaN, come in calcola_adx
+        if precedente:
+            high_prec, low_prec, close_prec = precedente
+            tr = max(high - low, abs(high - close_prec), abs(low - close_prec))
+            plus_dm = max(high - high_prec, 0.0)
+            minus_dm = max(low_prec - low, 0.0)
+            if plus_dm > minus_dm:
+                minus_dm = 0.0
+            else:
+                plus_dm = 0.0
+        else:
+            tr, plus_dm, minus_dm = high - low, 0.0, NAN
+        atr = getattr(self.atr, metodo)(tr)
+        plus_di = _dividi(getattr(self.dm_positivo, metodo)(plus_dm), atr) * 100
+        minus_di = _dividi(getattr(self.dm_negativo, metodo)(minus_dm), atr) * 100
+        dx = _dividi(abs(plus_di - minus_di), plus_di + minus_di) * 100
+        adx = getattr(self.adx, metodo)(dx)
+
+        sma = self.sma.media()
+        deviazione = self.bollinger.deviazione_standard() * self.params.get('bollinger_deviazioni_std', 2)
+        media_bollinger = self.bollinger.media()
+        self.valori = {
+            "sma": sma,
+            "rsi": 100 - _dividi(100, 1 + _dividi(self.guadagni.media(), self.perdite.media())),
+            "macd_line": macd_line,
+            "signal_line": signal_line,
+            "macd_histogram": macd_line - signal_line,
+            "bollinger_superiore": media_bollinger + deviazione,
+            "bollinger_media": media_bollinger,
+            "bollinger_inferiore": media_bollinger - deviazione,
+            "adx": adx,
+            "plus_di": plus_di,
+            "minus_di": minus_di,
+        }
+
+    def aggiorna(self, candela) -> dict:
+        """
+        Applica una candela [timestamp, open, high, low, close, volume].
+        Restituisce i valori correnti degli indicatori; le candele più vecchie dell'ultima vengono ignorate.
+        """
+        timestamp = candela[0]
+        high, low, close = candela[2], candela[3], candela[4]
+        if self.ultimo_timestamp is not None and timestamp < self.ultimo_timestamp:
+            return self.valori
+        if timestamp == self.ultimo_timestamp:
+            self._passo(candela, self._penultima, revisione=True)
+        else:
+            self._passo(candela, self._ultima, revisione=False)
+            self._penultima = self._ultima
+            self.candele += 1
+        self._ultima = (high, low, close)
+        self.ultimo_timestamp = timestamp
+        return self.valori
+
+    def aggiorna_serie(self, candele: list) -> dict:
+        """Applica in ordine le candele non ancora viste (e la revisione dell'ultima)."""
+        for candela in candele:
+            if self.ultimo_timestamp is None or candela[0] >= self.ultimo_timestamp:
+                self.aggiorna(candela)
+        return self.valori
+
+
+# Motori attivi, dal meno al più recentemente usato
+_motori: "OrderedDict[tuple, MotoreIndicatori]" = OrderedDict()
+
+
+def indicatori_incrementali(exchange: str, coppia: str, timeframe: str, params: dict, candele: list) -> dict:
+    """
+    Aggiorna il motore della serie con le candele ricevute e restituisce i valori correnti degli indicatori.
+    Il motore viene (ri)costruito dall'intero blocco di candele se non esiste, se i parametri sono cambiati
+    o se tra l'ultima candela vista e il blocco ricevuto c'è un buco.
+    """
+    chiave = (exchange, coppia, timeframe, tuple(sorted(params.items())))
+    motore = _motori.get(chiave)
+    if motore is not None and candele and motore.ultimo_timestamp < candele[0][0]:
+        logging.debug(f"Buco nella serie {coppia} ({timeframe}) su {exchange}: ricostruisco gli indicatori.")
+        motore = None
+    if motore is None:
+        motore = MotoreIndicatori(params)
+        _motori[chiave] = motore
+        while len(_motori) > MAX_MOTORI_INDICATORI:
+            _motori.popitem(last=False)
+    _motori.move_to_end(chiave)
+    return motore.aggiorna_serie(candele)
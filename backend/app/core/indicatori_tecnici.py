@@ -0,0 +1,336 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+# Funzioni di calcolo pure (nessun I/O, nessuno stato globale): possono essere eseguite
+# in un processo separato dall'esecutore delle analisi.
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# --- Funzioni di Analisi Tecnica ---
+
+def calcola_sma(dati: pd.DataFrame, periodo: int = 20) -> pd.Series:
+    """
+    Calcola la Media Mobile Semplice (SMA).
+    """
+    return dati['close'].rolling(window=periodo).mean()
+
+def calcola_rsi(dati: pd.DataFrame, periodo: int = 14) -> pd.Series:
+    """
+    Calcola l'Indice di Forza Relativa (RSI).
+    """
+    delta = dati['close'].diff()
+    guadagno = (delta.where(delta > 0, 0)).rolling(window=periodo).mean()
+    perdita = (-delta.where(delta < 0, 0)).rolling(window=periodo).mean()
+    
+    rs = guadagno / perdita
+    rsi = 100 - (100 / (1 + rs))
+    return rsi
+
+def calcola_macd(dati: pd.DataFrame, periodo_veloce: int = 12, periodo_lento: int = 26, periodo_segnale: int = 9):
+    """
+    Calcola il Moving Average Convergence Divergence (MACD).
+    """
+    ema_veloce = dati['close'].ewm(span=periodo_veloce, adjust=False).mean()
+    ema_lenta = dati['close'].ewm(span=periodo_lento, adjust=False).mean()
+    macd_line = ema_veloce - ema_lenta
+    signal_line = macd_line.ewm(span=periodo_segnale, adjust=False).mean()
+    histogram = macd_line - signal_line
+    return macd_line, signal_line, histogram
+
+def calcola_bollinger_bands(dati: pd.DataFrame, periodo: int = 20, deviazioni_std: int = 2):
+    """
+    Calcola le Bande di Bollinger.
+    """
+    sma = dati['close'].rolling(window=periodo).mean()
+    std = dati['close'].rolling(window=periodo).std()
+    upper_band = sma + (std * deviazioni_std)
+    lower_band = sma - (std * deviazioni_std)
+    return upper_band, sma, lower_band
+
+def calcola_adx(dati: pd.DataFrame, periodo: int = 14):
+    """
+    Calcola l'Average Directional Index (ADX).
+    """
+    # True Range (TR)
+    tr1 = dati['high'] - dati['low']
+    tr2 = abs(dati['high'] - dati['close'].shift(1))
+    tr3 = abs(dati['low'] - dati['close'].shift(1))
+    tr = pd.DataFrame({'tr1': tr1, 'tr2': tr2, 'tr3': tr3}).max(axis=1)
+
+    # Directional Movement (DM)
+    plus_dm = dati['high'].diff()
+    minus_dm = dati['low'].diff() * -1
+
+    plus_dm[plus_dm < 0] = 0
+    minus_dm[minus_dm < 0] = 0
+
+    # Correzione per quando il low corrente è maggiore del low precedente
+    # e l'high corrente è minore dell'high precedente
+    idx = (plus_dm > minus_dm)
+    plus_dm[~idx] = 0
+    minus_dm[idx] = 0
+
+    # Average True Range (ATR)
+    atr = tr.ewm(span=periodo, adjust=False).mean()
+
+    # Smoothed Directional Movement
+    plus_di = (plus_dm.ewm(span=periodo, adjust=False).mean() / atr) * 100
+    minus_di = (minus_dm.ewm(span=periodo, adjust=False).mean() / atr) * 100
+
+    # DX
+    dx = (abs(plus_di - minus_di) / (plus_di + minus_di)) * 100
+
+    # ADX
+    adx = dx.ewm(span=periodo, adjust=False).mean()
+
+    return adx, plus_di, minus_di
+
+# --- Kernel NumPy ---
+# Stessi risultati delle funzioni pandas qui sopra (NaN iniziali compresi), ma su array float grezzi
+# e senza costruire DataFrame: per serie di un centinaio di candele l'overhead di pandas supera il calcolo.
+
+def colonne_ohlcv(dati_ohlcv) -> dict:
+    """Converte le candele [timestamp, open, high, low, close, volume] di ccxt o del DB in un array per colonna."""
+    matrice = np.asarray(dati_ohlcv, dtype=np.float64).reshape(-1, 6)
+    return {colonna: matrice[:, indice] for indice, colonna in enumerate(('timestamp', 'open', 'high', 'low', 'close', 'volume'))}
+
+def _media_mobile(valori: np.ndarray, periodo: int) -> np.ndarray:
+    risultato = np.full(len(valori), np.nan)
+    if len(valori) >= periodo:
+        risultato[periodo - 1:] = sliding_window_view(valori, periodo).mean(axis=1)
+    return risultato
+
+def calcola_ema_array(valori: np.ndarray, periodo: int) -> np.ndarray:
+    """
+    Equivalente di ewm(span=periodo, adjust=False).mean(): i NaN iniziali restano NaN,
+    quelli intermedi ripetono l'ultimo valore e riducono il peso dello stato alla prossima osservazione.
+    """
+    alfa = 2.0 / (periodo + 1.0)
+    risultato = np.empty(len(valori))
+    media, peso = np.nan, 1.0
+    # Ciclo su float Python: per un centinaio di valori è più rapido di qualsiasi alternativa vettoriale
+    for i, x in enumerate(np.asarray(valori, dtype=np.float64).tolist()):
+        if media == media:
+            peso *= 1.0 - alfa
+            if x == x:
+                if media != x:
+                    media = (peso * media + alfa * x) / (peso + alfa)
+                peso = 1.0
+        elif x == x:
+            media = x
+        risultato[i] = media
+    return risultato
+
+def calcola_sma_array(chiusure: np.ndarray, periodo: int = 20) -> np.ndarray:
+    return _media_mobile(chiusure, periodo)
+
+def calcola_rsi_array(chiusure: np.ndarray, periodo: int = 14) -> np.ndarray:
+    # Come delta.where(...) in calcola_rsi, il primo delta (NaN) conta come 0
+    delta = np.diff(chiusure, prepend=np.nan)
+    guadagno = _media_mobile(np.where(delta > 0, delta, 0.0), periodo)
+    perdita = _media_mobile(np.where(delta < 0, -delta, 0.0), periodo)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - (100 / (1 + guadagno / perdita))
+
+def calcola_macd_array(chiusure: np.ndarray, periodo_veloce: int = 12, periodo_lento: int = 26, periodo_segnale: int = 9):
+    macd_line = calcola_ema_array(chiusure, periodo_veloce) - calcola_ema_array(chiusure, periodo_lento)
+    signal_line = calcola_ema_array(macd_line, periodo_segnale)
+    return macd_line, signal_line, macd_line - signal_line
+
+def calcola_bollinger_bands_array(chiusure: np.ndarray, periodo: int = 20, deviazioni_std: int = 2):
+    sma = _media_mobile(chiusure, periodo)
+    std = np.full(len(chiusure), np.nan)
+    if len(chiusure) >= periodo:
+        std[periodo - 1:] = sliding_window_view(chiusure, periodo).std(axis=1, ddof=1)
+    return sma + std * deviazioni_std, sma, sma - std * deviazioni_std
+
+def calcola_adx_array(high: np.ndarray, low: np.ndarray, close: np.ndarray, periodo: int = 14):
+    close_precedente = np.concatenate(([np.nan], close[:-1]))
+    # fmax ignora i NaN: sulla prima candela TR = high - low, come il max(axis=1) di pandas
+    tr = np.fmax(high - low, np.fmax(np.abs(high - close_precedente), np.abs(low - close_precedente)))
+
+    plus_dm = np.diff(high, prepend=np.nan)
+    minus_dm = -np.diff(low, prepend=np.nan)
+    plus_dm[plus_dm < 0] = 0
+    minus_dm[minus_dm < 0] = 0
+    # Sulla prima candela il confronto con NaN è falso: +DM diventa 0, -DM resta NaN
+    idx = plus_dm > minus_dm
+    plus_dm[~idx] = 0
+    minus_dm[idx] = 0
+
+    atr = calcola_ema_array(tr, periodo)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plus_di = (calcola_ema_array(plus_dm, periodo) / atr) * 100
+        minus_di = (calcola_ema_array(minus_dm, periodo) / atr) * 100
+        dx = (np.abs(plus_di - minus_di) / (plus_di + minus_di)) * 100
+    adx = calcola_ema_array(dx, periodo)
+    return adx, plus_di, minus_di
+
+def calcola_momentum_pannello(chiusure: np.ndarray, periodo_rsi: int = 14) -> dict:
+    """
+    Calcola performance a 7 e 30 giorni, RSI e punteggio di momentum per molti simboli insieme.
+    `chiusure` è un pannello (simboli x candele) di chiusure giornaliere allineate a destra:
+    l'ultima colonna è la candela più recente. Servono almeno 31 candele valide per simbolo.
+    L'RSI è quello di calcola_rsi (medie semplici di guadagni e perdite) all'ultima candela.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prezzo_attuale = chiusure[:, -1]
+        prezzo_7d_fa = chiusure[:, -8]  # -1 è oggi, -8 è 7 giorni fa
+        prezzo_30d_fa = chiusure[:, -31]
+        perf_7d = (prezzo_attuale - prezzo_7d_fa) / prezzo_7d_fa
+        perf_30d = (prezzo_attuale - prezzo_30d_fa) / prezzo_30d_fa
+
+        delta = np.diff(chiusure[:, -(periodo_rsi + 1):], axis=1)
+        guadagno = np.where(delta > 0, delta, 0.0).mean(axis=1)
+        perdita = np.where(delta < 0, -delta, 0.0).mean(axis=1)
+        rsi = 100 - (100 / (1 + guadagno / perdita))
+
+    # Ponderazione: 60% performance 7gg, 20% performance 30gg, 20% RSI normalizzato in 0-1
+    punteggio_momentum = (perf_7d * 0.6) + (perf_30d * 0.2) + ((rsi / 100) * 0.2)
+    return {
+        'ultimo_prezzo': prezzo_attuale,
+        'performance_7d': perf_7d,
+        'performance_30d': perf_30d,
+        'rsi': rsi,
+        'punteggio_momentum': punteggio_momentum,
+    }
+
+# --- Funzione di Riconoscimento Pattern Grafici Semplificata ---
+def riconosci_pattern_grafico(df: pd.DataFrame) -> dict:
+    """
+    Riconosce pattern grafici semplici basati sulle ultime candele.
+    Questa è una simulazione/placeholder per un'analisi più complessa.
+    """
+    if len(df) < 2: # Necessita di almeno 2 candele per alcuni pattern
+        return {"pattern": "NESSUN_PATTERN", "motivazione_pattern": "Dati insufficienti per il riconoscimento pattern."}
+
+    ultima_candela = df.iloc[-1]
+    penultima_candela = df.iloc[-2]
+
+    # Doji: Open e Close sono molto vicini
+    if abs(ultima_candela['open'] - ultima_candela['close']) < (ultima_candela['high'] - ultima_candela['low']) * 0.1:
+        return {"pattern": "DOJI", "motivazione_pattern": "Pattern Doji: indica indecisione del mercato."}
+
+    # Hammer / Hanging Man (corpo piccolo, ombra inferiore lunga)
+    body_size = abs(ultima_candela['open'] - ultima_candela['close'])
+    lower_wick = min(ultima_candela['open'], ultima_candela['close']) - ultima_candela['low']
+    upper_wick = ultima_candela['high'] - max(ultima_candela['open'], ultima_candela['close'])
+
+    if body_size < (ultima_candela['high'] - ultima_candela['low']) * 0.3 and lower_wick > 2 * body_size and upper_wick < body_size:
+        if ultima_candela['close'] > ultima_candela['open']: # Bullish Hammer
+            return {"pattern": "HAMMER_RIALZISTA", "motivazione_pattern": "Pattern Hammer Rialzista: potenziale inversione rialzista."}
+        else: # Bearish Hanging Man
+            return {"pattern": "HANGING_MAN_RIBASSISTA", "motivazione_pattern": "Pattern Hanging Man Ribassista: potenziale inversione ribassista."}
+
+    # Bullish Engulfing: Corpo verde che ingloba completamente il corpo rosso precedente
+    if (ultima_candela['close'] > ultima_candela['open'] and penultima_candela['close'] < penultima_candela['open'] and
+        ultima_candela['close'] > penultima_candela['open'] and ultima_candela['open'] < penultima_candela['close']):
+        return {"pattern": "ENGULFING_RIALZISTA", "motivazione_pattern": "Pattern Engulfing Rialzista: forte segnale di inversione rialzista."}
+
+    # Bearish Engulfing: Corpo rosso che ingloba completamente il corpo verde precedente
+    if (ultima_candela['close'] < ultima_candela['open'] and penultima_candela['close'] > penultima_candela['open'] and
+        ultima_candela['close'] < penultima_candela['open'] and ultima_candela['open'] > penultima_candela['close']):
+        return {"pattern": "ENGULFING_RIBASSISTA", "motivazione_pattern": "Pattern Engulfing Ribassista: forte segnale di inversione ribassista."}
+
+    return {"pattern": "NESSUN_PATTERN", "motivazione_pattern": "Nessun pattern grafico riconoscibile."}
+
+# --- Funzione di Previsione Serie Temporali Semplificata ---
+def prevedi_movimento_futuro(df: pd.DataFrame) -> dict:
+    """
+    Prevede il movimento futuro del prezzo basandosi su una logica semplificata.
+    Questa è una simulazione/placeholder per un modello ML più complesso (es. LSTM/ARIMA).
+    """
+    if len(df) < 5: # Necessita di almeno 5 candele per una tendenza minima
+        return {"previsione": "INCERTO", "motivazione_previsione": "Dati insufficienti per la previsione."}
+
+    # Calcola la media degli ultimi 3 prezzi di chiusura e la confronta con la media dei 3 precedenti
+    ultimi_3_prezzi = df['close'].iloc[-3:].mean()
+    precedenti_3_prezzi = df['close'].iloc[-6:-3].mean()
+
+    if ultimi_3_prezzi > precedenti_3_prezzi * 1.005: # Aumento significativo (0.5%)
+        return {"previsione": "UP", "motivazione_previsione": "Prezzo in aumento nelle ultime candele."}
+    elif ultimi_3_prezzi < precedenti_3_prezzi * 0.995: # Diminuzione significativa (0.5%)
+        return {"previsione": "DOWN", "motivazione_previsione": "Prezzo in diminuzione nelle ultime candele."}
+    else:
+        return {"previsione": "SIDEWAYS", "motivazione_previsione": "Prezzo relativamente stabile nelle ultime candele."}
+
+# --- Analisi di un singolo timeframe ---
+# Candele chiuse su cui indicatori_candele_chiuse calcola gli indicatori: è anche la finestra su cui vengono calcolati gli indicatori precalcolati
+CANDELE_FINESTRA_INDICATORI = 100
+# Parametri da cui dipendono gli indicatori salvati per candela
+PARAMETRI_INDICATORI_PRECALCOLATI = ('sma_periodo', 'rsi_periodo', 'macd_periodo_veloce', 'macd_periodo_lento', 'macd_periodo_segnale')
+
+def calcola_indicatori_timeframe(dati_ohlcv: list, params: dict) -> dict:
+    """
+    Calcola con i kernel NumPy gli indicatori usati da indicatori_candele_chiuse sull'ultima candela.
+    Riceve le candele grezze [timestamp, open, high, low, close, volume] e restituisce solo numeri.
+    """
+    chiusure = colonne_ohlcv(dati_ohlcv)['close']
+    sma = calcola_sma_array(chiusure, params['sma_periodo'])
+    rsi = calcola_rsi_array(chiusure, params['rsi_periodo'])
+    macd_line, signal_line, _ = calcola_macd_array(chiusure, params['macd_periodo_veloce'], params['macd_periodo_lento'], params['macd_periodo_segnale'])
+
+    return {
+        "ultimo_prezzo": float(chiusure[-1]),
+        "rsi": float(rsi[-1]),
+        "sma": float(sma[-1]),
+        "macd_line": float(macd_line[-1]),
+        "signal_line": float(signal_line[-1]),
+    }
+
+def firma_parametri_indicatori(params: dict) -> str:
+    """Identifica i parametri con cui sono stati calcolati gli indicatori salvati: se cambia, quei valori non valgono più."""
+    return ";".join([f"finestra={CANDELE_FINESTRA_INDICATORI}"] + [f"{nome}={params[nome]}" for nome in PARAMETRI_INDICATORI_PRECALCOLATI])
+
+def calcola_indicatori_per_candela(dati_ohlcv, params: dict, ultime: int) -> list:
+    """
+    Calcola gli indicatori di calcola_indicatori_timeframe per ciascuna delle ultime `ultime` candele,
+    ognuna sulla finestra delle CANDELE_FINESTRA_INDICATORI candele che terminano con essa: sono gli stessi
+    valori che indicatori_candele_chiuse ottiene dalle candele scaricate dopo la chiusura di ciascuna.
+    Restituisce tuple (timestamp, close, sma, rsi, macd_line, signal_line) con None al posto dei NaN.
+    """
+    colonne = colonne_ohlcv(dati_ohlcv)
+    timestamp, chiusure = colonne['timestamp'], colonne['close']
+    righe = []
+    for fine in range(max(len(chiusure) - ultime, 0) + 1, len(chiusure) + 1):
+        finestra = chiusure[max(fine - CANDELE_FINESTRA_INDICATORI, 0):fine]
+        sma = calcola_sma_array(finestra, params['sma_periodo'])[-1]
+        rsi = calcola_rsi_array(finestra, params['rsi_periodo'])[-1]
+        macd_line, signal_line, _ = calcola_macd_array(finestra, params['macd_periodo_veloce'], params['macd_periodo_lento'], params['macd_periodo_segnale'])
+        valori = [float(v) if not np.isnan(v) else None for v in (sma, rsi, macd_line[-1], signal_line[-1])]
+        righe.append((int(timestamp[fine - 1]), float(finestra[-1]), *valori))
+    return righe
+
+# --- Analisi di momentum del mercato ---
+def analizza_pannello_asset(candele_per_simbolo: dict) -> list:
+    """
+    Calcola il punteggio di momentum di tutti i simboli con un'unica serie di operazioni vettoriali.
+    `candele_per_simbolo` associa a ogni simbolo le sue candele OHLCV giornaliere (almeno 31).
+    """
+    if not candele_per_simbolo:
+        return []
+    simboli = list(candele_per_simbolo)
+    # Pannello simboli x candele allineato a destra; le serie più corte restano NaN a sinistra
+    lunghezza = max(len(candele) for candele in candele_per_simbolo.values())
+    chiusure = np.full((len(simboli), lunghezza), np.nan)
+    for riga, simbolo in enumerate(simboli):
+        candele = candele_per_simbolo[simbolo]
+        chiusure[riga, lunghezza - len(candele):] = [candela[4] for candela in candele]
+
+    risultati = calcola_momentum_pannello(chiusure)
+    analisi = []
+    for riga, simbolo in enumerate(simboli):
+        rsi = risultati['rsi'][riga]
+        if np.isnan(rsi):
+            continue
+        analisi.append({
+            'simbolo': simbolo,
+            'ultimo_prezzo': float(risultati['ultimo_prezzo'][riga]),
+            'punteggio_momentum': float(risultati['punteggio_momentum'][riga]),
+            'performance_7d': float(risultati['performance_7d'][riga]),
+            'performance_30d': float(risultati['performance_30d'][riga]),
+            'rsi_14d': float(rsi)
+        })
+    return analisi
@@ -0,0 +1,321 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+import logging
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+
+@dataclass(frozen=True)
+class Migrazione:
+    """
+    Una modifica allo schema del database, identificata da un numero di versione crescente.
+    Ogni migrazione deve essere idempotente: rieseguirla su uno schema già aggiornato non ha effetti.
+    """
+    versione: int
+    descrizione: str
+    applica: Callable[[sqlite3.Connection], None]
+
+
+def _colonne_tabella(conn: sqlite3.Connection, tabella: str) -> set:
+    return {riga[1] for riga in conn.execute(f"PRAGMA table_info({tabella})").fetchall()}
+
+def _tipo_colonna(conn: sqlite3.Connection, tabella: str, colonna: str) -> str:
+    for riga in conn.execute(f"PRAGMA table_info({tabella})").fetchall():
+        if riga[1] == colonna:
+            return (riga[2] or "").upper()
+    return ""
+
+def _iso_a_epoch_ms(valore):
+    """Converte un timestamp ISO (ora locale, come prodotto da datetime.now()) in epoch millisecondi."""
+    if valore is None or isinstance(valore, (int, float)):
+        return valore
+    try:
+        return int(datetime.fromisoformat(valore).timestamp() * 1000)
+    except ValueError:
+        logging.warning(f"Timestamp non valido durante la migrazione: {valore!r}. Impostato a 0.")
+        return 0
+
+
+# --- Migrazioni ---
+
+def _schema_iniziale(conn: sqlite3.Connection):
+    # Tabella per i dati delle candele (OHLCV)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS candlesticks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        exchange TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        timeframe TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        open REAL NOT NULL,
+        high REAL NOT NULL,
+        low REAL NOT NULL,
+        close REAL NOT NULL,
+        volume REAL NOT NULL,
+        UNIQUE(exchange, symbol, timeframe, timestamp)
+    );
+    """)
+
+    # Tabella per lo storico del portafoglio
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS portfolio_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER NOT NULL UNIQUE,
+        total_balance_usd REAL NOT NULL,
+        asset_balances TEXT NOT NULL -- JSON con i saldi degli asset
+    );
+    """)
+
+    # Tabella per le operazioni di trading
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS operazioni (
+        id_operazione TEXT PRIMARY KEY,
+        timestamp TEXT NOT NULL,
+        piattaforma TEXT NOT NULL,
+        coppia TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        quantita REAL NOT NULL,
+        prezzo REAL NOT NULL,
+        controvalore_usd REAL NOT NULL,
+        commissioni_usd REAL NOT NULL,
+        profitto_perdita_operazione REAL NOT NULL,
+        motivo_vendita TEXT
+    );
+    """)
+
+    # Tabella per le coppie in blacklist
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS blacklist_coppie (
+        coppia TEXT PRIMARY KEY,
+        motivo_errore TEXT,
+        data_inserimento TEXT NOT NULL
+    );
+    """)
+
+    # Tabella per gli eventi di sistema/bot
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS eventi (
+        id_evento INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        tipo_evento TEXT NOT NULL, -- Es. 'ANNULLA_ORDINE', 'SEGNALE_MANTIENI', 'ERRORE_API'
+        piattaforma TEXT,
+        coppia TEXT,
+        dettagli TEXT -- Un campo JSON o testuale per info aggiuntive
+    );
+    """)
+
+    # Tabella per le notifiche
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS notifiche (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        titolo TEXT NOT NULL,
+        messaggio TEXT NOT NULL,
+        letta INTEGER NOT NULL DEFAULT 0 -- 0 per non letta, 1 per letta
+    );
+    """)
+
+def _percentuale_profitto_operazioni(conn: sqlite3.Connection):
+    # Colonne aggiunte in un secondo momento: i database creati prima non le possiedono
+    # (v4 e v5 le copiano e indicizzano per nome)
+    colonne = _colonne_tabella(conn, 'operazioni')
+    if 'motivo_vendita' not in colonne:
+        conn.execute("ALTER TABLE operazioni ADD COLUMN motivo_vendita TEXT")
+    if 'percentuale_profitto_perdita' not in colonne:
+        conn.execute("ALTER TABLE operazioni ADD COLUMN percentuale_profitto_perdita REAL")
+
+def _indici_letture_per_timestamp(conn: sqlite3.Connection):
+    # Ogni percorso di lettura esegue ORDER BY timestamp DESC LIMIT ?: con questi indici
+    # SQLite legge solo le ultime righe invece di ordinare l'intera tabella.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_operazioni_timestamp ON operazioni(timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_eventi_timestamp_tipo ON eventi(timestamp, tipo_evento)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_notifiche_letta_timestamp ON notifiche(letta, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_notifiche_timestamp ON notifiche(timestamp)")
+
+def _ricostruisci_con_timestamp_intero(conn: sqlite3.Connection, tabella: str, definizione: str, colonne: list, ordine: str):
+    if _tipo_colonna(conn, tabella, 'timestamp') == 'INTEGER':
+        return
+    elenco = ", ".join(colonne)
+    selezione = ", ".join("iso_a_epoch_ms(timestamp)" if c == 'timestamp' else c for c in colonne)
+    conn.execute(f"CREATE TABLE {tabella}_nuova ({definizione})")
+    conn.execute(f"INSERT INTO {tabella}_nuova ({elenco}) SELECT {selezione} FROM {tabella} ORDER BY {ordine}")
+    conn.execute(f"DROP TABLE {tabella}")
+    conn.execute(f"ALTER TABLE {tabella}_nuova RENAME TO {tabella}")
+
+def _timestamp_epoch_millisecondi(conn: sqlite3.Connection):
+    # I timestamp testuali ISO vengono sostituiti da interi in epoch millisecondi:
+    # ordinamento numerico, query per intervallo e indici più compatti.
+    conn.create_function("iso_a_epoch_ms", 1, _iso_a_epoch_ms, deterministic=True)
+    _ricostruisci_con_timestamp_intero(conn, 'operazioni', """
+        id_operazione TEXT PRIMARY KEY,
+        timestamp INTEGER NOT NULL, -- epoch in millisecondi
+        piattaforma TEXT NOT NULL,
+        coppia TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        quantita REAL NOT NULL,
+        prezzo REAL NOT NULL,
+        controvalore_usd REAL NOT NULL,
+        commissioni_usd REAL NOT NULL,
+        profitto_perdita_operazione REAL NOT NULL,
+        motivo_vendita TEXT,
+        percentuale_profitto_perdita REAL
+    """, ['id_operazione', 'timestamp', 'piattaforma', 'coppia', 'tipo', 'quantita', 'prezzo', 'controvalore_usd',
+          'commissioni_usd', 'profitto_perdita_operazione', 'motivo_vendita', 'percentuale_profitto_perdita'], 'rowid')
+    _ricostruisci_con_timestamp_intero(conn, 'eventi', """
+        id_evento INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER NOT NULL, -- epoch in millisecondi
+        tipo_evento TEXT NOT NULL,
+        piattaforma TEXT,
+        coppia TEXT,
+        dettagli TEXT
+    """, ['id_evento', 'timestamp', 'tipo_evento', 'piattaforma', 'coppia', 'dettagli'], 'id_evento')
+    _ricostruisci_con_timestamp_intero(conn, 'notifiche', """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER NOT NULL, -- epoch in millisecondi
+        titolo TEXT NOT NULL,
+        messaggio TEXT NOT NULL,
+        letta INTEGER NOT NULL DEFAULT 0
+    """, ['id', 'timestamp', 'titolo', 'messaggio', 'letta'], 'id')
+    # Gli indici sono stati eliminati insieme alle vecchie tabelle
+    _indici_letture_per_timestamp(conn)
+
+def _indice_operazioni_motivo_vendita(conn: sqlite3.Connection):
+    # Lo storico take profit filtra per motivo_vendita e ordina per timestamp
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_operazioni_motivo_timestamp ON operazioni(motivo_vendita, timestamp)")
+
+def _candele_raggruppate_per_serie(conn: sqlite3.Connection):
+    # Le stringhe exchange/symbol/timeframe vengono codificate una sola volta in serie_candele;
+    # le candele sono salvate in una tabella WITHOUT ROWID ordinata per (id_serie, timestamp),
+    # quindi la lettura di una serie è un unico intervallo contiguo del B-tree primario.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS serie_candele (
+        id_serie INTEGER PRIMARY KEY,
+        exchange TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        timeframe TEXT NOT NULL,
+        UNIQUE(exchange, symbol, timeframe)
+    );
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS candele (
+        id_serie INTEGER NOT NULL REFERENCES serie_candele(id_serie),
+        timestamp INTEGER NOT NULL, -- epoch in secondi
+        open REAL NOT NULL,
+        high REAL NOT NULL,
+        low REAL NOT NULL,
+        close REAL NOT NULL,
+        volume REAL NOT NULL,
+        PRIMARY KEY (id_serie, timestamp)
+    ) WITHOUT ROWID;
+    """)
+    tabelle = {riga[0] for riga in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()}
+    if 'candlesticks' not in tabelle:
+        return
+    conn.execute("""
+        INSERT OR IGNORE INTO serie_candele (exchange, symbol, timeframe)
+        SELECT DISTINCT exchange, symbol, timeframe FROM candlesticks ORDER BY exchange, symbol, timeframe
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO candele (id_serie, timestamp, open, high, low, close, volume)
+        SELECT s.id_serie, c.timestamp, c.open, c.high, c.low, c.close, c.volume
+        FROM candlesticks c
+        JOIN serie_candele s ON s.exchange = c.exchange AND s.symbol = c.symbol AND s.timeframe = c.timeframe
+        ORDER BY s.id_serie, c.timestamp
+    """)
+    conn.execute("DROP TABLE candlesticks")
+
+def _checkpoint_backfill(conn: sqlite3.Connection):
+    # Avanzamento dello scaricamento storico per serie: permette di riprendere dopo un riavvio
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS backfill_checkpoint (
+        id_serie INTEGER PRIMARY KEY REFERENCES serie_candele(id_serie),
+        obiettivo_timestamp INTEGER NOT NULL, -- candela più vecchia richiesta, epoch in secondi
+        piu_vecchio_timestamp INTEGER, -- posizione raggiunta andando a ritroso, epoch in secondi
+        candele_salvate INTEGER NOT NULL DEFAULT 0,
+        stato TEXT NOT NULL, -- 'in_corso', 'completato' o 'errore'
+        ultimo_errore TEXT,
+        aggiornato_il INTEGER NOT NULL -- epoch in millisecondi
+    );
+    """)
+
+def _indicatori_precalcolati(conn: sqlite3.Connection):
+    # Indicatori calcolati al salvataggio delle candele, con la stessa chiave della tabella candele.
+    # firma_parametri identifica i parametri usati: le righe con una firma diversa non sono più valide.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS indicatori_candele (
+        id_serie INTEGER NOT NULL REFERENCES serie_candele(id_serie),
+        timestamp INTEGER NOT NULL, -- epoch in secondi, come in candele
+        firma_parametri TEXT NOT NULL,
+        close REAL NOT NULL,
+        sma REAL,
+        rsi REAL,
+        macd_line REAL,
+        signal_line REAL,
+        calcolato_il INTEGER NOT NULL, -- epoch in millisecondi
+        PRIMARY KEY (id_serie, timestamp)
+    ) WITHOUT ROWID;
+    """)
+
+
+# Elenco ordinato delle migrazioni. Le nuove vanno aggiunte in fondo con versione successiva.
+MIGRAZIONI = [
+    Migrazione(1, "Schema iniziale delle tabelle", _schema_iniziale),
+    Migrazione(2, "Colonne motivo_vendita e percentuale_profitto_perdita su operazioni", _percentuale_profitto_operazioni),
+    Migrazione(3, "Indici per le letture ordinate per timestamp", _indici_letture_per_timestamp),
+    Migrazione(4, "Timestamp interi in epoch millisecondi per operazioni, eventi e notifiche", _timestamp_epoch_millisecondi),
+    Migrazione(5, "Indice su motivo_vendita e timestamp delle operazioni", _indice_operazioni_motivo_vendita),
+    Migrazione(6, "Candele in tabella WITHOUT ROWID raggruppata per serie", _candele_raggruppate_per_serie),
+    Migrazione(7, "Tabella dei checkpoint del backfill storico", _checkpoint_backfill),
+    Migrazione(8, "Tabella degli indicatori precalcolati per candela", _indicatori_precalcolati),
+]
+
+
+def versione_schema(conn: sqlite3.Connection) -> int:
+    """Restituisce l'ultima versione di schema applicata al database (0 se nessuna)."""
+    riga = conn.execute("SELECT MAX(versione) FROM schema_versione").fetchone()
+    return riga[0] or 0
+
+def applica_migrazioni(conn: sqlite3.Connection) -> int:
+    """
+    Applica in ordine le migrazioni non ancora registrate in schema_versione.
+    Ogni migrazione viene eseguita in una propria transazione insieme alla sua registrazione,
+    quindi un errore lascia il database all'ultima versione completata.
+    Restituisce il numero di migrazioni applicate.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_versione (
+        versione INTEGER PRIMARY KEY,
+        descrizione TEXT NOT NULL,
+        applicata_il TEXT NOT NULL
+    );
+    """)
+    conn.commit()
+
+    versione_attuale = versione_schema(conn)
+    applicate = 0
+    for migrazione in MIGRAZIONI:
+        if migrazione.versione <= versione_attuale:
+            continue
+        logging.info(f"Applicazione migrazione database v{migrazione.versione}: {migrazione.descrizione}...")
+        try:
+            conn.execute("BEGIN")
+            migrazione.applica(conn)
+            conn.execute(
+                "INSERT INTO schema_versione (versione, descrizione, applicata_il) VALUES (?, ?, ?)",
+                (migrazione.versione, migrazione.descrizione, datetime.now().isoformat())
+            )
+            conn.commit()
+            applicate += 1
+        except sqlite3.Error:
+            conn.rollback()
+            logging.error(f"Migrazione database v{migrazione.versione} fallita. Schema fermo alla versione {versione_schema(conn)}.")
+            raise
+
+    if applicate:
+        logging.info(f"Schema del database aggiornato alla versione {versione_schema(conn)} ({applicate} migrazioni applicate).")
+    else:
+        logging.info(f"Schema del database già aggiornato (versione {versione_attuale}).")
+    return applicate
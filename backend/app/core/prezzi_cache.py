@@ -1,61 +1,266 @@
 # Autore: Pascarella Pasquale Gerardo
-# Versione: 1.1.0
+# Versione: 1.4.0
 
 import asyncio
 import time
+from collections import OrderedDict
 from typing import Dict, Optional
 import logging
 
-# Dizionario per memorizzare i prezzi in cache
-# Formato: { 'SIMBOLO/QUOTE': { 'prezzo': float, 'timestamp': float } }
-prezzi_cache: Dict[str, Dict[str, float]] = {}
+# Prezzi in cache per piattaforma e coppia, dal meno al più recentemente usato (LRU)
+# Formato: { ('piattaforma', 'SIMBOLO/QUOTE'): { 'prezzo': float, 'timestamp': float, 'via': list | None,
+#                                                'ultimo_accesso': float | None, 'hit': int, 'hit_scaduti': int } }
+# ultimo_accesso è None per i prezzi "freddi", mai letti né richiesti (es. ricevuti con l'istantanea dell'intero mercato)
+prezzi_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+# Numero massimo di prezzi in cache: oltre, viene rimosso quello usato meno di recente
+MAX_VOCI_PREZZI_CACHE = 4096
 
-# Tempo di validità della cache in secondi
+# Tempo di validità della cache in secondi (TTL "soft"): oltre questa età il prezzo viene rinnovato
 CACHE_VALIDITY_SECONDS = 60
+# Età massima (TTL "hard") oltre la quale un prezzo non viene più restituito nemmeno come scaduto
+CACHE_HARD_TTL_SECONDS = 600
+
+# Simboli per ogni chiamata fetch_tickers: oltre questa soglia l'elenco viene diviso in più richieste
+MAX_SIMBOLI_PER_FETCH_TICKERS = 100
+# Richieste fetch_ticker parallele per gli exchange che non supportano fetchTickers
+DIMENSIONE_LOTTO_TICKER_SINGOLI = 10
+
+# Rinnovo in background: ogni quanto controllare la cache
+INTERVALLO_RINNOVO_SECONDI = 10
+# Un prezzo letto negli ultimi FINESTRA_SIMBOLO_CALDO_SECONDI è "caldo" e viene rinnovato
+# in anticipo, quando ha raggiunto questa frazione del TTL soft
+FINESTRA_SIMBOLO_CALDO_SECONDI = 300
+FRAZIONE_RINNOVO_ANTICIPATO = 0.8
+# Un prezzo non letto da questo tempo è "freddo" e viene rimosso dalla cache
+INATTIVITA_EVIZIONE_SECONDI = 1800
+
+# Valute intermedie con cui prezzare un asset senza coppia diretta contro la quote (es. X/BTC × BTC/USDC)
+VALUTE_PONTE = ('BTC', 'ETH', 'USDT', 'USDC', 'BNB')
+# Per quanto tempo una coppia né quotata né triangolabile non viene più richiesta all'exchange
+TTL_CACHE_NEGATIVA_SECONDI = 3600
+# (piattaforma, coppia) -> istante fino al quale la coppia è considerata non disponibile
+_coppie_non_disponibili: Dict[tuple, float] = {}
+
+# Statistiche complessive della cache
+_statistiche = {'hit': 0, 'hit_scaduti': 0, 'miss': 0, 'evizioni': 0, 'triangolazioni': 0, 'richieste_evitate': 0,
+                'rinnovi': 0, 'errori_rinnovo': 0, 'latenza_totale_ms': 0.0, 'latenza_massima_ms': 0.0, 'latenza_ultima_ms': 0.0}
+_task_rinnovo: Optional[asyncio.Task] = None
+
+def _salva_prezzo(piattaforma: str, coppia: str, prezzo: float, current_time: float, via: Optional[list] = None, richiesta: bool = True):
+    """Salva un prezzo in cache. Una nuova voce non richiesta da nessuno (richiesta=False) nasce fredda e non viene rinnovata."""
+    chiave = (piattaforma, coppia)
+    voce = prezzi_cache.get(chiave)
+    if voce is None:
+        voce = prezzi_cache[chiave] = {'ultimo_accesso': current_time if richiesta else None, 'hit': 0, 'hit_scaduti': 0}
+    else:
+        prezzi_cache.move_to_end(chiave)
+    voce.update({'prezzo': prezzo, 'timestamp': current_time, 'via': via})
+    while len(prezzi_cache) > MAX_VOCI_PREZZI_CACHE:
+        prezzi_cache.popitem(last=False)
+        _statistiche['evizioni'] += 1
+
+def _gamba(mercati: dict, da: str, a: str) -> Optional[tuple]:
+    """Restituisce (coppia di mercato, invertita) per convertire `da` in `a`, o None se non esiste."""
+    if f"{da}/{a}" in mercati:
+        return (f"{da}/{a}", False)
+    if f"{a}/{da}" in mercati:
+        return (f"{a}/{da}", True)
+    return None
+
+def _trova_percorso(mercati: dict, coppia: str) -> Optional[tuple]:
+    """
+    Restituisce le coppie di mercato da moltiplicare per ottenere il prezzo di `coppia`:
+    la coppia stessa (o la sua inversa) se quotata, altrimenti due gambe attraverso una VALUTE_PONTE.
+    """
+    base, quote = coppia.split('/', 1)
+    diretta = _gamba(mercati, base, quote)
+    if diretta:
+        return (diretta,)
+    for ponte in VALUTE_PONTE:
+        if ponte in (base, quote):
+            continue
+        prima, seconda = _gamba(mercati, base, ponte), _gamba(mercati, ponte, quote)
+        if prima and seconda:
+            return (prima, seconda)
+    return None
+
+def _prezzo_da_percorso(piattaforma: str, percorso: tuple) -> Optional[float]:
+    prezzo = 1.0
+    for coppia_mercato, invertita in percorso:
+        voce = prezzi_cache.get((piattaforma, coppia_mercato))
+        if voce is None or not voce['prezzo']:
+            return None
+        prezzo *= 1 / voce['prezzo'] if invertita else voce['prezzo']
+    return prezzo
+
+async def _recupera_tickers_singoli(piattaforma_ccxt: any, coppie: list[str]) -> dict:
+    """Fallback per gli exchange senza fetchTickers: una fetch_ticker per coppia, a lotti di richieste parallele."""
+    tickers = {}
+    for inizio in range(0, len(coppie), DIMENSIONE_LOTTO_TICKER_SINGOLI):
+        lotto = coppie[inizio:inizio + DIMENSIONE_LOTTO_TICKER_SINGOLI]
+        risultati = await asyncio.gather(*[piattaforma_ccxt.fetch_ticker(coppia) for coppia in lotto], return_exceptions=True)
+        for coppia, risultato in zip(lotto, risultati):
+            if isinstance(risultato, Exception):
+                logging.warning(f"ATTENZIONE: Impossibile ottenere il prezzo per {coppia}: {risultato}")
+            else:
+                tickers[coppia] = risultato
+    return tickers
+
+async def _recupera_tickers(piattaforma_ccxt: any, coppie: list[str]) -> dict:
+    """
+    Recupera i ticker delle coppie indicate con il minor numero di richieste possibile:
+    una fetch_tickers per lotto di simboli, oppure un'istantanea dell'intero mercato
+    se l'exchange non accetta l'elenco dei simboli. Senza fetchTickers si ripiega su fetch_ticker.
+    """
+    if not piattaforma_ccxt.has.get('fetchTickers'):
+        return await _recupera_tickers_singoli(piattaforma_ccxt, coppie)
+
+    tickers = {}
+    try:
+        for inizio in range(0, len(coppie), MAX_SIMBOLI_PER_FETCH_TICKERS):
+            tickers.update(await piattaforma_ccxt.fetch_tickers(coppie[inizio:inizio + MAX_SIMBOLI_PER_FETCH_TICKERS]) or {})
+        return tickers
+    except Exception as e:
+        logging.warning(f"fetch_tickers con elenco di simboli non riuscita su {piattaforma_ccxt.id}: {e}. Provo con l'istantanea dell'intero mercato.")
+    try:
+        return await piattaforma_ccxt.fetch_tickers() or {}
+    except Exception as e:
+        logging.warning(f"Istantanea dei ticker non disponibile su {piattaforma_ccxt.id}: {e}. Recupero i prezzi uno alla volta.")
+    return await _recupera_tickers_singoli(piattaforma_ccxt, [coppia for coppia in coppie if coppia not in tickers])
+
+async def _aggiorna_coppie(piattaforma_ccxt: any, coppie: list[str]):
+    """
+    Recupera i prezzi delle coppie indicate e li salva in cache, registrando la latenza del rinnovo.
+    Le coppie non quotate vengono prezzate tramite una valuta ponte, riusando le gambe già fresche in cache;
+    quelle né quotate né triangolabili finiscono nella cache negativa e non vengono richieste per un po'.
+    """
+    nome_piattaforma = piattaforma_ccxt.id
+    current_time = time.time()
+    coppie = [coppia for coppia in coppie if _coppie_non_disponibili.get((nome_piattaforma, coppia), 0) <= current_time]
+    if not coppie:
+        return
+
+    mercati = getattr(piattaforma_ccxt, 'markets', None)
+    if not mercati:
+        try:
+            # Già caricati nella maggior parte dei casi: ccxt non ripete la richiesta
+            mercati = await piattaforma_ccxt.load_markets()
+        except Exception as e:
+            logging.warning(f"Mercati di {nome_piattaforma} non disponibili: {e}. Richiedo le coppie senza triangolazione.")
+
+    percorsi = {}
+    for coppia in coppie:
+        percorso = _trova_percorso(mercati, coppia) if mercati else ((coppia, False),)
+        if percorso is None:
+            # Una coppia inesistente farebbe anche fallire l'intera richiesta a lotti: la si scarta subito
+            _coppie_non_disponibili[(nome_piattaforma, coppia)] = current_time + TTL_CACHE_NEGATIVA_SECONDI
+            logging.warning(f"{coppia} non è quotata su {nome_piattaforma} né ricavabile tramite {', '.join(VALUTE_PONTE)}: non verrà richiesta per {TTL_CACHE_NEGATIVA_SECONDI}s.")
+            continue
+        percorsi[coppia] = percorso
+
+    # Le coppie richieste vanno sempre scaricate; le gambe di una triangolazione solo se non sono già fresche
+    coppie_di_mercato = set()
+    for coppia, percorso in percorsi.items():
+        for coppia_mercato, _ in percorso:
+            voce = prezzi_cache.get((nome_piattaforma, coppia_mercato))
+            if coppia_mercato == coppia or voce is None or current_time - voce['timestamp'] > CACHE_VALIDITY_SECONDS * FRAZIONE_RINNOVO_ANTICIPATO:
+                coppie_di_mercato.add(coppia_mercato)
+            else:
+                _statistiche['richieste_evitate'] += 1
+
+    tickers = {}
+    if coppie_di_mercato:
+        inizio = time.monotonic()
+        try:
+            tickers = await _recupera_tickers(piattaforma_ccxt, sorted(coppie_di_mercato))
+        except Exception:
+            _statistiche['errori_rinnovo'] += 1
+            raise
+        latenza_ms = (time.monotonic() - inizio) * 1000
+        _statistiche['rinnovi'] += 1
+        _statistiche['latenza_totale_ms'] += latenza_ms
+        _statistiche['latenza_massima_ms'] = max(_statistiche['latenza_massima_ms'], latenza_ms)
+        _statistiche['latenza_ultima_ms'] = latenza_ms
+
+    current_time = time.time()
+    # Anche i ticker non richiesti (gambe, istantanea dell'intero mercato) finiscono in cache, la risposta è già pagata,
+    # ma come voci fredde: il rinnovo in background non li scarica di nuovo finché qualcuno non li legge
+    for coppia_mercato, ticker in tickers.items():
+        if ticker and ticker.get('last') is not None:
+            _salva_prezzo(nome_piattaforma, coppia_mercato, ticker['last'], current_time, richiesta=coppia_mercato in percorsi)
+    for coppia, percorso in percorsi.items():
+        if percorso == ((coppia, False),):
+            if not (tickers.get(coppia) or {}).get('last'):
+                logging.warning(f"ATTENZIONE: Impossibile ottenere il prezzo per {coppia}: {tickers.get(coppia)}")
+            continue
+        prezzo = _prezzo_da_percorso(nome_piattaforma, percorso)
+        if prezzo is None:
+            logging.warning(f"ATTENZIONE: Impossibile ricavare il prezzo per {coppia} tramite {[gamba for gamba, _ in percorso]}.")
+            continue
+        _statistiche['triangolazioni'] += 1
+        _salva_prezzo(nome_piattaforma, coppia, prezzo, current_time, via=[gamba for gamba, _ in percorso])
 
 async def aggiorna_prezzi_cache(piattaforma_ccxt: any, simboli: list[str], quote_currency: str):
     """
     Aggiorna i prezzi dei simboli specificati nella cache usando la quote_currency fornita.
-    Recupera i prezzi solo se non sono in cache o se la cache è scaduta.
+    Attende il recupero solo per i prezzi assenti o oltre il TTL hard; quelli solo scaduti
+    vengono lasciati al rinnovo in background, se attivo, e restano leggibili nel frattempo.
+    Tutte le coppie da recuperare vengono richieste con un'unica fetch_tickers quando l'exchange la supporta.
     """
     global prezzi_cache
     current_time = time.time()
+    rinnovo_attivo = _task_rinnovo is not None and not _task_rinnovo.done()
     
     coppie_da_aggiornare = []
     for simbolo in simboli:
         coppia = f"{simbolo}/{quote_currency}"
-        # Controlla se il prezzo è già in cache e se è ancora valido
-        if coppia not in prezzi_cache or (current_time - prezzi_cache[coppia].get('timestamp', 0)) > CACHE_VALIDITY_SECONDS:
+        if _coppie_non_disponibili.get((piattaforma_ccxt.id, coppia), 0) > current_time:
+            continue
+        voce = prezzi_cache.get((piattaforma_ccxt.id, coppia))
+        if voce is None:
+            coppie_da_aggiornare.append(coppia)
+            continue
+        # Chi chiede l'aggiornamento userà il prezzo: la coppia è "calda"
+        voce['ultimo_accesso'] = current_time
+        eta = current_time - voce.get('timestamp', 0)
+        if eta > CACHE_HARD_TTL_SECONDS or (eta > CACHE_VALIDITY_SECONDS and not rinnovo_attivo):
             coppie_da_aggiornare.append(coppia)
 
     if coppie_da_aggiornare:
         logging.info(f"Aggiornamento prezzi cache per: {coppie_da_aggiornare}")
-        fetch_tasks = [piattaforma_ccxt.fetch_ticker(coppia) for coppia in coppie_da_aggiornare]
-        
-        fetched_tickers_results = await asyncio.gather(*fetch_tasks, return_exceptions=True)
-
-        for i, coppia in enumerate(coppie_da_aggiornare):
-            ticker_result = fetched_tickers_results[i]
-            if not isinstance(ticker_result, Exception) and ticker_result and 'last' in ticker_result and ticker_result['last'] is not None:
-                prezzi_cache[coppia] = {
-                    'prezzo': ticker_result['last'],
-                    'timestamp': current_time
-                }
-            else:
-                logging.warning(f"ATTENZIONE: Impossibile ottenere il prezzo per {coppia}: {ticker_result}")
+        await _aggiorna_coppie(piattaforma_ccxt, coppie_da_aggiornare)
 
-def get_prezzo_cache(simbolo: str, quote_currency: str) -> Optional[float]:
+def get_prezzo_cache(simbolo: str, quote_currency: str, piattaforma: Optional[str] = None, eta_massima: Optional[float] = None) -> Optional[float]:
     """
-    Restituisce il prezzo di un simbolo contro una specifica quote_currency dalla cache.
+    Restituisce il prezzo di un simbolo contro una specifica quote_currency dalla cache della piattaforma indicata.
+    Senza piattaforma viene restituito il prezzo più recente tra quelli in cache per la coppia.
+    Un prezzo oltre il TTL soft viene comunque restituito (e rinnovato in background) finché
+    non supera il TTL hard, oppure `eta_massima` secondi se indicata da chi ha bisogno di un prezzo fresco.
     """
     global prezzi_cache
     current_time = time.time()
     coppia = f"{simbolo}/{quote_currency}"
+    limite = CACHE_HARD_TTL_SECONDS if eta_massima is None else min(eta_massima, CACHE_HARD_TTL_SECONDS)
     
-    cache_entry = prezzi_cache.get(coppia)
-    if cache_entry and (current_time - cache_entry.get('timestamp', 0)) <= CACHE_VALIDITY_SECONDS:
-        return cache_entry.get('prezzo')
+    if piattaforma is not None:
+        chiave = (piattaforma, coppia)
+    else:
+        chiave = max((k for k in prezzi_cache if k[1] == coppia), key=lambda k: prezzi_cache[k]['timestamp'], default=None)
+    cache_entry = prezzi_cache.get(chiave) if chiave else None
+    if cache_entry:
+        prezzi_cache.move_to_end(chiave)
+        cache_entry['ultimo_accesso'] = current_time
+        eta = current_time - cache_entry.get('timestamp', 0)
+        if eta <= limite:
+            if eta <= CACHE_VALIDITY_SECONDS:
+                _statistiche['hit'] += 1
+                cache_entry['hit'] += 1
+            else:
+                _statistiche['hit_scaduti'] += 1
+                cache_entry['hit_scaduti'] += 1
+            return cache_entry.get('prezzo')
         
+    _statistiche['miss'] += 1
     logging.debug(f"Prezzo per {coppia} non in cache o scaduto.")
     return None
 
@@ -63,4 +268,75 @@ def get_prezzo_eur_cache() -> Optional[float]:
     """
     Restituisce sempre None, dato che la conversione EUR è stata rimossa.
     """
-    return None
\ No newline at end of file
+    return None
+
+async def _ciclo_rinnovo():
+    from ..servizi.instance_manager import get_platform_instance
+    from ..servizi.scheduler_richieste import con_priorita, PRIORITA_DASHBOARD
+    with con_priorita(PRIORITA_DASHBOARD):
+        while True:
+            await asyncio.sleep(INTERVALLO_RINNOVO_SECONDI)
+            adesso = time.time()
+            da_rinnovare = {}
+            for (nome_piattaforma, coppia), voce in list(prezzi_cache.items()):
+                # Una voce fredda non viene mai rinnovata ed è rimossa quando il suo prezzo è vecchio quanto l'inattività massima
+                freddo = voce['ultimo_accesso'] is None
+                inattivita = adesso - (voce['timestamp'] if freddo else voce['ultimo_accesso'])
+                if inattivita > INATTIVITA_EVIZIONE_SECONDI:
+                    del prezzi_cache[(nome_piattaforma, coppia)]
+                    _statistiche['evizioni'] += 1
+                elif not freddo and inattivita <= FINESTRA_SIMBOLO_CALDO_SECONDI and adesso - voce['timestamp'] >= CACHE_VALIDITY_SECONDS * FRAZIONE_RINNOVO_ANTICIPATO:
+                    da_rinnovare.setdefault(nome_piattaforma, []).append(coppia)
+            for chiave, scadenza in list(_coppie_non_disponibili.items()):
+                if scadenza <= adesso:
+                    del _coppie_non_disponibili[chiave]
+
+            for nome_piattaforma, coppie in da_rinnovare.items():
+                try:
+                    logging.debug(f"Rinnovo in background di {len(coppie)} prezzi su {nome_piattaforma}.")
+                    await _aggiorna_coppie(get_platform_instance(nome_piattaforma), coppie)
+                except Exception as e:
+                    logging.warning(f"Errore nel rinnovo in background dei prezzi su {nome_piattaforma}: {e}")
+
+def avvia_rinnovo_prezzi():
+    """Avvia il task che rinnova in anticipo i prezzi letti di recente e rimuove quelli inutilizzati."""
+    global _task_rinnovo
+    if _task_rinnovo is None or _task_rinnovo.done():
+        _task_rinnovo = asyncio.create_task(_ciclo_rinnovo())
+
+async def ferma_rinnovo_prezzi():
+    global _task_rinnovo
+    if _task_rinnovo is not None:
+        _task_rinnovo.cancel()
+        try:
+            await _task_rinnovo
+        except asyncio.CancelledError:
+            pass
+        _task_rinnovo = None
+
+def get_statistiche_prezzi_cache() -> dict:
+    """Restituisce hit/miss complessivi, latenza dei rinnovi ed età e utilizzo di ogni prezzo in cache."""
+    adesso = time.time()
+    rinnovi = _statistiche['rinnovi']
+    letture = _statistiche['hit'] + _statistiche['hit_scaduti'] + _statistiche['miss']
+    return {
+        'voci': len(prezzi_cache),
+        'capacita': MAX_VOCI_PREZZI_CACHE,
+        'coppie_non_disponibili': [f"{piattaforma}:{coppia}" for (piattaforma, coppia), scadenza in _coppie_non_disponibili.items() if scadenza > adesso],
+        'rinnovo_in_background_attivo': _task_rinnovo is not None and not _task_rinnovo.done(),
+        **{chiave: valore for chiave, valore in _statistiche.items() if chiave != 'latenza_totale_ms'},
+        'percentuale_hit': round((_statistiche['hit'] + _statistiche['hit_scaduti']) / letture * 100, 2) if letture else 0.0,
+        'latenza_media_ms': round(_statistiche['latenza_totale_ms'] / rinnovi, 1) if rinnovi else 0.0,
+        'latenza_massima_ms': round(_statistiche['latenza_massima_ms'], 1),
+        'latenza_ultima_ms': round(_statistiche['latenza_ultima_ms'], 1),
+        'prezzi': {
+            f"{piattaforma}:{coppia}": {
+                'via': voce['via'],
+                'eta_secondi': round(adesso - voce['timestamp'], 1),
+                'inattivita_secondi': round(adesso - voce['ultimo_accesso'], 1) if voce['ultimo_accesso'] is not None else None,
+                'hit': voce['hit'],
+                'hit_scaduti': voce['hit_scaduti'],
+            }
+            for (piattaforma, coppia), voce in prezzi_cache.items()
+        },
+    }
@@ -0,0 +1,223 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+# Numero massimo di righe scritte in una singola transazione
+DIMENSIONE_MASSIMA_BATCH = 500
+# Tempo massimo (secondi) che una riga non urgente può restare in coda prima del flush
+INTERVALLO_FLUSH_SECONDI = 1.0
+
+# Writer avviati almeno una volta: vengono fermati all'uscita da un unico handler atexit, registrato una sola volta
+_scrittori_avviati = []
+_atexit_registrato = False
+
+def _ferma_scrittori_avviati():
+    for scrittore in _scrittori_avviati:
+        scrittore.ferma()
+
+
+@dataclass
+class ScritturaInCoda:
+    """Una singola istruzione SQL in attesa di essere scritta dal writer in background."""
+    sql: str
+    parametri: tuple
+    descrizione: str = ""
+    urgente: bool = False   # Forza il flush immediato del batch corrente
+    durevole: bool = False  # Il batch viene confermato con synchronous=FULL (fsync del WAL)
+    dopo_commit: Optional[Callable[[], None]] = field(default=None, repr=False)
+
+
+@dataclass
+class _RichiestaFlush:
+    """Marcatore in coda: viene risolto quando tutte le scritture precedenti sono confermate."""
+    future: Future
+
+
+class ScrittoreDifferito:
+    """
+    Writer in background alimentato da una coda in memoria.
+    Le righe accodate vengono raggruppate in un'unica transazione per flush,
+    che scatta al raggiungimento di DIMENSIONE_MASSIMA_BATCH righe, dopo
+    INTERVALLO_FLUSH_SECONDI o subito se una riga è marcata come urgente.
+    Il thread viene avviato alla prima scrittura accodata.
+    """
+    def __init__(self, pool, dimensione_batch: int = DIMENSIONE_MASSIMA_BATCH, intervallo_flush: float = INTERVALLO_FLUSH_SECONDI):
+        self._pool = pool
+        self.dimensione_batch = dimensione_batch
+        self.intervallo_flush = intervallo_flush
+        self._coda = queue.Queue()
+        self._thread = None
+        self._lock_avvio = threading.Lock()
+        self._fermato = False
+
+    def avvia(self):
+        """Avvia il thread di scrittura, se non è già in esecuzione."""
+        with self._lock_avvio:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._fermato = False
+            self._thread = threading.Thread(target=self._ciclo, name="ScrittoreDB", daemon=True)
+            self._thread.start()
+            global _atexit_registrato
+            if self not in _scrittori_avviati:
+                _scrittori_avviati.append(self)
+            if not _atexit_registrato:
+                atexit.register(_ferma_scrittori_avviati)
+                _atexit_registrato = True
+            logging.info("Writer differito del database avviato.")
+
+    def accoda(self, scrittura: ScritturaInCoda):
+        """Accoda una scrittura senza bloccare il chiamante."""
+        if self._fermato:
+            # Dopo lo shutdown non c'è più un writer: scrive in modo sincrono per non perdere dati.
+            self._scrivi_batch([scrittura])
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self.avvia()
+        self._coda.put(scrittura)
+
+    def richiedi_flush(self) -> Future:
+        """
+        Restituisce un Future che si completa quando tutte le scritture accodate finora
+        sono state confermate su disco. Usabile da codice asincrono con asyncio.wrap_future.
+        """
+        future = Future()
+        if self._thread is None or not self._thread.is_alive():
+            future.set_result(True)
+            return future
+        self._coda.put(_RichiestaFlush(future))
+        return future
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Attende in modo sincrono che la coda venga svuotata."""
+        try:
+            return self.richiedi_flush().result(timeout=timeout)
+        except Exception as e:
+            logging.error(f"Flush del writer differito non completato: {e}")
+            return False
+
+    def ferma(self, timeout: float = 10.0):
+        """Svuota la coda e arresta il thread. Da chiamare allo shutdown."""
+        with self._lock_avvio:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                self._fermato = True
+                return
+            self._coda.put(None)
+        thread.join(timeout=timeout)
+        self._fermato = True
+        if thread.is_alive():
+            logging.error("Il writer differito non si è arrestato entro il timeout: alcune scritture potrebbero andare perse.")
+        else:
+            logging.info("Writer differito del database arrestato, coda svuotata.")
+
+    def dimensione_coda(self) -> int:
+        return self._coda.qsize()
+
+    def _ciclo(self):
+        fine = False
+        while not fine:
+            batch, richieste_flush = [], []
+            try:
+                elemento = self._coda.get()
+                scadenza = time.monotonic() + self.intervallo_flush
+                while True:
+                    if elemento is None:
+                        fine = True
+                        break
+                    if isinstance(elemento, _RichiestaFlush):
+                        richieste_flush.append(elemento)
+                        break
+                    batch.append(elemento)
+                    if elemento.urgente or len(batch) >= self.dimensione_batch:
+                        break
+                    attesa = scadenza - time.monotonic()
+                    if attesa <= 0:
+                        break
+                    try:
+                        elemento = self._coda.get(timeout=attesa)
+                    except queue.Empty:
+                        break
+
+                if fine:
+                    # Svuota ciò che resta in coda prima di terminare
+                    while True:
+                        try:
+                            residuo = self._coda.get_nowait()
+                        except queue.Empty:
+                            break
+                        if isinstance(residuo, _RichiestaFlush):
+                            richieste_flush.append(residuo)
+                        elif residuo is not None:
+                            batch.append(residuo)
+
+                if batch:
+                    self._scrivi_batch(batch)
+                for richiesta in richieste_flush:
+                    richiesta.future.set_result(True)
+            except Exception as e:
+                # Un errore imprevisto non deve fermare il thread: le scritture accodate dopo verrebbero perse
+                logging.error(f"Errore imprevisto nel writer differito, {len(batch)} righe non confermate: {e}", exc_info=True)
+                for richiesta in richieste_flush:
+                    if not richiesta.future.done():
+                        richiesta.future.set_exception(e)
+
+    def _esegui_in_transazione(self, durevole: bool, esegui: Callable):
+        """Esegue `esegui(conn)` in una transazione; se durevole la conferma con synchronous=FULL."""
+        with self._pool.scrittura() as conn:
+            if durevole:
+                conn.execute("PRAGMA synchronous = FULL")
+            try:
+                esegui(conn)
+                conn.commit()
+            except sqlite3.Error:
+                # Chiude la transazione prima di ripristinare il livello di sincronizzazione
+                conn.rollback()
+                raise
+            finally:
+                if durevole:
+                    conn.execute("PRAGMA synchronous = NORMAL")
+
+    def _scrivi_batch(self, batch: list):
+        """Scrive il batch in una sola transazione; in caso di errore riprova riga per riga."""
+        try:
+            self._esegui_in_transazione(any(s.durevole for s in batch), lambda conn: self._esegui_raggruppato(conn, batch))
+            logging.debug(f"Writer differito: {len(batch)} righe scritte in una transazione.")
+        except sqlite3.Error as e:
+            logging.error(f"Errore nella scrittura di un batch di {len(batch)} righe: {e}. Riprovo riga per riga.")
+            batch_riuscito = []
+            for scrittura in batch:
+                try:
+                    # Anche nel recupero le righe durevoli (es. operazioni) restano confermate con synchronous=FULL
+                    self._esegui_in_transazione(scrittura.durevole, lambda conn: conn.execute(scrittura.sql, scrittura.parametri))
+                    batch_riuscito.append(scrittura)
+                except sqlite3.Error as errore_riga:
+                    logging.error(f"Scrittura persa ({scrittura.descrizione or scrittura.sql.split()[2]}): {errore_riga}. Parametri: {scrittura.parametri}")
+            batch = batch_riuscito
+
+        for scrittura in batch:
+            if scrittura.dopo_commit:
+                try:
+                    scrittura.dopo_commit()
+                except Exception as e:
+                    logging.warning(f"Errore nel callback post-commit di '{scrittura.descrizione}': {e}")
+
+    @staticmethod
+    def _esegui_raggruppato(conn, batch: list):
+        # Raggruppa le istruzioni consecutive identiche per usare executemany
+        inizio = 0
+        while inizio < len(batch):
+            fine = inizio
+            while fine + 1 < len(batch) and batch[fine + 1].sql == batch[inizio].sql:
+                fine += 1
+            conn.executemany(batch[inizio].sql, [s.parametri for s in batch[inizio:fine + 1]])
+            inizio = fine + 1
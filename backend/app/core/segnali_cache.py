@@ -0,0 +1,91 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+import asyncio
+import copy
+import logging
+import time
+from collections import OrderedDict
+
+# Parte costosa dei segnali in cache per (exchange, coppia, timeframes, pesi, parametri indicatori), dal meno al più recentemente usato
+# Formato: { chiave: { 'base': dict, 'candele_chiuse': tuple, 'scadenza': float, 'calcolato_il': float, 'hit': int } }
+segnali_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+# Numero massimo di segnali in cache: oltre, viene rimosso quello usato meno di recente
+MAX_SEGNALI_CACHE = 1024
+
+# Calcoli in corso: chiave -> task condiviso tra i chiamanti contemporanei
+_in_calcolo = {}
+
+_statistiche = {'hit': 0, 'miss': 0, 'condivisi': 0, 'ricalcoli_nuova_candela': 0, 'evizioni': 0,
+                'eta_servita_totale_secondi': 0.0, 'eta_servita_massima_secondi': 0.0}
+
+
+async def _calcola_e_salva(chiave: tuple, calcola) -> dict:
+    base = await calcola()
+    # Senza scadenza (nessun timeframe disponibile o qualcuno fallito per un errore transitorio) il risultato non viene trattenuto
+    if base.get('scadenza') is not None:
+        segnali_cache[chiave] = {'base': base, 'candele_chiuse': base.get('candele_chiuse'), 'scadenza': base['scadenza'],
+                                 'calcolato_il': time.time(), 'hit': 0}
+        segnali_cache.move_to_end(chiave)
+        while len(segnali_cache) > MAX_SEGNALI_CACHE:
+            segnali_cache.popitem(last=False)
+            _statistiche['evizioni'] += 1
+    return base
+
+async def segnale_condiviso(piattaforma, coppia: str, timeframes, pesi, params: dict, calcola, componi) -> dict:
+    """
+    Restituisce il segnale della coppia componendo con `componi(base)` la parte costosa calcolata da `calcola()`.
+    La base (indicatori delle sole candele chiuse) viene ricalcolata solo dopo la sua 'scadenza', cioè la chiusura
+    della candela in corso indicata da `calcola()`; chiamanti contemporanei attendono lo stesso calcolo.
+    `componi` viene eseguita a ogni chiamata, anche servita dalla cache (es. per valutare la base al prezzo attuale),
+    e riceve una propria copia della base.
+    """
+    adesso = time.time()
+    chiave = (piattaforma.id, coppia, tuple(timeframes), tuple(pesi), tuple(sorted(params.items())))
+
+    voce = segnali_cache.get(chiave)
+    if voce is not None and adesso < voce['scadenza']:
+        segnali_cache.move_to_end(chiave)
+        eta = adesso - voce['calcolato_il']
+        voce['hit'] += 1
+        _statistiche['hit'] += 1
+        _statistiche['eta_servita_totale_secondi'] += eta
+        _statistiche['eta_servita_massima_secondi'] = max(_statistiche['eta_servita_massima_secondi'], eta)
+        return await componi(copy.deepcopy(voce['base']))
+
+    task = _in_calcolo.get(chiave)
+    if task is None:
+        _statistiche['miss'] += 1
+        if voce is not None:
+            _statistiche['ricalcoli_nuova_candela'] += 1
+        task = asyncio.ensure_future(_calcola_e_salva(chiave, calcola))
+        _in_calcolo[chiave] = task
+        task.add_done_callback(lambda _: _in_calcolo.pop(chiave, None))
+    else:
+        _statistiche['condivisi'] += 1
+        logging.debug(f"Segnale per {coppia} su {piattaforma.id} unito a un calcolo già in corso.")
+    # shield: se un chiamante viene cancellato, il calcolo condiviso prosegue per gli altri
+    return await componi(copy.deepcopy(await asyncio.shield(task)))
+
+def get_statistiche_segnali_cache() -> dict:
+    """Restituisce hit/miss della cache dei segnali, l'età dei segnali serviti e quella di ogni segnale in cache."""
+    adesso = time.time()
+    richieste = _statistiche['hit'] + _statistiche['miss'] + _statistiche['condivisi']
+    return {
+        'voci': len(segnali_cache),
+        'capacita': MAX_SEGNALI_CACHE,
+        'calcoli_in_corso': len(_in_calcolo),
+        **{chiave: valore for chiave, valore in _statistiche.items() if chiave != 'eta_servita_totale_secondi'},
+        'percentuale_hit': round((_statistiche['hit'] + _statistiche['condivisi']) / richieste * 100, 2) if richieste else 0.0,
+        'eta_servita_media_secondi': round(_statistiche['eta_servita_totale_secondi'] / _statistiche['hit'], 1) if _statistiche['hit'] else 0.0,
+        'eta_servita_massima_secondi': round(_statistiche['eta_servita_massima_secondi'], 1),
+        'segnali': {
+            f"{exchange}:{coppia}:{','.join(timeframes)}": {
+                'candele_chiuse': voce['candele_chiuse'],
+                'eta_secondi': round(adesso - voce['calcolato_il'], 1),
+                'scade_tra_secondi': round(max(voce['scadenza'] - adesso, 0.0), 1),
+                'hit': voce['hit'],
+            }
+            for (exchange, coppia, timeframes, _, _), voce in segnali_cache.items()
+        },
+    }
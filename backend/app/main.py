@@ -36,6 +36,7 @@ class ImpostazioniGenerali(BaseModel):
     modalita_reale_attiva: bool
     intervallo_aggiornamento_secondi: int
     intervallo_aggiornamento_dashboard_secondi: Optional[int] = 120
+    intervallo_aggiornamento_dati_mercato_secondi: Optional[int] = 300 # Gli indicatori precalcolati di una candela chiusa si usano dal primo aggiornamento dopo la chiusura
     min_buy_notional_usd: float # Aggiunto
     min_sell_notional_usd: float # Aggiunto
 
@@ -109,6 +110,20 @@ class ParametriIndicatori(BaseModel):
     bollinger_periodo: int
     bollinger_deviazioni_std: int
     adx_periodo: int
+    calcolo_incrementale: bool = False # Se attivo aggiorna gli indicatori solo con le candele nuove, altrimenti ricalcola la serie con i kernel NumPy
+
+class ArchivioOHLCV(BaseModel):
+    motore: str = "entrambi" # 'sqlite', 'colonnare' o 'entrambi'
+
+class EsecuzioneAnalisi(BaseModel):
+    modalita: str = "processi" # 'processi', 'thread' o 'nessuna'
+    workers: int = 2
+
+class IndicatoriPrecalcolati(BaseModel):
+    attivo: bool = True # Calcola gli indicatori al salvataggio delle candele e li usa nell'analisi dei timeframe
+
+class CacheSegnali(BaseModel):
+    attiva: bool = True # Condivide il segnale di una coppia tra ciclo di trading, dashboard ed endpoint fino alla chiusura di una nuova candela
 
 class ConfigModel(BaseModel):
     _comment_autore: str
@@ -124,6 +139,17 @@ class ConfigModel(BaseModel):
     analisi_multi_timeframe: AnalisiMultiTimeframe
     tassazione: Tassazione
     parametri_indicatori: ParametriIndicatori
+    archivio_ohlcv: Optional[ArchivioOHLCV] = None
+    esecuzione_analisi: Optional[EsecuzioneAnalisi] = None
+    indicatori_precalcolati: Optional[IndicatoriPrecalcolati] = None
+    cache_segnali: Optional[CacheSegnali] = None
+
+# Modello Pydantic per l'avvio del backfill storico
+class RichiestaBackfill(BaseModel):
+    piattaforma: str
+    simboli: list[str]
+    timeframes: list[str] = ['1h', '4h', '1d']
+    giorni: int = 365
 
 # Modello Pydantic per le operazioni manuali
 class OperazioneManuale(BaseModel):
@@ -135,16 +161,22 @@ class OperazioneManuale(BaseModel):
 
 from .core.cervello_ia import analizza_mercato_e_genera_segnale, ottimizza_portafoglio_simulato, suggerisci_strategie_di_mercato
 from .core.gestore_operazioni import gestore_globale_portafoglio
-from .core.prezzi_cache import aggiorna_prezzi_cache, get_prezzo_cache, get_prezzo_eur_cache
-from .core.database import recupera_dati_ohlcv_da_db, create_tables, get_blacklisted_pairs_set, add_to_blacklist, get_blacklist_details, remove_from_blacklist, recupera_operazioni_db, salva_evento_db, recupera_eventi_db, crea_notifica, recupera_notifiche, segna_notifiche_come_lette
+from .core.esecutore_analisi import avvia_monitoraggio_event_loop, ferma_monitoraggio_event_loop, chiudi_esecutore_analisi, get_metriche_event_loop
+from .core.prezzi_cache import aggiorna_prezzi_cache, get_prezzo_cache, get_prezzo_eur_cache, avvia_rinnovo_prezzi, ferma_rinnovo_prezzi, get_statistiche_prezzi_cache, CACHE_VALIDITY_SECONDS
+from .core.segnali_cache import get_statistiche_segnali_cache
+from .core.database import create_tables
+from .core import database_async as db_async
 
 
-from .servizi.instance_manager import get_platform_instance, close_all_instances
+from .servizi.instance_manager import get_platform_instance, close_all_instances, get_metriche_coalescenza, get_metriche_scheduler
+from .servizi.scheduler_richieste import esegui_con_priorita, PRIORITA_DASHBOARD
 from .servizi.gestore_piattaforme import recupera_ordini_aperti
 
 from .core.cache_manager import get_dashboard_cache, set_dashboard_cache
 from .servizi.market_data_service import aggiorna_e_salva_dati_ohlcv
+from .servizi.backfill_service import avvia_backfill, stato_backfill, ferma_backfill
 from .core.gestore_configurazione import carica_configurazione
+from .core.archivio_colonnare import motore_archivio_ohlcv
 
 # Carica la configurazione per ottenere la versione del software
 config = carica_configurazione()
@@ -223,14 +255,12 @@ app.add_middleware(
 async def market_data_update_loop():
     """
     Ciclo in background che aggiorna periodicamente i dati OHLCV per le coppie monitorate.
-    Esegue gli aggiornamenti in parallelo ma con concorrenza limitata per non sovraccaricare le API.
+    Esegue gli aggiornamenti in parallelo: la concorrenza verso le API è regolata dallo scheduler
+    delle richieste dell'exchange, con priorità di scansione (dopo ordini, trading e dashboard).
     """
     await asyncio.sleep(15)
     logging.info("Avvio del loop di aggiornamento periodico dei dati di mercato...")
 
-    # Limita la concorrenza per evitare di essere bannati o di ricevere timeout dall'exchange
-    semaphore = asyncio.Semaphore(5)
-
     while True:
         try:
             from .core.gestore_configurazione import carica_configurazione
@@ -238,14 +268,10 @@ async def market_data_update_loop():
             
             piattaforme_attive = [p for p, conf in config['piattaforme'].items() if p != '_comment' and conf['attiva']]
             simboli_da_monitorare = config['parametri_ia']['cripto_preferite']
-            intervallo_aggiornamento_dati_mercato_secondi = config.get('impostazioni_generali', {}).get('intervallo_aggiornamento_dati_mercato_secondi', 3600)
+            intervallo_aggiornamento_dati_mercato_secondi = config.get('impostazioni_generali', {}).get('intervallo_aggiornamento_dati_mercato_secondi', 300)
 
             logging.info(f"Inizio ciclo di aggiornamento dati di mercato per {len(piattaforme_attive)} piattaforme e {len(simboli_da_monitorare)} simboli.")
 
-            async def wrapped_update(piattaforma, coppia, timeframe, limit):
-                async with semaphore:
-                    return await aggiorna_e_salva_dati_ohlcv(piattaforma, coppia, timeframe, limit)
-
             tasks = []
             for piattaforma in piattaforme_attive:
                 quote_currency = config['piattaforme'][piattaforma]['options']['quote_currency']
@@ -253,10 +279,10 @@ async def market_data_update_loop():
                     coppia = f"{simbolo}/{quote_currency}"
                     timeframes = ['1h', '4h', '1d']
                     for timeframe in timeframes:
-                        task = wrapped_update(piattaforma, coppia, timeframe, limit=200)
+                        task = aggiorna_e_salva_dati_ohlcv(piattaforma, coppia, timeframe, limit=200)
                         tasks.append(task)
             
-            logging.info(f"Avvio di {len(tasks)} task di aggiornamento con concorrenza limitata (max 5)...")
+            logging.info(f"Avvio di {len(tasks)} task di aggiornamento (concorrenza regolata dallo scheduler delle richieste)...")
             risultati = await asyncio.gather(*tasks, return_exceptions=True)
 
             error_count = 0
@@ -341,6 +367,14 @@ async def startup_event():
         asyncio.create_task(memory_check_loop())
         logging.info("Loop di monitoraggio memoria avviato.")
 
+        # Avvia la misura dei blocchi del ciclo asyncio
+        avvia_monitoraggio_event_loop()
+        logging.info("Monitoraggio del ritardo dell'event loop avviato.")
+
+        # Avvia il rinnovo in background dei prezzi in cache
+        avvia_rinnovo_prezzi()
+        logging.info("Rinnovo in background della cache prezzi avviato.")
+
         from .core.gestore_configurazione import carica_configurazione
         config = carica_configurazione()
         if config['impostazioni_generali']['modalita_automatica_attiva']:
@@ -363,9 +397,22 @@ async def shutdown_event():
             pass # Il task è stato cancellato, è normale
         logging.info("AI Trading disattivato alla chiusura.")
 
+    # Interrompe i backfill mentre database e istanze sono ancora aperti, così salvano il checkpoint
+    await ferma_backfill()
+
+    # Ferma il rinnovo dei prezzi prima di chiudere le istanze che usa
+    await ferma_rinnovo_prezzi()
+
     # Chiudi tutte le istanze di piattaforma condivise
     await close_all_instances()
 
+    # Ferma il monitoraggio dell'event loop e i worker delle analisi
+    await ferma_monitoraggio_event_loop()
+    chiudi_esecutore_analisi()
+
+    # Svuota le scritture differite e chiudi le connessioni persistenti al database
+    await db_async.chiudi_database()
+
 @app.get("/", tags=["Generale"])
 async def root():
     """
@@ -420,7 +467,7 @@ async def test_connessione_piattaforma(nome_piattaforma: str):
                 total_usd_estimated += amount
             else:
                 # Prova a ottenere il prezzo dalla cache
-                price = get_prezzo_cache(asset, quote_currency) # Passa quote_currency
+                price = get_prezzo_cache(asset, quote_currency, piattaforma.id) # Passa quote_currency
                 if price is None:
                     # Se non in cache o scaduto, aggiungi alla lista per il recupero
                     assets_to_fetch_price.add(asset)
@@ -437,7 +484,7 @@ async def test_connessione_piattaforma(nome_piattaforma: str):
                 if asset in stablecoins:
                     total_usd_estimated += amount
                 else:
-                    price = get_prezzo_cache(asset, quote_currency) # Passa quote_currency
+                    price = get_prezzo_cache(asset, quote_currency, piattaforma.id) # Passa quote_currency
                     if price is not None:
                         total_usd_estimated += all_balances[asset] * price
                     else:
@@ -559,6 +606,7 @@ async def ottieni_stato_portafoglio():
 
 # --- Logica di Caching per la Dashboard ---
 
+@esegui_con_priorita(PRIORITA_DASHBOARD)
 async def calcola_e_aggiorna_cache_dashboard():
     """
     Esegue il calcolo intensivo per i dati della dashboard e aggiorna la cache.
@@ -623,7 +671,7 @@ async def calcola_e_aggiorna_cache_dashboard():
                 for i, asset in enumerate(assets_da_analizzare):
                     risultato = risultati_analisi[i]
                     quantita = portafoglio_attuale.asset[asset]
-                    prezzo_asset = get_prezzo_cache(asset, quote_currency)
+                    prezzo_asset = get_prezzo_cache(asset, quote_currency, piattaforma_default)
                     valore_calcolato = quantita * prezzo_asset if prezzo_asset else 0.0
                     
                     dettagli_analisi = {} # Initialize
@@ -650,7 +698,7 @@ async def calcola_e_aggiorna_cache_dashboard():
 
         for asset, quantita in portafoglio_attuale.asset.items():
             if asset not in asset_con_segnali:
-                prezzo_asset = get_prezzo_cache(asset, quote_currency)
+                prezzo_asset = get_prezzo_cache(asset, quote_currency, piattaforma_default)
                 segnale = "PREZZO N/D" if prezzo_asset is None else "NON MONITORATO"
                 valore_calcolato = quantita * prezzo_asset if prezzo_asset else 0.0
                 asset_con_segnali[asset] = {"quantita": quantita, "segnale": segnale, "valore_in_controvaluta": valore_calcolato, "controvaluta": quote_currency}
@@ -738,30 +786,39 @@ async def ottieni_posizioni_aperte():
     """
     return gestore_globale_portafoglio.portafoglio.posizioni_aperte
 
+def _risposta_paginata(elementi: list, limit: int, chiave_id: str, paginato: bool):
+    """
+    Con la paginazione attiva restituisce gli elementi insieme a next_cursor, da passare come
+    before_id per ottenere la pagina successiva (None quando non ci sono altre righe).
+    Senza paginazione restituisce la semplice lista, come in passato.
+    """
+    if not paginato:
+        return elementi
+    next_cursor = elementi[-1][chiave_id] if elementi and len(elementi) >= limit else None
+    return {"elementi": elementi, "next_cursor": next_cursor}
+
 @app.get("/storico_operazioni_reali", tags=["Simulazione"])
-async def ottieni_storico_operazioni_reali():
+async def ottieni_storico_operazioni_reali(limit: int = 500, before_id: Optional[str] = None, after_ts: Optional[datetime] = None, paginato: bool = False):
     """
     Restituisce lo storico delle operazioni reali recuperandole dal database.
+    Con before_id/after_ts (o paginato=true) la risposta include next_cursor per la pagina successiva.
     """
     try:
-        # Recupera tutte le operazioni dal DB e poi filtra in memoria
-        operazioni_dal_db = recupera_operazioni_db(limit=500) # Aumenta il limite se necessario
-        logging.debug(f"Operazioni recuperate dal DB (prima del filtro): {operazioni_dal_db}")
-        operazioni_reali = [op for op in operazioni_dal_db if "_reale" in op['tipo']]
-        return operazioni_reali
+        operazioni_reali = await db_async.recupera_operazioni_db(limit=limit, before_id=before_id, after_ts=after_ts, solo_reali=True)
+        return _risposta_paginata(operazioni_reali, limit, "id_operazione", paginato or before_id is not None or after_ts is not None)
     except Exception as e:
         logging.error(f"Errore durante il recupero dello storico operazioni reali dal DB: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Errore nel recupero dello storico operazioni.")
         
 @app.get("/storico_take_profit", tags=["Simulazione"])
-async def ottieni_storico_take_profit():
+async def ottieni_storico_take_profit(limit: int = 1000, before_id: Optional[str] = None, after_ts: Optional[datetime] = None, paginato: bool = False):
     """
     Restituisce lo storico delle operazioni chiuse per Take Profit.
+    Con before_id/after_ts (o paginato=true) la risposta include next_cursor per la pagina successiva.
     """
     try:
-        operazioni_dal_db = recupera_operazioni_db(limit=1000)
-        operazioni_tp = [op for op in operazioni_dal_db if op.get('motivo_vendita') == 'TAKE_PROFIT']
-        return operazioni_tp
+        operazioni_tp = await db_async.recupera_operazioni_db(limit=limit, before_id=before_id, after_ts=after_ts, motivo_vendita='TAKE_PROFIT')
+        return _risposta_paginata(operazioni_tp, limit, "id_operazione", paginato or before_id is not None or after_ts is not None)
     except Exception as e:
         logging.error(f"Errore durante il recupero dello storico take profit: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Errore nel recupero dello storico take profit.")
@@ -770,52 +827,10 @@ async def ottieni_storico_take_profit():
 async def ottieni_analisi_profitto_storico():
     """
     Restituisce le percentuali di profitto/perdita (minima, media, massima) dalle operazioni di vendita.
+    Il calcolo avviene in SQL ed è in cache fino al salvataggio della prossima operazione.
     """
     try:
-        operazioni_dal_db = recupera_operazioni_db(limit=10000) # Recupera un numero sufficiente di operazioni
-        percentuali = []
-        for op in operazioni_dal_db:
-            # Assicurati che op sia un dizionario e che contenga le chiavi necessarie
-            if isinstance(op, dict) and op.get('tipo', '').startswith('vendita'):
-                profitto = op.get('profitto_perdita_operazione', 0)
-                controvalore = op.get('controvalore_usd', 0)
-                costo_operazione = controvalore - profitto
-                if costo_operazione > 0:
-                    percentuale = (profitto / costo_operazione) * 100
-                    percentuali.append(percentuale)
-
-        if not percentuali:
-            return {"min": 0.0, "avg": 0.0, "max": 0.0}
-
-        return {
-            "min": min(percentuali),
-            "avg": sum(percentuali) / len(percentuali),
-            "max": max(percentuali)
-        }
-    except Exception as e:
-        logging.error(f"Errore durante il recupero dell'analisi profitto storico: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Errore nel recupero dell'analisi profitto storico.")
-
-@app.get("/analisi_profitto_storico", tags=["Simulazione"])
-async def ottieni_analisi_profitto_storico():
-    """
-    Restituisce le percentuali di profitto/perdita (minima, media, massima) dalle operazioni di vendita.
-    """
-    try:
-        operazioni_dal_db = recupera_operazioni_db(limit=10000) # Recupera un numero sufficiente di operazioni
-        percentuali = []
-        for op in operazioni_dal_db:
-            if op.get('tipo', '').startswith('vendita') and op.get( 'percentuale_profitto_perdita') is not None:
-                percentuali.append(op['percentuale_profitto_perdita'])
-
-        if not percentuali:
-            return {"min": 0.0, "avg": 0.0, "max": 0.0}
-
-        return {
-            "min": min(percentuali),
-            "avg": sum(percentuali) / len(percentuali),
-            "max": max(percentuali)
-        }
+        return await db_async.analisi_profitto_storico_db()
     except Exception as e:
         logging.error(f"Errore durante il recupero dell'analisi profitto storico: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Errore nel recupero dell'analisi profitto storico.")
@@ -830,29 +845,43 @@ async def get_ohlcv_data(nome_piattaforma: str, coppia: str, timeframe: str, lim
         logging.info(f"Richiesta OHLCV per {coppia} ({timeframe}). Inizio ricerca nel DB.")
         start_time = time.time()
 
-        # Recupera i dati dal database
-        ohlcv_from_db = recupera_dati_ohlcv_da_db(
-            exchange=nome_piattaforma.lower(),
-            symbol=coppia.upper(),
-            timeframe=timeframe,
-            limit=limit
-        )
-        
-        db_time = time.time() - start_time
-        logging.info(f"Query DB completata in {db_time:.4f} secondi. Trovate {len(ohlcv_from_db)} righe.")
-
-        # Formatta i dati per essere consumabili dal frontend
         formatted_ohlcv = []
-        if ohlcv_from_db:
-            for row in ohlcv_from_db:
-                formatted_ohlcv.append({
-                    "time": row["timestamp"], # Il timestamp è già in secondi
-                    "open": row["open"],
-                    "high": row["high"],
-                    "low": row["low"],
-                    "close": row["close"],
-                    "volume": row["volume"],
-                })
+        motore = motore_archivio_ohlcv(carica_configurazione())
+        if motore in ('colonnare', 'entrambi'):
+            # Colonne NumPy lette dai file mappati in memoria: nessuna conversione riga per riga
+            colonne = await db_async.leggi_serie_colonnare(nome_piattaforma.lower(), coppia.upper(), timeframe, limit)
+            if colonne and len(colonne['timestamp']) > 0:
+                formatted_ohlcv = [
+                    {"time": t, "open": o, "high": h, "low": l, "close": c, "volume": v}
+                    for t, o, h, l, c, v in zip(*(colonne[nome].tolist() for nome in ('timestamp', 'open', 'high', 'low', 'close', 'volume')))
+                ]
+            logging.info(f"Lettura archivio colonnare completata in {time.time() - start_time:.4f} secondi. Trovate {len(formatted_ohlcv)} righe.")
+
+        # Con entrambi gli archivi attivi, SQLite copre le serie non ancora complete nell'archivio colonnare
+        if motore == 'sqlite' or (motore == 'entrambi' and len(formatted_ohlcv) < limit):
+            # Recupera i dati dal database
+            ohlcv_from_db = await db_async.recupera_dati_ohlcv_da_db(
+                exchange=nome_piattaforma.lower(),
+                symbol=coppia.upper(),
+                timeframe=timeframe,
+                limit=limit
+            )
+
+            db_time = time.time() - start_time
+            logging.info(f"Query DB completata in {db_time:.4f} secondi. Trovate {len(ohlcv_from_db)} righe.")
+
+            # Formatta i dati per essere consumabili dal frontend
+            if len(ohlcv_from_db) > len(formatted_ohlcv):
+                formatted_ohlcv = []
+                for row in ohlcv_from_db:
+                    formatted_ohlcv.append({
+                        "time": row["timestamp"], # Il timestamp è già in secondi
+                        "open": row["open"],
+                        "high": row["high"],
+                        "low": row["low"],
+                        "close": row["close"],
+                        "volume": row["volume"],
+                    })
         
         # Se non ci sono dati nel DB, la UI mostrerà un messaggio vuoto.
         # Il processo in background popolerà i dati al prossimo ciclo.
@@ -869,6 +898,67 @@ async def get_ohlcv_data(nome_piattaforma: str, coppia: str, timeframe: str, lim
             content={"detail": f"Errore nel recupero dati OHLCV dal database: {str(e)}"}
         )
  
+@app.get("/metriche/coalescenza", tags=["Piattaforme"])
+async def get_metriche_coalescenza_endpoint():
+    """
+    Restituisce, per ogni piattaforma, le richieste all'exchange risparmiate unendo letture identiche in corso.
+    """
+    return get_metriche_coalescenza()
+
+@app.get("/metriche/scheduler", tags=["Piattaforme"])
+async def get_metriche_scheduler_endpoint():
+    """
+    Restituisce, per ogni piattaforma, il budget di peso disponibile, le richieste in coda per priorità e i tempi di attesa.
+    """
+    return get_metriche_scheduler()
+
+@app.get("/metriche/prezzi_cache", tags=["Piattaforme"])
+async def get_metriche_prezzi_cache_endpoint():
+    """
+    Restituisce hit/miss della cache prezzi, la latenza dei rinnovi e l'età di ogni prezzo in cache.
+    """
+    return get_statistiche_prezzi_cache()
+
+@app.get("/metriche/segnali_cache", tags=["Intelligenza Artificiale"])
+async def get_metriche_segnali_cache_endpoint():
+    """
+    Restituisce hit/miss della cache dei segnali condivisa tra ciclo di trading, dashboard ed endpoint IA
+    e l'età dei segnali serviti.
+    """
+    return get_statistiche_segnali_cache()
+
+@app.get("/metriche/event_loop", tags=["Generale"])
+async def get_metriche_event_loop_endpoint():
+    """
+    Restituisce il ritardo del ciclo asyncio (quanto a lungo il codice sincrono lo ha bloccato)
+    e i tempi delle analisi eseguite nell'esecutore dedicato.
+    """
+    return get_metriche_event_loop()
+
+@app.post("/backfill", tags=["Dati di Mercato"])
+async def avvia_backfill_endpoint(richiesta: RichiestaBackfill):
+    """
+    Avvia in background lo scaricamento dello storico OHLCV per le coppie e i timeframe indicati.
+    Un backfill interrotto riprende dall'ultimo checkpoint salvato.
+    """
+    if richiesta.giorni <= 0:
+        raise HTTPException(status_code=400, detail="Il numero di giorni deve essere positivo.")
+    config_piattaforma = carica_configurazione()['piattaforme'].get(richiesta.piattaforma)
+    if not isinstance(config_piattaforma, dict) or not config_piattaforma.get('attiva'):
+        raise HTTPException(status_code=400, detail=f"Piattaforma '{richiesta.piattaforma}' non configurata o non attiva.")
+    if motore_archivio_ohlcv(carica_configurazione()) == 'colonnare':
+        # L'archivio colonnare è append-only: non può ricevere candele più vecchie di quelle già salvate
+        raise HTTPException(status_code=400, detail="Il backfill scrive solo su SQLite: non è disponibile con l'archivio OHLCV 'colonnare'. Usare 'sqlite' o 'entrambi'.")
+    avviate = avvia_backfill(richiesta.piattaforma, richiesta.simboli, richiesta.timeframes, richiesta.giorni)
+    return {"messaggio": f"Backfill avviato per {len(avviate)} serie.", "serie_avviate": [list(chiave) for chiave in avviate]}
+
+@app.get("/backfill/stato", tags=["Dati di Mercato"])
+async def get_stato_backfill():
+    """
+    Restituisce l'avanzamento dei backfill storici salvato nei checkpoint.
+    """
+    return await stato_backfill()
+ 
 from .core.gestore_configurazione import carica_configurazione
 
 @app.get("/config", tags=["Configurazione"])
@@ -889,11 +979,10 @@ async def save_config(config_data: ConfigModel):
     """
     Salva il contenuto del file config.json.
     """
-    # Importa CONFIG_PATH dal gestore centralizzato
-    from .core.path_manager import CONFIG_PATH
+    from .core.gestore_configurazione import salva_configurazione
     try:
-        with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
-            json.dump(config_data.dict(), f, indent=2)
+        # Scrittura atomica; la nuova configurazione è visibile subito a tutti i cicli
+        salva_configurazione(config_data.dict())
         return {"messaggio": "Configurazione salvata con successo!"}
     except ValidationError as e:
         print(f"Pydantic Validation Error: {e.errors()}") # Log the validation errors
@@ -910,7 +999,7 @@ async def get_blacklist_endpoint():
     Restituisce un elenco di tutte le coppie attualmente in blacklist.
     """
     try:
-        blacklist_details = get_blacklist_details()
+        blacklist_details = await db_async.get_blacklist_details()
         return blacklist_details
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nel recupero della blacklist: {str(e)}")
@@ -922,7 +1011,7 @@ async def remove_from_blacklist_endpoint(coppia: str = Path(..., title="La coppi
     """
     try:
         # La coppia arriva URL-encoded, es. BTC%2FUSDT. FastAPI la decodifica automaticamente.
-        success = remove_from_blacklist(coppia)
+        success = await db_async.remove_from_blacklist(coppia)
         if success:
             return {"messaggio": f"Coppia {coppia} rimossa con successo dalla blacklist."}
         else:
@@ -931,25 +1020,27 @@ async def remove_from_blacklist_endpoint(coppia: str = Path(..., title="La coppi
         raise HTTPException(status_code=500, detail=f"Errore durante la rimozione dalla blacklist: {str(e)}")
 
 @app.get("/eventi", tags=["Eventi"])
-async def get_eventi_endpoint(limit: int = 100):
+async def get_eventi_endpoint(limit: int = 100, before_id: Optional[int] = None, after_ts: Optional[datetime] = None, paginato: bool = False):
     """
     Restituisce una lista degli ultimi eventi di sistema registrati.
+    Con before_id/after_ts (o paginato=true) la risposta include next_cursor per la pagina successiva.
     """
     try:
-        eventi = recupera_eventi_db(limit=limit)
-        return eventi
+        eventi = await db_async.recupera_eventi_db(limit=limit, before_id=before_id, after_ts=after_ts)
+        return _risposta_paginata(eventi, limit, "id_evento", paginato or before_id is not None or after_ts is not None)
     except Exception as e:
         logging.error(f"Errore durante il recupero degli eventi dal DB: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Errore nel recupero degli eventi.")
 
 @app.get("/notifiche", tags=["Notifiche"])
-async def get_notifiche_endpoint(solo_non_lette: bool = False, limit: int = 20):
+async def get_notifiche_endpoint(solo_non_lette: bool = False, limit: int = 20, before_id: Optional[int] = None, after_ts: Optional[datetime] = None, paginato: bool = False):
     """
     Restituisce una lista delle ultime notifiche.
+    Con before_id/after_ts (o paginato=true) la risposta include next_cursor per la pagina successiva.
     """
     try:
-        notifiche = recupera_notifiche(solo_non_lette=solo_non_lette, limit=limit)
-        return notifiche
+        notifiche = await db_async.recupera_notifiche(solo_non_lette=solo_non_lette, limit=limit, before_id=before_id, after_ts=after_ts)
+        return _risposta_paginata(notifiche, limit, "id", paginato or before_id is not None or after_ts is not None)
     except Exception as e:
         logging.error(f"Errore durante il recupero delle notifiche: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Errore nel recupero delle notifiche.")
@@ -960,7 +1051,7 @@ async def segna_notifiche_lette_endpoint():
     Segna tutte le notifiche come lette.
     """
     try:
-        segna_notifiche_come_lette()
+        await db_async.segna_notifiche_come_lette()
         return {"messaggio": "Notifiche segnate come lette."}
     except Exception as e:
         logging.error(f"Errore durante l'aggiornamento delle notifiche: {e}", exc_info=True)
@@ -982,7 +1073,7 @@ async def ai_trading_loop():
             config = carica_configurazione()
             intervallo = config['impostazioni_generali']['intervallo_aggiornamento_secondi']
             piattaforme_config = config['piattaforme']
-            blacklist = get_blacklisted_pairs_set()  # Carica la blacklist all'inizio di ogni ciclo principale
+            blacklist = await db_async.get_blacklisted_pairs_set()  # Carica la blacklist all'inizio di ogni ciclo principale
             logging.info(f"Blacklist caricata con {len(blacklist)} coppie.")
 
             for nome_piattaforma, conf_piattaforma in piattaforme_config.items():
@@ -1042,7 +1133,8 @@ async def ai_trading_loop():
                     try:
                         # --- LOGICA TAKE PROFIT INTERNO ---
                         posizione_aperta = gestore_globale_portafoglio.portafoglio.posizioni_aperte.get(asset)
-                        prezzo_attuale = get_prezzo_cache(asset, quote_currency)
+                        # Il take profit decide su un prezzo entro il TTL soft, mai su uno scaduto
+                        prezzo_attuale = get_prezzo_cache(asset, quote_currency, nome_piattaforma, eta_massima=CACHE_VALIDITY_SECONDS)
                         segnale_forzato = None
                         
                         percentuale_take_profit = config.get('parametri_ia', {}).get('percentuale_take_profit')
@@ -1113,7 +1205,7 @@ async def ai_trading_loop():
                             valore_asset = 0
                             for asset_name, quantita in gestore_globale_portafoglio.portafoglio.asset.items():
                                 if quantita > 0:
-                                    asset_price = get_prezzo_cache(asset_name, quote_currency)
+                                    asset_price = get_prezzo_cache(asset_name, quote_currency, nome_piattaforma)
                                     if asset_price:
                                         valore_asset += quantita * asset_price
                             valore_totale_portafoglio = valore_liquidi + valore_asset
@@ -1178,7 +1270,7 @@ async def ai_trading_loop():
                                 asset_venduti_di_recente.append((coppia, time.time()))
                         else: # Segnale MANTIENI
                             dettagli_evento = f"Segnale MANTIENI per {coppia}. Prezzo: {prezzo:.4f}"
-                            salva_evento_db("SEGNALE_MANTIENI", piattaforma=nome_piattaforma, coppia=coppia, dettagli=dettagli_evento)
+                            await db_async.salva_evento_db("SEGNALE_MANTIENI", piattaforma=nome_piattaforma, coppia=coppia, dettagli=dettagli_evento)
 
                     except ccxt.InsufficientFunds as e:
                         logging.warning(f"AI: Fondi insufficienti per operazione su {coppia}.Dettagli: {e}")
@@ -1197,12 +1289,12 @@ async def ai_trading_loop():
                         error_str = str(e).lower()
                         if "-2010" in error_str or "not permitted" in error_str or "not supported" in error_str or "non è supportata" in error_str:
                             logging.warning(f"AI: La coppia {coppia} non è permessa su {nome_piattaforma}. AGGIUNGO ALLA BLACKLIST.")
-                            add_to_blacklist(coppia, motivo=str(e))
+                            await db_async.add_to_blacklist(coppia, motivo=str(e))
                             blacklist.add(coppia) # Aggiorna la blacklist in memoria per il ciclo corrente
                         else:
                             logging.error(f"AI: Errore di scambio non gestito per {coppia}: {e}")
                         dettagli_evento = f"Errore durante l'analisi di {coppia}: {str(e)}"
-                        salva_evento_db("ERRORE_ANALISI", piattaforma=nome_piattaforma, coppia=coppia, dettagli=dettagli_evento)
+                        await db_async.salva_evento_db("ERRORE_ANALISI", piattaforma=nome_piattaforma, coppia=coppia, dettagli=dettagli_evento)
 
                 #if piattaforma_ccxt: await piattaforma_ccxt.close()
 
@@ -1306,7 +1398,7 @@ async def annulla_ordine(nome_piattaforma: str, id_ordine: str, simbolo: str = N
         piattaforma_ccxt = get_platform_instance(nome_piattaforma.lower())
         await piattaforma_ccxt.cancel_order(id_ordine, simbolo)
         dettagli_evento = f"Annullato manualmente ordine ID: {id_ordine}"
-        salva_evento_db("ANNULLA_ORDINE_MANUALE", piattaforma=nome_piattaforma, coppia=simbolo, dettagli=dettagli_evento)
+        await db_async.salva_evento_db("ANNULLA_ORDINE_MANUALE", piattaforma=nome_piattaforma, coppia=simbolo, dettagli=dettagli_evento)
         return {"messaggio": f"Ordine {id_ordine} annullato con successo."}
     except ccxt.OrderNotFound:
         raise HTTPException(status_code=404, detail=f"Ordine {id_ordine} non trovato.")
@@ -16,7 +16,7 @@ class Portafoglio(BaseModel):
     budget_usd_iniziale: float
     budget_usd_corrente: float
     asset: Dict[str, float] = Field(default_factory=dict) # Es. {"BTC": 0.5, "ETH": 10}
-    storico_operazioni: List[Operazione] = Field(default_factory=list)
+    storico_operazioni: List[Operazione] = Field(default_factory=list) # Ultime operazioni, caricate dal DB alla prima richiesta
     posizioni_aperte: Dict[str, PosizioneAperta] = Field(default_factory=dict) # Nuovo campo per le posizioni aperte
     profitto_perdita_totale_usd: float = 0.0
 
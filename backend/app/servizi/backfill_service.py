@@ -0,0 +1,173 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+import asyncio
+import logging
+import time
+import ccxt.async_support as ccxt
+from ..core import database_async as db_async
+from .instance_manager import get_platform_instance
+from .scheduler_richieste import esegui_con_priorita, PRIORITA_BACKFILL
+
+# Candele richieste per ogni chiamata a fetch_ohlcv
+DIMENSIONE_PAGINA = 1000
+# Candele accumulate prima di scriverle (con il checkpoint) in un'unica transazione
+CANDELE_PER_TRANSAZIONE = 5000
+# Pagine consecutive senza dati dopo le quali si considera raggiunto l'inizio dello storico dell'exchange
+MAX_PAGINE_VUOTE = 3
+# Tentativi per pagina in caso di errori di rete o limiti di richieste, con attesa crescente
+MAX_TENTATIVI = 5
+ATTESA_INIZIALE_SECONDI = 2.0
+
+# Backfill in esecuzione in questo processo: (piattaforma, simbolo, timeframe) -> asyncio.Task
+backfill_attivi = {}
+
+
+async def _scarica_pagina(piattaforma, simbolo: str, timeframe: str, since_sec: int, limit: int) -> list:
+    """Scarica una pagina di candele, riprovando con attesa esponenziale su errori temporanei."""
+    attesa = ATTESA_INIZIALE_SECONDI
+    for tentativo in range(1, MAX_TENTATIVI + 1):
+        try:
+            return await piattaforma.fetch_ohlcv(simbolo, timeframe, since=since_sec * 1000, limit=limit)
+        except (ccxt.RateLimitExceeded, ccxt.DDoSProtection, ccxt.NetworkError) as e:
+            if tentativo == MAX_TENTATIVI:
+                raise
+            logging.warning(f"Backfill {simbolo} ({timeframe}): errore temporaneo '{e}'. Nuovo tentativo {tentativo + 1}/{MAX_TENTATIVI} tra {attesa:.0f}s.")
+            await asyncio.sleep(attesa)
+            attesa *= 2
+
+@esegui_con_priorita(PRIORITA_BACKFILL)
+async def esegui_backfill(nome_piattaforma: str, simbolo: str, timeframe: str, giorni: int,
+                          dimensione_pagina: int = DIMENSIONE_PAGINA, candele_per_transazione: int = CANDELE_PER_TRANSAZIONE) -> int:
+    """
+    Scarica lo storico di una serie andando a ritroso dalla candela più vecchia già salvata
+    fino a `giorni` giorni fa. L'avanzamento è salvato in backfill_checkpoint insieme alle candele,
+    quindi un backfill interrotto riprende dal punto raggiunto.
+    Restituisce il numero di candele nuove salvate.
+    """
+    simbolo = simbolo.upper()
+    obiettivo = int(time.time()) - giorni * 86400
+    checkpoint = await db_async.recupera_checkpoint_backfill_db(nome_piattaforma, simbolo, timeframe)
+    if checkpoint and checkpoint['stato'] == 'completato' and checkpoint['obiettivo_timestamp'] <= obiettivo:
+        logging.info(f"Backfill {simbolo} ({timeframe}) su {nome_piattaforma} già completato fino all'obiettivo richiesto.")
+        return 0
+
+    # Le candele vengono scaricate a ritroso a partire da `fine` (escluso)
+    if checkpoint and checkpoint['piu_vecchio_timestamp'] is not None:
+        fine = checkpoint['piu_vecchio_timestamp']
+        logging.info(f"Ripresa del backfill {simbolo} ({timeframe}) su {nome_piattaforma} dal checkpoint.")
+    else:
+        fine = await db_async.primo_timestamp_candele_db(nome_piattaforma, simbolo, timeframe) or int(time.time())
+
+    salvate = 0
+    buffer = []
+    try:
+        piattaforma = get_platform_instance(nome_piattaforma)
+        durata_candela = piattaforma.parse_timeframe(timeframe)
+        pagine_vuote = 0
+        while fine > obiettivo:
+            since = max(fine - dimensione_pagina * durata_candela, obiettivo)
+            dati = await _scarica_pagina(piattaforma, simbolo, timeframe, since, dimensione_pagina)
+            candele = [[c[0] // 1000, c[1], c[2], c[3], c[4], c[5]] for c in dati or [] if since <= c[0] // 1000 < fine]
+            if candele:
+                pagine_vuote = 0
+                buffer.extend(candele)
+                fine = min(c[0] for c in candele)
+            else:
+                pagine_vuote += 1
+                fine = since
+                if pagine_vuote >= MAX_PAGINE_VUOTE:
+                    logging.info(f"Backfill {simbolo} ({timeframe}): nessun dato più vecchio disponibile sull'exchange.")
+                    break
+
+            if len(buffer) >= candele_per_transazione:
+                salvate += await db_async.salva_blocco_backfill_db(nome_piattaforma, simbolo, timeframe, buffer, obiettivo, fine, 'in_corso')
+                logging.info(f"Backfill {simbolo} ({timeframe}) su {nome_piattaforma}: {salvate} candele salvate finora.")
+                buffer = []
+
+        salvate += await db_async.salva_blocco_backfill_db(nome_piattaforma, simbolo, timeframe, buffer, obiettivo, fine, 'completato')
+        logging.info(f"Backfill {simbolo} ({timeframe}) su {nome_piattaforma} completato: {salvate} candele nuove salvate.")
+        return salvate
+    except asyncio.CancelledError:
+        # Salva quanto già scaricato: il backfill riprenderà da qui
+        await db_async.salva_blocco_backfill_db(nome_piattaforma, simbolo, timeframe, buffer, obiettivo, fine, 'in_corso')
+        raise
+    except Exception as e:
+        logging.error(f"Errore durante il backfill di {simbolo} ({timeframe}) su {nome_piattaforma}: {e}", exc_info=True)
+        try:
+            await db_async.salva_blocco_backfill_db(nome_piattaforma, simbolo, timeframe, buffer, obiettivo, fine, 'errore', str(e))
+        except Exception:
+            pass
+        return salvate
+
+async def _esegui_sequenza(serie: list, giorni: int):
+    # Le serie vengono scaricate una alla volta per non saturare i limiti di richieste dell'exchange
+    for chiave in serie:
+        try:
+            await esegui_backfill(*chiave, giorni=giorni)
+        finally:
+            backfill_attivi.pop(chiave, None)
+
+def avvia_backfill(nome_piattaforma: str, simboli: list, timeframes: list, giorni: int) -> list:
+    """
+    Avvia in background il backfill delle combinazioni simbolo/timeframe non già in esecuzione.
+    Restituisce l'elenco delle serie avviate.
+    """
+    serie = [(nome_piattaforma, simbolo.upper(), timeframe) for simbolo in simboli for timeframe in timeframes]
+    serie = [chiave for chiave in serie if chiave not in backfill_attivi]
+    if serie:
+        task = asyncio.create_task(_esegui_sequenza(serie, giorni))
+        for chiave in serie:
+            backfill_attivi[chiave] = task
+    return serie
+
+async def ferma_backfill():
+    """
+    Cancella i backfill in esecuzione e ne attende la fine, così ognuno salva il proprio checkpoint.
+    Da chiamare allo shutdown prima di chiudere il database.
+    """
+    tasks = set(backfill_attivi.values())
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logging.info(f"Interrotti {len(tasks)} backfill in corso: riprenderanno dal checkpoint salvato.")
+
+async def stato_backfill() -> list:
+    """Restituisce i checkpoint salvati, indicando quali backfill sono in esecuzione in questo momento."""
+    stato = await db_async.recupera_stato_backfill_db()
+    for voce in stato:
+        voce['in_esecuzione'] = (voce['exchange'], voce['symbol'], voce['timeframe']) in backfill_attivi
+    return stato
+
+async def main(argomenti):
+    from ..core.database import create_tables
+    from ..core.archivio_colonnare import motore_archivio_ohlcv
+    from ..core.gestore_configurazione import carica_configurazione
+    if motore_archivio_ohlcv(carica_configurazione()) == 'colonnare':
+        logging.error("Il backfill scrive solo su SQLite e l'archivio OHLCV configurato è solo colonnare: backfill non eseguito.")
+        return
+    create_tables()
+    for simbolo in argomenti.simboli:
+        for timeframe in argomenti.timeframes:
+            await esegui_backfill(argomenti.piattaforma, simbolo, timeframe, argomenti.giorni)
+    from .instance_manager import close_all_instances
+    await close_all_instances()
+    await db_async.chiudi_database()
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import os
+    # Es.: python -m app.servizi.backfill_service binance --simboli BTC/USDC ETH/USDC --timeframes 1h 1d --giorni 365
+    parser = argparse.ArgumentParser(description="Scarica lo storico OHLCV nel database locale, riprendendo dai checkpoint.")
+    parser.add_argument("piattaforma", help="Nome della piattaforma configurata (es. binance)")
+    parser.add_argument("--simboli", nargs="+", required=True, help="Coppie da scaricare (es. BTC/USDC)")
+    parser.add_argument("--timeframes", nargs="+", default=["1h"], help="Timeframe da scaricare (es. 1h 4h 1d)")
+    parser.add_argument("--giorni", type=int, default=365, help="Profondità dello storico in giorni")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+import asyncio
+import functools
+import inspect
+import logging
+from .scheduler_richieste import SchedulerPiattaforma, priorita_richieste
+
+# Metodi di sola lettura per cui richieste identiche e contemporanee possono condividere una chiamata di rete.
+# Gli ordini (create_*, cancel_*) non vanno mai raggruppati, e nemmeno fetch_balance: un saldo letto subito
+# dopo un ordine non deve ricevere il risultato di una richiesta partita prima dell'ordine.
+METODI_COALESCIBILI = frozenset({
+    'fetch_ohlcv',
+    'fetch_ticker',
+    'fetch_tickers',
+    'fetch_order_book',
+    'fetch_trades',
+    'load_markets',
+})
+# Metodi asincroni che non effettuano richieste e non passano quindi dallo scheduler
+METODI_NON_PIANIFICATI = frozenset({'close', 'sleep', 'throttle'})
+
+
+def _chiave_hashable(valore):
+    """Converte argomenti annidati (liste, dizionari di params) in una forma utilizzabile come chiave."""
+    if isinstance(valore, dict):
+        return tuple(sorted((k, _chiave_hashable(v)) for k, v in valore.items()))
+    if isinstance(valore, (list, tuple, set)):
+        return tuple(_chiave_hashable(v) for v in valore)
+    return valore
+
+
+class PiattaformaCoalescente:
+    """
+    Proxy attorno a un'istanza ccxt condivisa che applica il single-flight alle letture:
+    se una richiesta identica (stesso metodo, stessi argomenti) è già in corso, il chiamante
+    attende quella invece di aprire una nuova chiamata di rete. Il risultato è condiviso
+    tra tutti i chiamanti e va trattato in sola lettura.
+    Ogni chiamata di rete passa dallo scheduler dell'exchange, che la ammette per peso e priorità.
+    Tutti gli altri attributi vengono inoltrati all'istanza originale.
+    """
+    def __init__(self, istanza):
+        object.__setattr__(self, '_istanza', istanza)
+        object.__setattr__(self, '_scheduler', SchedulerPiattaforma(istanza.id))
+        object.__setattr__(self, '_in_corso', {})
+        object.__setattr__(self, '_metriche', {'richieste_totali': 0, 'chiamate_di_rete': 0, 'chiamate_risparmiate': 0})
+
+    def __getattr__(self, nome):
+        attributo = getattr(self._istanza, nome)
+        if nome in METODI_COALESCIBILI:
+            return functools.partial(self._esegui_coalescente, nome, attributo)
+        if nome not in METODI_NON_PIANIFICATI and inspect.iscoroutinefunction(attributo):
+            return functools.partial(self._esegui_pianificato, nome, attributo)
+        return attributo
+
+    def __setattr__(self, nome, valore):
+        setattr(self._istanza, nome, valore)
+
+    async def _esegui_coalescente(self, nome: str, metodo, *args, **kwargs):
+        chiave = (nome, _chiave_hashable(args), _chiave_hashable(kwargs))
+        priorita = priorita_richieste.get()
+        self._metriche['richieste_totali'] += 1
+        in_corso = self._in_corso.get(chiave)
+        # La chiamata condivisa è pianificata con la priorità di chi l'ha avviata: un chiamante più urgente
+        # (valore minore) non si accoda a una richiesta di sottofondo ma ne avvia una propria
+        if in_corso is not None and in_corso[1] <= priorita:
+            task = in_corso[0]
+            self._metriche['chiamate_risparmiate'] += 1
+            logging.debug(f"Richiesta {nome}{args} su {self._istanza.id} unita a una identica già in corso.")
+        else:
+            self._metriche['chiamate_di_rete'] += 1
+            task = asyncio.ensure_future(self._esegui_pianificato(nome, metodo, *args, **kwargs))
+            # Le richieste successive si uniscono a quella con la priorità più alta
+            self._in_corso[chiave] = (task, priorita)
+            task.add_done_callback(functools.partial(self._rimuovi_in_corso, chiave))
+        # shield: se un chiamante viene cancellato, la chiamata condivisa prosegue per gli altri
+        return await asyncio.shield(task)
+
+    def _rimuovi_in_corso(self, chiave: tuple, task: asyncio.Future):
+        # Rimuove la voce solo se nel frattempo non è stata sostituita da una richiesta più urgente
+        in_corso = self._in_corso.get(chiave)
+        if in_corso is not None and in_corso[0] is task:
+            del self._in_corso[chiave]
+
+    async def _esegui_pianificato(self, nome: str, metodo, *args, **kwargs):
+        return await self._scheduler.esegui(nome, lambda: metodo(*args, **kwargs))
+
+    def metriche_scheduler(self) -> dict:
+        return self._scheduler.metriche()
+
+    def metriche_coalescenza(self) -> dict:
+        totali = self._metriche['richieste_totali']
+        return {
+            **self._metriche,
+            'richieste_in_corso': len(self._in_corso),
+            'percentuale_risparmiata': round(self._metriche['chiamate_risparmiate'] / totali * 100, 2) if totali else 0.0,
+        }
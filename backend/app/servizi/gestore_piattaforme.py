@@ -3,7 +3,7 @@
 
 import ccxt.async_support as ccxt
 from ccxt.base.errors import NotSupported
-from ..core.gestore_configurazione import carica_configurazione
+from ..core.gestore_configurazione import carica_configurazione, copia_modificabile
 import logging
 import traceback
 
@@ -48,15 +48,15 @@ def inizializza_piattaforma(nome_piattaforma: str):
     # Aggiungi il blocco 'options' direttamente dalla configurazione dell'utente.
     if 'options' in config_piattaforma:
         # Filtra i mercati per includere solo quelli attivati (impostati su True)
-        user_options = config_piattaforma['options'].copy()
+        user_options = copia_modificabile(config_piattaforma['options'])
         if 'markets' in user_options:
             user_options['markets'] = {market: enabled for market, enabled in user_options['markets'].items() if enabled}
         ccxt_config['options'] = user_options
 
     piattaforma = piattaforma_classe(ccxt_config)
-    # Aggiungi la piattaforma alla lista delle connessioni aperte
+    # Aggiungi la piattaforma all'insieme delle connessioni aperte (riferimento debole)
     from ..core.app_state import open_connections
-    open_connections.append(piattaforma)
+    open_connections.add(piattaforma)
     return piattaforma
 
 async def recupera_ordini_aperti(nome_piattaforma: str, simbolo: str = None):
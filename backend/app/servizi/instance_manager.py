@@ -3,6 +3,7 @@
 
 import ccxt.async_support as ccxt
 import logging
+from .coalescenza_richieste import PiattaformaCoalescente
 
 # Dizionario globale per mantenere le istanze delle piattaforme condivise
 _platform_instances = {}
@@ -12,7 +13,7 @@ def get_platform_instance(nome_piattaforma: str):
     Restituisce un'istanza condivisa della piattaforma, creandola se non esiste.
     Questo previene la creazione di centinaia di connessioni e risolve i memory leak.
     """
-    from ..core.gestore_configurazione import carica_configurazione
+    from ..core.gestore_configurazione import carica_configurazione, copia_modificabile
 
     if nome_piattaforma not in _platform_instances:
         logging.info(f"Creazione di una nuova istanza CONDIVISA per la piattaforma: {nome_piattaforma}")
@@ -28,17 +29,27 @@ def get_platform_instance(nome_piattaforma: str):
         }
 
         if 'options' in config_piattaforma:
-            user_options = config_piattaforma['options'].copy()
+            # ccxt modifica le proprie opzioni: gli si passa una copia, non l'istantanea condivisa della configurazione
+            user_options = copia_modificabile(config_piattaforma['options'])
             if 'markets' in user_options:
                 # Assicura che vengano passati solo i mercati attivati
                 user_options['markets'] = {market: enabled for market, enabled in user_options['markets'].items() if enabled}
             ccxt_config['options'] = user_options
 
         piattaforma_classe = getattr(ccxt, nome_piattaforma)
-        _platform_instances[nome_piattaforma] = piattaforma_classe(ccxt_config)
+        # Le letture identiche e contemporanee (es. fetch_ohlcv della stessa coppia) condividono una chiamata
+        _platform_instances[nome_piattaforma] = PiattaformaCoalescente(piattaforma_classe(ccxt_config))
     
     return _platform_instances[nome_piattaforma]
 
+def get_metriche_coalescenza() -> dict:
+    """Restituisce, per ogni istanza condivisa, quante richieste sono state servite da una chiamata già in corso."""
+    return {nome: istanza.metriche_coalescenza() for nome, istanza in _platform_instances.items()}
+
+def get_metriche_scheduler() -> dict:
+    """Restituisce, per ogni istanza condivisa, profondità delle code e tempi di attesa per priorità."""
+    return {nome: istanza.metriche_scheduler() for nome, istanza in _platform_instances.items()}
+
 async def close_all_instances():
     """
     Chiude tutte le istanze di piattaforma condivise aperte.
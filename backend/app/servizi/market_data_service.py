@@ -1,38 +1,92 @@
 import asyncio
 import logging
-import sqlite3
-from ..core.database import get_db_connection
-from .gestore_piattaforme import inizializza_piattaforma
+import numpy as np
+from ..core import database_async as db_async
+from ..core.archivio_colonnare import motore_archivio_ohlcv, COLONNE_OHLCV
+from ..core.esecutore_analisi import esegui_analisi
+from ..core.gestore_configurazione import carica_configurazione
+from ..core.indicatori_tecnici import CANDELE_FINESTRA_INDICATORI, calcola_indicatori_per_candela, firma_parametri_indicatori
+from .instance_manager import get_platform_instance
+from .scheduler_richieste import esegui_con_priorita, PRIORITA_SCANSIONE
 
+async def ultimo_timestamp_salvato(nome_piattaforma: str, simbolo: str, timeframe: str, motore: str):
+    """
+    Restituisce il timestamp (in secondi) dell'ultima candela salvata negli archivi attivi.
+    Con entrambi gli archivi attivi si usa il più vecchio dei due, così nessuno resta indietro.
+    """
+    ultimi = []
+    if motore in ('sqlite', 'entrambi'):
+        ultimi.append(await db_async.ultimo_timestamp_candele_db(nome_piattaforma, simbolo, timeframe))
+    if motore in ('colonnare', 'entrambi'):
+        ultimi.append(await db_async.ultimo_timestamp_colonnare(nome_piattaforma, simbolo, timeframe))
+    if any(ultimo is None for ultimo in ultimi):
+        return None
+    return min(ultimi)
+
+# Candele per cui ricalcolare gli indicatori quando la serie è nuova o i parametri sono cambiati
+CANDELE_RICALCOLO_INDICATORI = 200
+
+def indicatori_precalcolati_attivi(config: dict) -> bool:
+    return (config.get('indicatori_precalcolati') or {}).get('attivo', True)
+
+async def candele_recenti_salvate(nome_piattaforma: str, simbolo: str, timeframe: str, motore: str, limit: int):
+    """Restituisce le ultime `limit` candele salvate, dall'archivio SQLite se attivo, altrimenti da quello colonnare."""
+    if motore in ('sqlite', 'entrambi'):
+        # Tuple semplici invece di sqlite3.Row: il calcolo può essere eseguito in un altro processo
+        return [tuple(riga) for riga in await db_async.recupera_dati_ohlcv_da_db(nome_piattaforma, simbolo, timeframe, limit)]
+    colonne = await db_async.leggi_serie_colonnare(nome_piattaforma, simbolo, timeframe, limit)
+    if not colonne:
+        return []
+    return np.column_stack([colonne[colonna].astype(np.float64) for colonna, _ in COLONNE_OHLCV])
+
+async def aggiorna_indicatori_precalcolati(nome_piattaforma: str, simbolo: str, timeframe: str, motore: str, nuove_candele: list):
+    """
+    Aggiorna gli indicatori precalcolati della serie dopo il salvataggio di nuove candele.
+    Se gli indicatori salvati arrivano fino alla prima candela ricevuta si calcolano solo le candele ricevute;
+    altrimenti (serie nuova, buco o parametri cambiati) si ricalcolano le ultime CANDELE_RICALCOLO_INDICATORI.
+    """
+    params = carica_configurazione()['parametri_indicatori']
+    firma = firma_parametri_indicatori(params)
+    ultimo_calcolato = await db_async.ultimo_timestamp_indicatori_db(nome_piattaforma, simbolo, timeframe, firma)
+    if ultimo_calcolato is not None and ultimo_calcolato >= nuove_candele[0][0]:
+        da_calcolare = len(nuove_candele)
+    else:
+        da_calcolare = CANDELE_RICALCOLO_INDICATORI
+    candele = await candele_recenti_salvate(nome_piattaforma, simbolo, timeframe, motore, da_calcolare + CANDELE_FINESTRA_INDICATORI - 1)
+    if len(candele) == 0:
+        return
+    righe = await esegui_analisi(calcola_indicatori_per_candela, candele, params, da_calcolare)
+    salvate = await db_async.salva_indicatori_candele_db(nome_piattaforma, simbolo, timeframe, firma, righe)
+    logging.debug(f"Aggiornati gli indicatori precalcolati di {salvate} candele per {simbolo} su {nome_piattaforma} ({timeframe}).")
+
+@esegui_con_priorita(PRIORITA_SCANSIONE)
 async def aggiorna_e_salva_dati_ohlcv(nome_piattaforma: str, simbolo: str, timeframe: str, limit: int = 100):
     """
     Recupera i dati OHLCV da una piattaforma e li salva nel database.
+    Se la serie è già presente scarica solo le candele a partire dall'ultima salvata (inclusa,
+    perché potrebbe essere ancora aperta); per una serie nuova scarica le ultime `limit` candele.
     """
-    piattaforma = None
-    conn = None
     try:
         logging.info(f"Inizio aggiornamento OHLCV per {simbolo} su {nome_piattaforma} ({timeframe})...")
+        config = carica_configurazione()
+        motore = motore_archivio_ohlcv(config)
+        ultimo_timestamp = await ultimo_timestamp_salvato(nome_piattaforma, simbolo.upper(), timeframe, motore)
         
-        # 1. Inizializza la piattaforma
-        piattaforma = inizializza_piattaforma(nome_piattaforma)
+        # 1. Usa l'istanza condivisa della piattaforma (mercati già caricati, connessioni riutilizzate)
+        piattaforma = get_platform_instance(nome_piattaforma)
         
         # 2. Recupera i dati OHLCV
         # ccxt restituisce una lista di liste: [timestamp, open, high, low, close, volume]
-        ohlcv_data = await piattaforma.fetch_ohlcv(simbolo.upper(), timeframe, limit=limit)
+        if ultimo_timestamp is not None:
+            ohlcv_data = await piattaforma.fetch_ohlcv(simbolo.upper(), timeframe, since=ultimo_timestamp * 1000, limit=limit)
+        else:
+            ohlcv_data = await piattaforma.fetch_ohlcv(simbolo.upper(), timeframe, limit=limit)
         
         if not ohlcv_data:
             logging.warning(f"Nessun dato OHLCV ricevuto per {simbolo} su {nome_piattaforma}.")
             return
 
-        # 3. Connessione al database
-        conn = get_db_connection()
-        if not conn:
-            logging.error("Impossibile connettersi al database per salvare i dati OHLCV.")
-            return
-            
-        cursor = conn.cursor()
-        
-        # 4. Prepara i dati per l'inserimento
+        # 3. Prepara i dati per l'inserimento
         dati_da_inserire = []
         for candela in ohlcv_data:
             # Converte il timestamp da millisecondi a secondi
@@ -49,26 +103,25 @@ async def aggiorna_e_salva_dati_ohlcv(nome_piattaforma: str, simbolo: str, timef
                 candela[5]  # volume
             ))
             
-        # 5. Inserisci i dati nel database
-        # L'uso di INSERT OR IGNORE previene l'inserimento di duplicati 
-        # basandosi sul vincolo UNIQUE(exchange, symbol, timeframe, timestamp) definito nella tabella.
-        cursor.executemany("""
-            INSERT OR IGNORE INTO candlesticks (exchange, symbol, timeframe, timestamp, open, high, low, close, volume)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, dati_da_inserire)
-        
-        conn.commit()
-        
-        logging.info(f"Salvati {cursor.rowcount} nuovi punti dati OHLCV per {simbolo} su {nome_piattaforma}.")
+        # 4. Salva i dati negli archivi configurati, in thread dedicati senza bloccare l'event loop.
+        # Le candele già presenti vengono sovrascritte: l'ultima salvata era probabilmente ancora aperta.
+        if motore in ('sqlite', 'entrambi'):
+            nuove_righe = await db_async.salva_candele_db(dati_da_inserire, sovrascrivi=True)
+            logging.info(f"Salvati {nuove_righe} punti dati OHLCV per {simbolo} su {nome_piattaforma}.")
+        if motore in ('colonnare', 'entrambi'):
+            nuove_righe = await db_async.aggiungi_candele_colonnari(
+                nome_piattaforma, simbolo.upper(), timeframe, [riga[3:] for riga in dati_da_inserire]
+            )
+            logging.info(f"Aggiunti {nuove_righe} nuovi punti dati OHLCV all'archivio colonnare per {simbolo} su {nome_piattaforma}.")
+
+        # 5. Aggiorna gli indicatori precalcolati letti da indicatori_candele_chiuse
+        if indicatori_precalcolati_attivi(config):
+            await aggiorna_indicatori_precalcolati(
+                nome_piattaforma, simbolo.upper(), timeframe, motore, [riga[3:] for riga in dati_da_inserire]
+            )
 
     except Exception as e:
         logging.error(f"Errore durante l'aggiornamento dei dati OHLCV per {simbolo}: {e}", exc_info=True)
-    finally:
-        # 6. Chiudi le connessioni
-        if conn:
-            conn.close()
-        if piattaforma:
-            await piattaforma.close()
 
 async def main():
     """
@@ -98,6 +151,8 @@ async def main():
                 await aggiorna_e_salva_dati_ohlcv(piattaforma, coppia, timeframe, 200)
     
     logging.info("Aggiornamento sequenziale dei dati di mercato completato.")
+    from .instance_manager import close_all_instances
+    await close_all_instances()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,191 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+import ccxt.async_support as ccxt
+
+# Priorità delle richieste verso gli exchange: valore più basso = servita prima
+PRIORITA_ORDINI = 0
+PRIORITA_TRADING = 1
+PRIORITA_DASHBOARD = 2
+PRIORITA_SCANSIONE = 3
+PRIORITA_BACKFILL = 4
+NOMI_PRIORITA = {
+    PRIORITA_ORDINI: 'ordini',
+    PRIORITA_TRADING: 'trading',
+    PRIORITA_DASHBOARD: 'dashboard',
+    PRIORITA_SCANSIONE: 'scansione',
+    PRIORITA_BACKFILL: 'backfill',
+}
+
+# Peso consumato da ogni metodo, modellato sui pesi delle API spot di Binance.
+# I metodi non elencati pesano 1.
+PESI_METODI = {
+    'fetch_ohlcv': 2, 'fetchOHLCV': 2,
+    'fetch_ticker': 2, 'fetchTicker': 2,
+    'fetch_tickers': 80, 'fetchTickers': 80,
+    'fetch_order_book': 5, 'fetchOrderBook': 5,
+    'fetch_trades': 25, 'fetchTrades': 25,
+    'fetch_balance': 20, 'fetchBalance': 20,
+    'load_markets': 20,
+    'fetch_open_orders': 6, 'fetchOpenOrders': 6,
+    'fetch_order': 4, 'fetchOrder': 4,
+}
+# Budget di peso al minuto per exchange, con margine rispetto al limite ufficiale (Binance: 6000)
+PESO_AL_MINUTO = {'binance': 4800}
+PESO_AL_MINUTO_PREDEFINITO = 1200
+# Richieste contemporaneamente in volo per exchange
+CONCORRENZA_MASSIMA = 10
+
+# Priorità delle richieste avviate nel contesto corrente (ereditata dai task creati al suo interno)
+priorita_richieste = contextvars.ContextVar('priorita_richieste', default=PRIORITA_TRADING)
+
+
+@contextmanager
+def con_priorita(priorita: int):
+    """Assegna la priorità indicata alle richieste agli exchange eseguite all'interno del blocco."""
+    token = priorita_richieste.set(priorita)
+    try:
+        yield
+    finally:
+        priorita_richieste.reset(token)
+
+def esegui_con_priorita(priorita: int):
+    """Decoratore per funzioni asincrone: tutte le richieste che eseguono usano la priorità indicata."""
+    def decoratore(funzione):
+        @functools.wraps(funzione)
+        async def wrapper(*args, **kwargs):
+            with con_priorita(priorita):
+                return await funzione(*args, **kwargs)
+        return wrapper
+    return decoratore
+
+def _e_metodo_ordine(nome: str) -> bool:
+    return nome.startswith(('create', 'cancel', 'edit'))
+
+
+class SchedulerPiattaforma:
+    """
+    Ammette le richieste verso un exchange in base al peso e alla priorità.
+    Il budget di peso si ricarica in modo continuo (token bucket) fino a peso_al_minuto;
+    una richiesta parte solo se c'è peso sufficiente e un posto libero tra quelle in volo.
+    Le richieste in attesa vengono servite per priorità e, a parità, in ordine di arrivo:
+    gli ordini passano davanti all'analisi, che passa davanti a dashboard, scansioni e backfill.
+    """
+    def __init__(self, nome: str, peso_al_minuto: int = None, concorrenza_massima: int = CONCORRENZA_MASSIMA):
+        self.nome = nome
+        self.capacita = float(peso_al_minuto or PESO_AL_MINUTO.get(nome, PESO_AL_MINUTO_PREDEFINITO))
+        self.ricarica_al_secondo = self.capacita / 60.0
+        self.concorrenza_massima = concorrenza_massima
+        self.peso_disponibile = self.capacita
+        self.in_volo = 0
+        self.limiti_superati = 0
+        self._ultima_ricarica = time.monotonic()
+        self._coda = []
+        self._sequenza = itertools.count()
+        self._timer = None
+        self._statistiche = {priorita: {'ammesse': 0, 'attesa_totale_ms': 0.0, 'attesa_massima_ms': 0.0} for priorita in NOMI_PRIORITA}
+
+    def _ricarica(self):
+        adesso = time.monotonic()
+        self.peso_disponibile = min(self.capacita, self.peso_disponibile + (adesso - self._ultima_ricarica) * self.ricarica_al_secondo)
+        self._ultima_ricarica = adesso
+
+    def _puo_ammettere(self, peso: float) -> bool:
+        # Una richiesta più pesante dell'intero budget aspetta solo che il budget sia pieno
+        return self.in_volo < self.concorrenza_massima and self.peso_disponibile >= min(peso, self.capacita)
+
+    def _ammetti(self, peso: float):
+        self.peso_disponibile -= peso
+        self.in_volo += 1
+
+    def _rilascia(self):
+        self.in_volo -= 1
+        self._sveglia()
+
+    def _sveglia(self):
+        self._ricarica()
+        while self._coda:
+            _, _, peso, future = self._coda[0]
+            if future.done():
+                # Chiamante cancellato mentre era in coda
+                heapq.heappop(self._coda)
+                continue
+            if not self._puo_ammettere(peso):
+                break
+            heapq.heappop(self._coda)
+            self._ammetti(peso)
+            future.set_result(True)
+        if self._coda and self._timer is None and self.in_volo < self.concorrenza_massima:
+            # Manca solo peso: riprova quando il budget si sarà ricaricato abbastanza
+            peso_mancante = min(self._coda[0][2], self.capacita) - self.peso_disponibile
+            self._timer = asyncio.get_running_loop().call_later(max(peso_mancante / self.ricarica_al_secondo, 0.01), self._scadenza_timer)
+
+    def _scadenza_timer(self):
+        self._timer = None
+        self._sveglia()
+
+    async def esegui(self, nome_metodo: str, fabbrica_coroutine):
+        """Attende il turno della richiesta, poi esegue la coroutine creata da fabbrica_coroutine."""
+        priorita = PRIORITA_ORDINI if _e_metodo_ordine(nome_metodo) else priorita_richieste.get()
+        peso = PESI_METODI.get(nome_metodo, 1)
+        inizio = time.monotonic()
+        self._ricarica()
+        if not self._coda and self._puo_ammettere(peso):
+            self._ammetti(peso)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._coda, (priorita, next(self._sequenza), peso, future))
+            self._sveglia()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Ammessa un attimo prima della cancellazione: libera il posto
+                    self._rilascia()
+                raise
+
+        attesa_ms = (time.monotonic() - inizio) * 1000
+        statistiche = self._statistiche[priorita]
+        statistiche['ammesse'] += 1
+        statistiche['attesa_totale_ms'] += attesa_ms
+        statistiche['attesa_massima_ms'] = max(statistiche['attesa_massima_ms'], attesa_ms)
+        try:
+            return await fabbrica_coroutine()
+        except (ccxt.RateLimitExceeded, ccxt.DDoSProtection):
+            # L'exchange ha rifiutato per eccesso di richieste: azzera il budget per rallentare tutte le code
+            self.limiti_superati += 1
+            self.peso_disponibile = 0.0
+            logging.warning(f"Limite di richieste superato su {self.nome}: budget azzerato, le richieste in coda rallentano.")
+            raise
+        finally:
+            self._rilascia()
+
+    def metriche(self) -> dict:
+        self._ricarica()
+        in_coda = {nome: 0 for nome in NOMI_PRIORITA.values()}
+        for priorita, _, _, future in self._coda:
+            if not future.done():
+                in_coda[NOMI_PRIORITA[priorita]] += 1
+        return {
+            'peso_disponibile': round(self.peso_disponibile, 1),
+            'peso_al_minuto': self.capacita,
+            'in_volo': self.in_volo,
+            'limiti_superati': self.limiti_superati,
+            'priorita': {
+                NOMI_PRIORITA[priorita]: {
+                    'in_coda': in_coda[NOMI_PRIORITA[priorita]],
+                    'ammesse': statistiche['ammesse'],
+                    'attesa_media_ms': round(statistiche['attesa_totale_ms'] / statistiche['ammesse'], 1) if statistiche['ammesse'] else 0.0,
+                    'attesa_massima_ms': round(statistiche['attesa_massima_ms'], 1),
+                }
+                for priorita, statistiche in self._statistiche.items()
+            },
+        }
@@ -0,0 +1,119 @@
+# Autore: Pascarella Pasquale Gerardo
+# Versione: 1.0.0
+
+# Verifica che i kernel NumPy (indicatori_tecnici) e il motore incrementale (indicatori_incrementali)
+# restituiscano gli stessi valori delle funzioni pandas di riferimento, NaN iniziali compresi.
+# Uso: python test_parita_indicatori.py (dalla cartella backend)
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.indicatori_tecnici import (
+    calcola_sma, calcola_rsi, calcola_macd, calcola_bollinger_bands, calcola_adx,
+    calcola_sma_array, calcola_rsi_array, calcola_macd_array, calcola_bollinger_bands_array, calcola_adx_array,
+)
+from app.core.indicatori_incrementali import MotoreIndicatori
+
+PARAMETRI = {
+    'sma_periodo': 20, 'rsi_periodo': 14, 'macd_periodo_veloce': 12, 'macd_periodo_lento': 26,
+    'macd_periodo_segnale': 9, 'bollinger_periodo': 20, 'bollinger_deviazioni_std': 2, 'adx_periodo': 14,
+}
+# Tolleranza relativa al livello dei prezzi: pandas lascia residui dell'ordine di 1e-8 sulle finestre costanti
+TOLLERANZA = 1e-6
+
+
+def genera_serie(seme: int, candele: int) -> pd.DataFrame:
+    """Random walk con un tratto piatto e alcune candele a range nullo, per esercitare i casi limite."""
+    rng = np.random.default_rng(seme)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, candele)))
+    high = close * (1 + np.abs(rng.normal(0, 0.005, candele)))
+    low = close * (1 - np.abs(rng.normal(0, 0.005, candele)))
+    if candele > 60:
+        close[30:55] = high[30:55] = low[30:55] = close[29]
+    return pd.DataFrame({'timestamp': np.arange(candele) * 60, 'open': close, 'high': high, 'low': low, 'close': close, 'volume': 1.0})
+
+def confronta(atteso, ottenuto):
+    """Restituisce la descrizione della differenza tra le due serie, o None se coincidono."""
+    atteso = np.asarray(atteso, dtype=np.float64)
+    ottenuto = np.asarray(ottenuto, dtype=np.float64)
+    if not np.array_equal(np.isnan(atteso), np.isnan(ottenuto)):
+        return "posizioni dei NaN diverse"
+    validi = ~np.isnan(atteso)
+    errore = np.max(np.abs(atteso[validi] - ottenuto[validi]) / np.maximum(np.abs(atteso[validi]), 1.0), initial=0.0)
+    if errore > TOLLERANZA:
+        return f"scostamento relativo massimo {errore:.2e}"
+    return None
+
+def riferimenti_pandas(df: pd.DataFrame) -> dict:
+    macd_line, signal_line, histogram = calcola_macd(df, 12, 26, 9)
+    superiore, media, inferiore = calcola_bollinger_bands(df, 20, 2)
+    adx, plus_di, minus_di = calcola_adx(df, 14)
+    return {
+        'sma': calcola_sma(df, 20), 'rsi': calcola_rsi(df, 14),
+        'macd_line': macd_line, 'signal_line': signal_line, 'macd_histogram': histogram,
+        'bollinger_superiore': superiore, 'bollinger_media': media, 'bollinger_inferiore': inferiore,
+        'adx': adx, 'plus_di': plus_di, 'minus_di': minus_di,
+    }
+
+def kernel_numpy(df: pd.DataFrame) -> dict:
+    close, high, low = df['close'].to_numpy(), df['high'].to_numpy(), df['low'].to_numpy()
+    macd_line, signal_line, histogram = calcola_macd_array(close, 12, 26, 9)
+    superiore, media, inferiore = calcola_bollinger_bands_array(close, 20, 2)
+    adx, plus_di, minus_di = calcola_adx_array(high, low, close, 14)
+    return {
+        'sma': calcola_sma_array(close, 20), 'rsi': calcola_rsi_array(close, 14),
+        'macd_line': macd_line, 'signal_line': signal_line, 'macd_histogram': histogram,
+        'bollinger_superiore': superiore, 'bollinger_media': media, 'bollinger_inferiore': inferiore,
+        'adx': adx, 'plus_di': plus_di, 'minus_di': minus_di,
+    }
+
+def motore_incrementale(df: pd.DataFrame) -> dict:
+    motore = MotoreIndicatori(PARAMETRI)
+    valori = {}
+    for candela in df.itertuples(index=False):
+        candela = list(candela)
+        # Prima una versione provvisoria della candela, poi quella definitiva: verifica anche le revisioni
+        motore.aggiorna(candela[:2] + [(candela[2] + candela[3]) / 2, candela[3], (candela[2] + candela[3]) / 2, 1.0])
+        for chiave, valore in motore.aggiorna(candela).items():
+            valori.setdefault(chiave, []).append(valore)
+    return valori
+
+def test_parita():
+    for seme, candele in ((1, 100), (2, 500), (3, 30), (4, 15)):
+        df = genera_serie(seme, candele)
+        attesi = riferimenti_pandas(df)
+        for nome_calcolo, calcolo in (("NumPy", kernel_numpy), ("incrementale", motore_incrementale)):
+            ottenuti = calcolo(df)
+            for nome, atteso in attesi.items():
+                differenza = confronta(atteso, ottenuti[nome])
+                assert differenza is None, f"Serie {seme} ({candele} candele), {nome_calcolo}/{nome}: {differenza}"
+            print(f"Serie {seme} ({candele} candele), {nome_calcolo}: OK")
+
+def misura_tempi(ripetizioni: int = 200):
+    df = genera_serie(5, 100)
+    inizio = time.perf_counter()
+    for _ in range(ripetizioni):
+        riferimenti_pandas(df)
+    tempo_pandas = (time.perf_counter() - inizio) / ripetizioni * 1000
+    inizio = time.perf_counter()
+    for _ in range(ripetizioni):
+        kernel_numpy(df)
+    tempo_numpy = (time.perf_counter() - inizio) / ripetizioni * 1000
+    print(f"Tutti gli indicatori su 100 candele: pandas {tempo_pandas:.2f} ms, NumPy {tempo_numpy:.2f} ms")
+
+
+if __name__ == "__main__":
+    try:
+        test_parita()
+        esito = True
+    except AssertionError as e:
+        print(f"ERRORE {e}")
+        esito = False
+    misura_tempi()
+    sys.exit(0 if esito else 1)